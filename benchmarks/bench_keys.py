@@ -0,0 +1,75 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Measures the time it takes to register keys on startup, decrypting standard scrypt keystores
+# one by one, in parallel on all cores, and with their decrypted keys already kept by `plunger-agent`.
+#
+# Usage: python -m benchmarks.bench_keys [key_count ...]
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+from plunger.agent import KeyAgent, KeyAgentClient
+from plunger.keys import register_keys
+
+
+def create_keystores(directory: str, count: int) -> list:
+    keys = []
+    for index in range(count):
+        key_file = os.path.join(directory, f"key{index}.json")
+        pass_file = os.path.join(directory, f"key{index}.pass")
+        with open(key_file, 'w') as key_file_open:
+            key_file_open.write(Web3.toJSON(Account.encrypt(os.urandom(32), "password")))
+        with open(pass_file, 'w') as pass_file_open:
+            pass_file_open.write("password")
+        keys.append(f"key_file={key_file},pass_file={pass_file}")
+    return keys
+
+
+def measure(keys: list, cache, workers: int = None) -> float:
+    started = time.perf_counter()
+    register_keys(Web3(), keys, cache, workers)
+    return time.perf_counter() - started
+
+
+def main(args: list):
+    counts = list(map(int, args)) if len(args) > 0 else [1, 20]
+    with tempfile.TemporaryDirectory() as directory:
+        agent = KeyAgent(os.path.join(directory, "agent.sock"))
+        threading.Thread(target=agent.serve_forever, daemon=True).start()
+
+        for count in counts:
+            os.makedirs(os.path.join(directory, str(count)))
+            keys = create_keystores(os.path.join(directory, str(count)), count)
+            sequential = measure(keys, None, workers=1)
+            parallel = measure(keys, None)
+            measure(keys, KeyAgentClient(agent.socket_path))
+            warm = measure(keys, KeyAgentClient(agent.socket_path))
+            print(f"{count:>3} key(s): {sequential:.3f}s decrypting one by one, {parallel:.3f}s on {os.cpu_count()} core(s),"
+                  f" {warm:.3f}s with the keys kept by the agent")
+
+        agent.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
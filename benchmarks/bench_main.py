@@ -0,0 +1,136 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Measures whole `--list`, `--override-with-zero-txs` and `--wait` runs against `benchmarks.node.BenchNode`:
+# the time `Plunger.main` takes, the JSON-RPC calls, HTTP requests and bytes it exchanges with the node,
+# and the peak RSS of the process. Each run happens in a fresh interpreter, so imports and peak RSS are
+# those of a real run. With `--json` the results are printed as JSON, with `--baseline` they are compared
+# with earlier JSON results and the exit code is non-zero if any of them got worse by more than `--tolerance`.
+#
+# Usage: python -m benchmarks.bench_main [--pool-size N] [--pending N] [--latency SECONDS] [--block-time SECONDS]
+#                                        [--scenario list,override,wait] [--source SOURCE] [--wait-mode MODE]
+#                                        [--json] [--baseline FILE] [--tolerance FRACTION]
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.node import BenchNode, OUR_ADDRESS
+
+SCENARIOS = {'list': "--list", 'override': "--override-with-zero-txs", 'wait': "--wait"}
+COMPARED = ['seconds', 'rpc_calls', 'http_requests', 'request_bytes', 'response_bytes', 'peak_rss_bytes']
+
+
+def run(args: list):
+    # Runs in the child process, `Plunger` is only imported here so that its import time gets measured
+    started = time.perf_counter()
+    from plunger.plunger import Plunger
+    imported = time.perf_counter()
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    exit_code = 0
+    try:
+        Plunger(args).main()
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    finally:
+        sys.stdout = stdout
+
+    finished = time.perf_counter()
+    print(json.dumps({'seconds': finished - imported, 'import_seconds': imported - started, 'exit_code': exit_code,
+                      'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+
+
+def measure(scenario: str, arguments) -> dict:
+    node = BenchNode(pool_size=arguments.pool_size, pending=arguments.pending, latency=arguments.latency,
+                     block_time=arguments.block_time, mined_after=arguments.mined_after).start()
+    try:
+        args = [sys.executable, "-m", "benchmarks.bench_main", "--run",
+                "--rpc-port", str(node.port), "--source", arguments.source,
+                "--wait-mode", arguments.wait_mode,
+                "--poll-min-interval", str(arguments.block_time / 10),
+                "--poll-max-interval", str(arguments.block_time),
+                SCENARIOS[scenario], OUR_ADDRESS]
+        child = subprocess.run(args, stdout=subprocess.PIPE, check=True)
+        result = {'scenario': scenario, **json.loads(child.stdout.decode('utf-8').splitlines()[-1]), **node.stats()}
+    finally:
+        node.stop()
+
+    # Plunger only prints failed sends, which nobody sees here, so measuring them instead of replacements has to be caught
+    if scenario == 'override' and result['replacements'] < arguments.pending:
+        raise RuntimeError(f"Only {result['replacements']} out of {arguments.pending} replacement transaction(s) have been sent")
+    return result
+
+
+def regressions(results: list, baseline: list, tolerance: float) -> list:
+    baseline = {result['scenario']: result for result in baseline}
+    found = []
+    for result in results:
+        for name in COMPARED:
+            expected = baseline.get(result['scenario'], {}).get(name)
+            if expected is not None and result[name] > expected * (1 + tolerance):
+                found.append(f"{result['scenario']}: {name} went up from {expected} to {result[name]}")
+    return found
+
+
+def main(args: list):
+    if len(args) > 0 and args[0] == "--run":
+        run(args[1:])
+        return
+
+    parser = argparse.ArgumentParser(prog='bench_main')
+    parser.add_argument("--pool-size", help="Number of pending transactions in the pool", default=10000, type=int)
+    parser.add_argument("--pending", help="Number of them sent from our address", default=10, type=int)
+    parser.add_argument("--latency", help="Time (in seconds) each HTTP request to the node takes", default=0, type=float)
+    parser.add_argument("--block-time", help="Time (in seconds) between blocks", default=1, type=float)
+    parser.add_argument("--mined-after", help="Number of blocks after which our transactions get mined", default=2, type=int)
+    parser.add_argument("--scenario", help="Comma-separated list of runs to measure", default=','.join(SCENARIOS),
+                        type=lambda x: x.split(','))
+    parser.add_argument("--source", help="Discovery source to run plunger with", default="parity_txqueue", type=str)
+    parser.add_argument("--wait-mode", help="How plunger should find out about new blocks", default="auto", type=str)
+    parser.add_argument("--json", help="Print the results as JSON", action='store_true')
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with", default=None, type=str)
+    parser.add_argument("--tolerance", help="How much worse than the baseline (as a fraction) results can get", default=0.2, type=float)
+    arguments = parser.parse_args(args)
+
+    results = [measure(scenario, arguments) for scenario in arguments.scenario]
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Pool of {arguments.pool_size} transactions, {arguments.pending} of them ours, latency {arguments.latency}s,"
+              f" block time {arguments.block_time}s")
+        for result in results:
+            print(f"{result['scenario']:>9}: {result['seconds']:.3f}s (+{result['import_seconds']:.3f}s imports),"
+                  f" {result['rpc_calls']} JSON-RPC call(s) in {result['http_requests']} HTTP request(s),"
+                  f" {result['request_bytes'] / 1024:.0f} KiB sent, {result['response_bytes'] / 1024:.0f} KiB received,"
+                  f" peak RSS {result['peak_rss_bytes'] / 1024 / 1024:.1f} MiB")
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as baseline_file:
+            found = regressions(results, json.load(baseline_file), arguments.tolerance)
+        for regression in found:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if len(found) > 0:
+            exit(-1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
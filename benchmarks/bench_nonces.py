@@ -0,0 +1,69 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compares planning the replacements of a backlog of pending transactions, with nonce gaps and
+# duplicated nonces, the way `Plunger.override` used to (a list lookup for every nonce) and with
+# `plan_replacements`.
+#
+# Usage: python -m benchmarks.bench_nonces [backlog_size]
+
+import random
+import sys
+import time
+
+from plunger.nonces import plan_replacements
+from plunger.plunger import Transaction
+
+
+def list_plan(last_nonce: int, transactions: list) -> list:
+    unique_nonces = []
+    for transaction in transactions:
+        if transaction.nonce not in unique_nonces:
+            unique_nonces.append(transaction.nonce)
+
+    plan = []
+    for nonce in unique_nonces:
+        plan.append(min(nonce, last_nonce + 1))
+        last_nonce += 1
+    return plan
+
+
+def backlog(size: int) -> list:
+    # Every tenth nonce is missing and every fifth one has been sent twice
+    generator = random.Random(size)
+    transactions = []
+    for nonce in range(size):
+        if nonce % 10 != 9:
+            transactions.append(Transaction("0x%064x" % len(transactions), nonce, gas_price=generator.randint(1, 100)))
+        if nonce % 5 == 0:
+            transactions.append(Transaction("0x%064x" % len(transactions), nonce, gas_price=generator.randint(1, 100)))
+    return transactions
+
+
+def main(args: list):
+    size = int(args[0]) if len(args) > 0 else 10000
+    transactions = backlog(size)
+    print(f"Backlog of {len(transactions)} transactions with {size} nonces")
+
+    for name, plan in [('list', list_plan), ('planner', plan_replacements)]:
+        started = time.perf_counter()
+        replacements = plan(-1, transactions)
+        print(f"{name:>8}: {time.perf_counter() - started:.3f}s, {len(replacements)} replacements")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
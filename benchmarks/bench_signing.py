@@ -0,0 +1,76 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compares the cost of signing and sending one replacement transaction through `sendTransaction`
+# and `construct_sign_and_send_raw_middleware` with signing it by `LocalSigner`, against a local mock node.
+#
+# Usage: python -m benchmarks.bench_signing [transactions]
+
+import sys
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+from plunger.keys import LocalSigner, register_private_key
+from plunger.provider import SessionHTTPProvider
+from plunger.rpc import RpcSession
+from tests.mock_node import MockNode
+
+PRIVATE_KEY = "0x" + "11" * 32
+
+
+def mock_node() -> MockNode:
+    return MockNode({'eth_chainId': '0x1',
+                     'eth_blockNumber': '0x1',
+                     'eth_getBlockByNumber': {'number': '0x1', 'gasLimit': '0x7a1200'},
+                     'eth_estimateGas': '0x5208',
+                     'eth_sendRawTransaction': "0x" + "ab" * 32}).start()
+
+
+def send_with_middleware(node: MockNode, transactions: int):
+    session = RpcSession()
+    web3 = Web3(SessionHTTPProvider(node.endpoint_uri, session))
+    account = register_private_key(web3, PRIVATE_KEY)
+    for nonce in range(transactions):
+        web3.eth.sendTransaction({'from': account.address, 'to': account.address, 'gasPrice': 1, 'nonce': nonce, 'value': 0})
+
+
+def send_with_local_signer(node: MockNode, transactions: int):
+    session = RpcSession()
+    signer = LocalSigner(Account.privateKeyToAccount(PRIVATE_KEY), 1)
+    for nonce in range(transactions):
+        signer.send_replacement(session, node.endpoint_uri, nonce, 1)
+
+
+def main(args: list):
+    transactions = int(args[0]) if len(args) > 0 else 200
+    print(f"Signing and sending {transactions} replacement transactions")
+
+    for name, function in [('middleware', send_with_middleware), ('LocalSigner', send_with_local_signer)]:
+        node = mock_node()
+        started = time.perf_counter()
+        function(node, transactions)
+        elapsed = time.perf_counter() - started
+        node.stop()
+
+        print(f"{name:>12}: {elapsed / transactions * 1000:.2f} ms per transaction,"
+              f" {len(node.requests) / transactions:.1f} JSON-RPC call(s) per transaction ({', '.join(sorted(set(node.calls)))})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
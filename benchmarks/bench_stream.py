@@ -0,0 +1,74 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compares loading the whole `parity_pendingTransactions` response with `json.loads` against
+# parsing it incrementally with `plunger.stream`, on a synthetic pool.
+#
+# Usage: python -m benchmarks.bench_stream [pool_size]
+
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.node import pending_transaction
+from plunger.stream import CHUNK_SIZE, iter_items
+
+OUR_ADDRESS = "0x6c626f45e3b7ae5a3998478753634790fd0e82ee"
+
+
+def parity_response(pool_size: int, ours_every: int = 1000) -> bytes:
+    items = (pending_transaction(index, OUR_ADDRESS if index % ours_every == 0 else "0x%040x" % index)
+             for index in range(pool_size))
+    return ('{"jsonrpc": "2.0", "result": [' + ", ".join(map(json.dumps, items)) + '], "id": 1}').encode('utf-8')
+
+
+def load_whole(data: bytes) -> list:
+    # What `requests.post(...).json()` followed by `filter` does
+    items = json.loads(data.decode('utf-8'))['result']
+    return [item for item in items if item['from'].lower() == OUR_ADDRESS and item['blockNumber'] is None]
+
+
+def load_streaming(data: bytes) -> list:
+    chunks = (data[i:i+CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+    items = iter_items(chunks, 'result')
+    return [item for item in items if item['from'].lower() == OUR_ADDRESS and item['blockNumber'] is None]
+
+
+def measure(function, data: bytes) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function(data)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'peak_bytes': peak, 'found': len(result)}
+
+
+def main(args: list):
+    pool_size = int(args[0]) if len(args) > 0 else 100000
+    data = parity_response(pool_size)
+    print(f"Pool of {pool_size} transactions, response size {len(data) / 1024 / 1024:.1f} MiB")
+
+    for name, function in [('json.loads', load_whole), ('streaming', load_streaming)]:
+        result = measure(function, data)
+        print(f"{name:>12}: {result['seconds']:.3f}s, peak memory {result['peak_bytes'] / 1024 / 1024:.1f} MiB,"
+              f" {result['found']} transactions found")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
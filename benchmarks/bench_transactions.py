@@ -0,0 +1,70 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Measures the memory taken by a pool of pending transactions converted into `Transaction` objects, compared
+# with the same fields kept in instances with a `__dict__` and as the hex strings the node returns them as.
+#
+# Usage: python -m benchmarks.bench_transactions [pool_size]
+
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.node import pending_transaction
+from plunger.plunger import Transaction
+
+
+class DictTransaction:
+    # What `Transaction` would be without `__slots__` and with the fields left as hex strings
+    def __init__(self, item: dict):
+        self.tx_hash = item['hash']
+        self.nonce = int(item['nonce'], 16)
+        self.gas_price = item.get('gasPrice')
+        self.max_fee_per_gas = item.get('maxFeePerGas')
+        self.max_priority_fee_per_gas = item.get('maxPriorityFeePerGas')
+        self.value = item.get('value')
+        self.to = item.get('to')
+        self.data = item.get('input')
+
+
+def measure(convert, response: str) -> dict:
+    # Only what the transactions keep once the response they have been converted from is gone gets counted
+    tracemalloc.start()
+    items = json.loads(response)
+    started = time.perf_counter()
+    transactions = [convert(item) for item in items]
+    elapsed = time.perf_counter() - started
+    del items
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'bytes': size, 'count': len(transactions)}
+
+
+def main(args: list):
+    pool_size = int(args[0]) if len(args) > 0 else 100000
+    response = json.dumps([pending_transaction(index, "0x%040x" % index) for index in range(pool_size)])
+    print(f"Pool of {pool_size} transactions")
+
+    for name, convert in [('__dict__', DictTransaction), ('__slots__', Transaction.from_json)]:
+        result = measure(convert, response)
+        print(f"{name:>10}: {result['seconds']:.3f}s, {result['bytes'] / 1024 / 1024:.1f} MiB,"
+              f" {result['bytes'] / result['count']:.0f} bytes per transaction")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,213 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+from collections import Counter
+from typing import Optional
+
+from tests.mock_node import MockNode
+
+OUR_ADDRESS = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+
+def pending_transaction(index: int, sender: str) -> dict:
+    # A pending transaction as `parity_pendingTransactions` reports it, with `index` as its nonce and hash
+    return {"blockHash": None, "blockNumber": None, "condition": None, "creates": None,
+            "from": sender,
+            "gas": "0x249f0",
+            "gasPrice": "0xdf8475800",
+            "hash": "0x%064x" % index,
+            "input": "0xa9059cbb000000000000000000000000627b10ad469cb6f76ada94b9ae2c6753340b81d8"
+                     "00000000000000000000000000000000000000000000021e19e0c9bab2400000",
+            "networkId": 1,
+            "nonce": hex(index),
+            "publicKey": "0x" + "35a6486cfb5b57f9" * 8,
+            "r": "0x" + "ec889cfe76763906" * 4,
+            "raw": "0xf8aa5c850df8475800830249f094b97048628db6b661d4c2aa833e95dbe1a905b28080b844" + "00" * 100,
+            "s": "0x" + "1bb511c183668c4c" * 4,
+            "standardV": "0x0",
+            "to": "0xb97048628db6b661d4c2aa833e95dbe1a905b280",
+            "transactionIndex": None,
+            "v": "0x25",
+            "value": "0x0"}
+
+
+class BenchNode(MockNode):
+    # A local stand-in for a Parity/OpenEthereum node, serving a synthetic pool of `pool_size` pending transactions,
+    # `pending` of which have been sent by `address` with the nonces right above its last mined one. A block gets
+    # mined every `block_time` seconds and the transactions from `address` (or their replacements) get mined
+    # `mined_after` blocks after the node has been started. Each HTTP request takes at least `latency` seconds.
+    # The pool is serialized only once, so it is plunger and not the node which gets measured. Unlike `MockNode`,
+    # it does not keep the requests, only counts them.
+    def __init__(self, pool_size: int = 10000, pending: int = 10, nonce: int = 100, latency: float = 0,
+                 block_time: float = 1, mined_after: int = 2, base_fee: Optional[int] = None, address: str = OUR_ADDRESS):
+        assert isinstance(pool_size, int)
+        assert isinstance(pending, int)
+        assert isinstance(nonce, int)
+        assert isinstance(latency, (int, float))
+        assert isinstance(block_time, (int, float))
+        assert isinstance(mined_after, int)
+        assert isinstance(base_fee, int) or (base_fee is None)
+        super().__init__()
+
+        self.pool_size = pool_size
+        self.pending = pending
+        self.nonce = nonce
+        self.latency = latency
+        self.block_time = block_time
+        self.mined_after = mined_after
+        self.base_fee = base_fee
+        self.address = address.lower()
+
+        self.call_counts = Counter()
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.replacements = 0
+        self.started = time.monotonic()
+        self.genesis = time.time()
+        self.filters = {}
+        self.serialized = {}
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        self.started, self.genesis = time.monotonic(), time.time()
+        return super().start()
+
+    def stats(self) -> dict:
+        return {'http_requests': self.http_requests,
+                'rpc_calls': sum(self.call_counts.values()),
+                'calls': dict(sorted(self.call_counts.items())),
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes,
+                'replacements': self.replacements}
+
+    def block_number(self) -> int:
+        return 1 + int((time.monotonic() - self.started) / self.block_time)
+
+    def mined(self) -> bool:
+        return self.block_number() > self.mined_after
+
+    def respond(self, path: str, body: bytes) -> bytes:
+        time.sleep(self.latency)
+        request = json.loads(body)
+        if isinstance(request, list):
+            response = "[" + ", ".join(self.serialized_call(item) for item in request) + "]"
+        else:
+            response = self.serialized_call(request)
+        response = response.encode('utf-8')
+
+        with self.lock:
+            self.http_requests += 1
+            self.request_bytes += len(body)
+            self.response_bytes += len(response)
+        return response
+
+    def serialized_call(self, request: dict) -> str:
+        method, params = request['method'], request.get('params', [])
+        with self.lock:
+            self.call_counts[method] += 1
+
+        handler = getattr(self, method, None)
+        if handler is None:
+            return json.dumps({"jsonrpc": "2.0", "id": request['id'], "error": {"code": -32601, "message": f"Method {method} not found"}})
+        return '{"jsonrpc": "2.0", "id": ' + json.dumps(request['id']) + ', "result": ' + handler(params) + '}'
+
+    def our_transactions(self) -> list:
+        return [] if self.mined() else [pending_transaction(self.nonce + index, self.address) for index in range(self.pending)]
+
+    def pool(self) -> str:
+        # Transactions of other senders get hashes which do not collide with ours
+        key = ('pool', self.mined())
+        if key not in self.serialized:
+            items = [pending_transaction(self.nonce * 1000000 + index, "0x%040x" % (index + 1))
+                     for index in range(self.pool_size - self.pending)] + self.our_transactions()
+            self.serialized[key] = json.dumps(items)
+        return self.serialized[key]
+
+    def block(self, number: int) -> dict:
+        block = {'number': hex(number), 'hash': "0x%064x" % number, 'timestamp': hex(int(self.genesis + (number - 1) * self.block_time)),
+                 'gasLimit': hex(10000000)}
+        if self.base_fee is not None:
+            block['baseFeePerGas'] = hex(self.base_fee)
+        return block
+
+    def web3_clientVersion(self, params: list) -> str:
+        return json.dumps("OpenEthereum//v3.0.1-stable")
+
+    def eth_chainId(self, params: list) -> str:
+        return json.dumps("0x1")
+
+    def eth_gasPrice(self, params: list) -> str:
+        return json.dumps(hex(5000000000))
+
+    def eth_estimateGas(self, params: list) -> str:
+        return json.dumps(hex(21000))
+
+    def eth_blockNumber(self, params: list) -> str:
+        return json.dumps(hex(self.block_number()))
+
+    def eth_getTransactionCount(self, params: list) -> str:
+        ours = params[0].lower() == self.address
+        return json.dumps(hex(self.nonce + (self.pending if ours and self.mined() else 0)))
+
+    def eth_getBlockByNumber(self, params: list) -> str:
+        if params[0] == 'pending' and params[1]:
+            block = json.dumps(self.block(self.block_number() + 1))
+            return block[:-1] + ', "transactions": ' + self.pool() + '}'
+        elif params[0] == 'pending':
+            return json.dumps(self.block(self.block_number() + 1))
+        else:
+            return json.dumps(self.block(self.block_number()))
+
+    def parity_pendingTransactions(self, params: list) -> str:
+        # Filtering by sender is the only filter plunger uses
+        if len(params) > 1 and params[1] is not None:
+            sender = params[1]['from']['eq'].lower()
+            return json.dumps(self.our_transactions() if sender == self.address else [])
+        return self.pool()
+
+    def txpool_contentFrom(self, params: list) -> str:
+        ours = self.our_transactions() if params[0].lower() == self.address else []
+        return json.dumps({'pending': {str(int(item['nonce'], 16)): item for item in ours}, 'queued': {}})
+
+    def eth_sendTransaction(self, params: list) -> str:
+        with self.lock:
+            self.replacements += 1
+            return json.dumps("0x%064x" % (0xbeef0000 + self.replacements))
+
+    def eth_sendRawTransaction(self, params: list) -> str:
+        return self.eth_sendTransaction(params)
+
+    def eth_newBlockFilter(self, params: list) -> str:
+        with self.lock:
+            filter_id = hex(len(self.filters) + 1)
+            self.filters[filter_id] = self.block_number()
+        return json.dumps(filter_id)
+
+    def eth_getFilterChanges(self, params: list) -> str:
+        with self.lock:
+            last_block, block_number = self.filters[params[0]], self.block_number()
+            self.filters[params[0]] = block_number
+        return json.dumps(["0x%064x" % number for number in range(last_block + 1, block_number + 1)])
+
+    def eth_uninstallFilter(self, params: list) -> str:
+        with self.lock:
+            return json.dumps(self.filters.pop(params[0], None) is not None)
@@ -0,0 +1,241 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from typing import Optional
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".plunger", "agent.sock")
+DEFAULT_TTL = 3600
+
+
+def keystore_id(key_file: str, keystore: str) -> str:
+    # Keys are cached by the path of the keystore and its content, so a keystore which
+    # has been replaced under the same path will not be served from the cache
+    assert isinstance(key_file, str)
+    assert isinstance(keystore, str)
+
+    return os.path.realpath(key_file) + ":" + hashlib.sha256(keystore.encode('utf-8')).hexdigest()
+
+
+class KeyCache:
+    # Decrypted private keys, each kept only until its time-to-live expires
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        assert isinstance(ttl, (int, float))
+
+        self.ttl = ttl
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def get(self, key_id: str) -> Optional[bytes]:
+        with self.lock:
+            self.expire()
+            entry = self.keys.get(key_id)
+            return entry[0] if entry is not None else None
+
+    def put(self, key_id: str, private_key: bytes, ttl: Optional[float] = None):
+        assert isinstance(private_key, bytes)
+
+        # The time-to-live requested by a client cannot exceed the one of the cache
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self.lock:
+            self.keys[key_id] = (private_key, time.monotonic() + ttl)
+
+    def evict(self, key_file: Optional[str] = None) -> int:
+        # Evict all keys decrypted from `key_file`, or all keys if it is not given
+        with self.lock:
+            evicted = [key_id for key_id in self.keys
+                       if key_file is None or key_id.rsplit(":", 1)[0] == os.path.realpath(key_file)]
+            for key_id in evicted:
+                del self.keys[key_id]
+            return len(evicted)
+
+    def expire(self):
+        now = time.monotonic()
+        for key_id in [key_id for key_id, (_, expires_at) in self.keys.items() if expires_at <= now]:
+            del self.keys[key_id]
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.agent.handle(json.loads(line.decode('utf-8')))
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+
+
+class _AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class KeyAgent:
+    # Keeps decrypted keys in memory between plunger runs, so the expensive keystore decryption
+    # happens only once per key and TTL. Similarly to `ssh-agent`, it listens on a Unix socket which only
+    # the user running it can connect to.
+    def __init__(self, socket_path: str, ttl: float = DEFAULT_TTL):
+        assert isinstance(socket_path, str)
+
+        self.socket_path = socket_path
+        self.cache = KeyCache(ttl)
+
+        os.makedirs(os.path.dirname(socket_path) or ".", mode=0o700, exist_ok=True)
+        self.remove_stale_socket(socket_path)
+
+        umask = os.umask(0o177)
+        try:
+            self.server = _AgentServer(socket_path, _AgentHandler)
+        finally:
+            os.umask(umask)
+        self.server.agent = self
+
+    @staticmethod
+    def remove_stale_socket(socket_path: str):
+        # A socket left behind by an agent which did not exit cleanly gets replaced, but neither
+        # an agent which is still running nor a file which is not a socket at all ever is
+        try:
+            mode = os.lstat(socket_path).st_mode
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(mode):
+            raise ValueError(f"{socket_path} exists and is not a socket")
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+            except ConnectionRefusedError:
+                os.unlink(socket_path)
+                return
+        raise ValueError(f"Another key agent is already listening on {socket_path}")
+
+    def handle(self, request: dict) -> dict:
+        if request['op'] == 'get':
+            private_key = self.cache.get(request['id'])
+            return {'private_key': private_key.hex() if private_key is not None else None}
+        elif request['op'] == 'put':
+            self.cache.put(request['id'], bytes.fromhex(request['private_key']), request.get('ttl'))
+            return {}
+        elif request['op'] == 'evict':
+            return {'evicted': self.cache.evict(request.get('key_file'))}
+        else:
+            raise ValueError(f"Unknown operation {request['op']}")
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class KeyAgentClient:
+    # Talks to a running `KeyAgent`, looking the same as `KeyCache` to `register_keys`. If the agent
+    # cannot be reached, keys are just decrypted as if there was no agent.
+    def __init__(self, socket_path: str, ttl: Optional[float] = None, timeout: float = 5):
+        assert isinstance(socket_path, str)
+        assert isinstance(ttl, (int, float)) or (ttl is None)
+
+        self.socket_path = socket_path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.warned = False
+
+    def request(self, request: dict) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            with sock.makefile('rwb') as stream:
+                stream.write(json.dumps(request).encode('utf-8') + b"\n")
+                stream.flush()
+                response = json.loads(stream.readline().decode('utf-8'))
+
+        if 'error' in response:
+            raise ValueError(f"Key agent failed: {response['error']}")
+        return response
+
+    def get(self, key_id: str) -> Optional[bytes]:
+        try:
+            private_key = self.request({'op': 'get', 'id': key_id})['private_key']
+            return bytes.fromhex(private_key) if private_key is not None else None
+        except OSError as e:
+            self.warn(e)
+            return None
+
+    def put(self, key_id: str, private_key: bytes, ttl: Optional[float] = None):
+        try:
+            self.request({'op': 'put', 'id': key_id, 'private_key': private_key.hex(), 'ttl': ttl or self.ttl})
+        except OSError as e:
+            self.warn(e)
+
+    def warn(self, error: Exception):
+        if not self.warned:
+            print(f"WARNING: Cannot use the key agent at {self.socket_path}: {error}", file=sys.stderr)
+            self.warned = True
+
+    def evict(self, key_file: Optional[str] = None) -> int:
+        # Relative paths are resolved here, as the agent has a working directory of its own
+        key_file = os.path.realpath(key_file) if key_file is not None else None
+        return self.request({'op': 'evict', 'key_file': key_file})['evicted']
+
+
+def main(args: list):
+    parser = argparse.ArgumentParser(prog='plunger-agent')
+    parser.add_argument("--socket", help="Unix socket to listen on (default: `~/.plunger/agent.sock')", default=DEFAULT_SOCKET, type=str)
+    parser.add_argument("--ttl", help=f"Time (in seconds) to keep decrypted keys for (default: `{DEFAULT_TTL}')",
+                        default=DEFAULT_TTL, type=float)
+    parser.add_argument("--evict", help="Ask the running agent to forget the keys decrypted from KEY_FILE,"
+                                        " or all keys if KEY_FILE is not given, and exit",
+                        nargs='?', const='', default=None, metavar='KEY_FILE', type=str)
+    arguments = parser.parse_args(args)
+
+    if arguments.evict is not None:
+        try:
+            evicted = KeyAgentClient(arguments.socket).evict(arguments.evict or None)
+        except OSError as e:
+            print(f"Cannot connect to the key agent at {arguments.socket}: {e}", file=sys.stderr)
+            exit(-1)
+        print(f"Evicted {evicted} key(s)")
+        return
+
+    try:
+        agent = KeyAgent(arguments.socket, arguments.ttl)
+    except ValueError as e:
+        print(f"Cannot start the key agent: {e}", file=sys.stderr)
+        exit(-1)
+    print(f"Key agent listening on {arguments.socket}", file=sys.stderr)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
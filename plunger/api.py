@@ -0,0 +1,115 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_WAIT_TIMEOUT = 60
+MAX_WAIT_TIMEOUT = 600
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.respond(*self.server.api.handle("GET", self.path))
+
+    def do_POST(self):
+        # The body is not used, but it has to be read for the connection to be reused
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.respond(*self.server.api.handle("POST", self.path))
+
+    def respond(self, status: int, body):
+        # Metrics are served as plain text, everything else as JSON
+        if isinstance(body, str):
+            response, content_type = body.encode('utf-8'), "text/plain; version=0.0.4"
+        else:
+            response, content_type = json.dumps(body).encode('utf-8'), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ApiServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ApiServer:
+    # Serves a running `Daemon` as JSON over HTTP, so keepers can ask an already warmed up process instead
+    # of starting plunger each time. It should only listen on a local interface. Endpoints:
+    #   GET  /status              - everything the daemon knows about the pending transactions
+    #   GET  /metrics             - JSON-RPC and replacement statistics in the Prometheus text format
+    #   GET  /pending/<address>   - pending transactions of `address`, as with `--list --json`
+    #   POST /plunge/<address>    - override pending transactions of `address`, as with `--override-with-zero-txs`
+    #   GET  /wait/<address>      - wait (at most `?timeout=` seconds) for pending transactions of `address` to get mined
+    def __init__(self, daemon, host: str = "localhost", port: int = 0):
+        assert isinstance(host, str)
+        assert isinstance(port, int)
+
+        self.daemon = daemon
+        self.server = _ApiServer((host, port), _ApiHandler)
+        self.server.api = self
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, method: str, path: str) -> tuple:
+        url = urlparse(path)
+        endpoint, _, address = url.path.strip('/').partition('/')
+        if method == "GET" and url.path == "/status":
+            return 200, self.daemon.status()
+        if method == "GET" and url.path == "/metrics":
+            return 200, self.daemon.prometheus()
+        if (method, endpoint) not in [("GET", "pending"), ("POST", "plunge"), ("GET", "wait")]:
+            return 404, {'error': f"Unknown endpoint {method} {url.path}"}
+
+        watched_address = self.daemon.watched_address(address)
+        if watched_address is None:
+            return 404, {'error': f"Address {address} is not being watched"}
+
+        try:
+            timeout = min(max(float(parse_qs(url.query).get('timeout', [DEFAULT_WAIT_TIMEOUT])[0]), 0), MAX_WAIT_TIMEOUT)
+        except ValueError:
+            return 400, {'error': "Timeout has to be a number of seconds"}
+
+        try:
+            if endpoint == "pending":
+                return 200, self.daemon.plunger.transactions_json(self.daemon.pending(watched_address))
+            elif endpoint == "plunge":
+                return 200, self.daemon.plunge(watched_address)
+            else:
+                return 200, self.daemon.wait(watched_address, timeout)
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
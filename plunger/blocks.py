@@ -0,0 +1,215 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+import websockets
+
+from plunger.rpc import RpcError, RpcSession, rpc_call
+
+
+class PollScheduler:
+    # Decides how long to sleep before polling the node again. Until the block time of the chain is known,
+    # it polls every `min_interval`. Once it is known, after each block it sleeps until the next one is expected,
+    # and if that one is overdue it polls again after `min_interval`, backing off exponentially up to
+    # `max_interval` for as long as nothing changes. A random jitter is added, so many instances started
+    # at the same time do not keep polling the node in lockstep.
+    SMOOTHING = 0.3
+
+    def __init__(self, min_interval: float = 1, max_interval: float = 15, jitter: float = 0.2):
+        assert isinstance(min_interval, (int, float))
+        assert isinstance(max_interval, (int, float))
+        assert isinstance(jitter, (int, float))
+        assert 0 < min_interval <= max_interval
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.block_time = None
+        self.last_block_at = None
+        self.misses = 0
+
+    def block_seen(self, blocks: int = 1, block_time: float = None, now: float = None):
+        # If the node does not tell us the block time, it is estimated from the time the blocks arrived at
+        now = time.monotonic() if now is None else now
+        if block_time is None and self.last_block_at is not None:
+            block_time = (now - self.last_block_at) / max(blocks, 1)
+        if block_time is not None and block_time > 0:
+            if self.block_time is None:
+                self.block_time = block_time
+            else:
+                self.block_time += self.SMOOTHING * (block_time - self.block_time)
+
+        self.last_block_at = now
+        self.misses = 0
+
+    def next(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        if self.block_time is None:
+            interval = self.min_interval
+        elif now < self.last_block_at + self.block_time:
+            interval = self.last_block_at + self.block_time - now
+        else:
+            interval = self.min_interval * 2 ** min(self.misses, 32)
+            self.misses += 1
+
+        interval = max(self.min_interval, min(interval, self.max_interval))
+        return interval * random.uniform(1, 1 + self.jitter)
+
+
+class BlockWatcher:
+    # Waits until a new block (most likely) got mined, so nonces only need to be checked then
+    def wait_for_block(self):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class PollingBlockWatcher(BlockWatcher):
+    # Polls the latest block header, which every node supports. Its timestamp lets the scheduler learn
+    # the block time of the chain. If even that fails, it returns after each interval for the nonces
+    # to be checked directly.
+    def __init__(self, session: RpcSession, endpoint_uri: str, scheduler: PollScheduler):
+        assert isinstance(session, RpcSession)
+        assert isinstance(endpoint_uri, str)
+        assert isinstance(scheduler, PollScheduler)
+
+        self.session = session
+        self.endpoint_uri = endpoint_uri
+        self.scheduler = scheduler
+        self.block = self.latest_block()
+
+    def latest_block(self):
+        try:
+            block = rpc_call(self.session, self.endpoint_uri, "eth_getBlockByNumber", ["latest", False])
+            return int(block['number'], 16), int(block['timestamp'], 16)
+        except (RpcError, KeyError, TypeError):
+            return None
+
+    def wait_for_block(self):
+        while True:
+            time.sleep(self.scheduler.next())
+            block = self.latest_block()
+            if block is None or self.block is None:
+                return
+
+            if block[0] > self.block[0]:
+                self.scheduler.block_seen(blocks=block[0] - self.block[0],
+                                          block_time=(block[1] - self.block[1]) / (block[0] - self.block[0]))
+                self.block = block
+                return
+
+
+class FilterBlockWatcher(BlockWatcher):
+    # Polls an `eth_newBlockFilter` filter, which is a single cheap call regardless of the number
+    # of addresses being waited for, and returns only once it reports a new block.
+    def __init__(self, session: RpcSession, endpoint_uri: str, scheduler: PollScheduler):
+        assert isinstance(session, RpcSession)
+        assert isinstance(endpoint_uri, str)
+        assert isinstance(scheduler, PollScheduler)
+
+        self.session = session
+        self.endpoint_uri = endpoint_uri
+        self.scheduler = scheduler
+        self.filter_id = rpc_call(self.session, self.endpoint_uri, "eth_newBlockFilter", [])
+
+    def wait_for_block(self):
+        while True:
+            time.sleep(self.scheduler.next())
+            try:
+                changes = rpc_call(self.session, self.endpoint_uri, "eth_getFilterChanges", [self.filter_id])
+            except RpcError:
+                # Nodes drop filters which have not been polled for a while, in which case we install
+                # a new one and check the nonces straight away as a block could have been missed
+                self.filter_id = rpc_call(self.session, self.endpoint_uri, "eth_newBlockFilter", [])
+                return
+
+            if len(changes) > 0:
+                self.scheduler.block_seen(blocks=len(changes))
+                return
+
+    def close(self):
+        try:
+            rpc_call(self.session, self.endpoint_uri, "eth_uninstallFilter", [self.filter_id])
+        except Exception:
+            pass
+
+
+class SubscriptionBlockWatcher(BlockWatcher):
+    # Gets notified about new blocks by an `eth_subscribe newHeads` subscription over a WebSocket,
+    # so no requests are sent at all while waiting. The subscription is read by a background thread
+    # running its own event loop.
+    def __init__(self, ws_url: str, timeout: float = 10, max_interval: float = 60):
+        assert isinstance(ws_url, str)
+        assert isinstance(timeout, (int, float))
+        assert isinstance(max_interval, (int, float))
+
+        self.ws_url = ws_url
+        self.max_interval = max_interval
+        self.websocket = None
+        self.error = None
+        self.closed = False
+        self.subscribed = threading.Event()
+        self.block = threading.Event()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(self.listen(),), daemon=True)
+        self.thread.start()
+
+        if not self.subscribed.wait(timeout):
+            self.close()
+            raise TimeoutError(f"Subscribing to new blocks did not succeed in {timeout}s")
+        if self.closed:
+            raise ConnectionError(f"Subscribing to new blocks failed: {self.error}")
+
+    async def listen(self):
+        try:
+            async with websockets.connect(self.ws_url) as websocket:
+                self.websocket = websocket
+                await websocket.send(json.dumps({"method": "eth_subscribe", "params": ["newHeads"], "id": 1, "jsonrpc": "2.0"}))
+                response = json.loads(await websocket.recv())
+                if 'result' not in response:
+                    raise RpcError("eth_subscribe", response.get('error'))
+                self.subscribed.set()
+
+                async for message in websocket:
+                    if json.loads(message).get('method') == 'eth_subscription':
+                        self.block.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.closed = True
+            self.subscribed.set()
+            self.block.set()
+
+    def wait_for_block(self):
+        # Notifications are not acknowledged, so nonces are checked every `max_interval` seconds anyway
+        self.block.wait(self.max_interval)
+        self.block.clear()
+
+        if self.closed:
+            raise ConnectionError(f"Subscription to new blocks has been lost: {self.error}")
+
+    def close(self):
+        if self.websocket is not None and not self.closed:
+            asyncio.run_coroutine_threadsafe(self.websocket.close(), self.loop)
+        self.thread.join(1)
@@ -0,0 +1,47 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import time
+
+
+# JSON files which let runs following each other reuse what an earlier run has fetched. A cache which
+# cannot be read or written is treated as empty, as the values can always be fetched again.
+
+def read_cache(cache_file: str):
+    try:
+        with open(cache_file) as cache_file_open:
+            return json.load(cache_file_open)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(cache_file: str, value):
+    # Written to a temporary file first, so concurrent runs never read a partially written cache
+    try:
+        os.makedirs(os.path.dirname(cache_file) or ".", mode=0o700, exist_ok=True)
+        temporary_file = f"{cache_file}.{os.getpid()}"
+        with open(temporary_file, 'w') as cache_file_open:
+            json.dump(value, cache_file_open)
+        os.replace(temporary_file, cache_file)
+    except OSError:
+        pass
+
+
+def is_fresh(timestamp: float, cache_ttl: float) -> bool:
+    return 0 <= time.time() - timestamp < cache_ttl
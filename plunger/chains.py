@@ -0,0 +1,81 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+from typing import Optional
+
+from plunger.cache import is_fresh, read_cache, write_cache
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".plunger", "chains.json")
+DEFAULT_CACHE_TTL = 0
+
+CHAIN_NAMES = {
+    1: "mainnet",
+    3: "ropsten",
+    4: "rinkeby",
+    5: "goerli",
+    10: "optimism",
+    42: "kovan",
+    56: "bsc",
+    100: "gnosis",
+    137: "polygon",
+    17000: "holesky",
+    42161: "arbitrum",
+    11155111: "sepolia"
+}
+
+
+def chain_name(chain_id: int) -> str:
+    return CHAIN_NAMES.get(chain_id, "unknown")
+
+
+class ChainCache:
+    # The client version and chain id of each node, which do not change while it is running, kept in
+    # `cache_file` for `cache_ttl` seconds and keyed by its JSON-RPC endpoint, so runs following each other
+    # do not need to ask the node for them again.
+    def __init__(self, cache_file: str = DEFAULT_CACHE, cache_ttl: float = DEFAULT_CACHE_TTL):
+        assert isinstance(cache_file, str)
+        assert isinstance(cache_ttl, (int, float))
+
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+
+    def read(self, endpoint_uri: str) -> Optional[tuple]:
+        if self.cache_ttl <= 0:
+            return None
+
+        try:
+            cached = self.read_file()[endpoint_uri]
+            if is_fresh(cached['timestamp'], self.cache_ttl):
+                return str(cached['client_version']), int(cached['chain_id'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def write(self, endpoint_uri: str, client_version: str, chain_id: int):
+        if self.cache_ttl <= 0:
+            return
+
+        # Chains of other endpoints are kept
+        cached = self.read_file()
+        cached[endpoint_uri] = {'client_version': client_version, 'chain_id': chain_id, 'timestamp': time.time()}
+        write_cache(self.cache_file, cached)
+
+    def read_file(self) -> dict:
+        cached = read_cache(self.cache_file)
+        return cached if isinstance(cached, dict) else {}
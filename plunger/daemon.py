@@ -0,0 +1,242 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from plunger.blocks import PollingBlockWatcher, PollScheduler
+from plunger.rpc import RpcError
+from plunger.tracker import PendingTracker
+
+
+class Daemon:
+    # Keeps watching the addresses of `plunger`, reusing its connection, keys and gas price client, and checks
+    # their pending transactions after each new block. Once the lowest pending nonce of an address has been
+    # pending for `stuck_blocks` blocks or `stuck_seconds` seconds, all pending transactions of that address
+    # get replaced, the same way `--override-with-zero-txs` does. Each nonce is replaced only once.
+    # The same can be requested at any time, for example through `ApiServer`, by calling `plunge`.
+    # Pending transactions are followed by a `PendingTracker` if the node supports pending transaction filters,
+    # otherwise they are discovered from scratch after each block.
+    HISTORY = 100
+
+    def __init__(self, plunger, stuck_blocks: int, stuck_seconds: float):
+        assert isinstance(stuck_blocks, int)
+        assert isinstance(stuck_seconds, (int, float))
+
+        self.plunger = plunger
+        self.stuck_blocks = stuck_blocks
+        self.stuck_seconds = stuck_seconds
+        self.first_seen = {}
+        self.replaced = set()
+        self.replacements_sent = 0
+        self.tracker = None
+        self.track = True
+        self.mined = deque(maxlen=self.HISTORY)
+        self.replaced_transactions = deque(maxlen=self.HISTORY)
+        self.snapshot = {}
+        self.transactions = None
+        self.lock = threading.Lock()
+        self.plunging = threading.Lock()
+        self.checked = threading.Condition()
+        self.stopped = threading.Event()
+
+    def run(self):
+        print(f"Watching {len(self.plunger.addresses)} address(es) for stuck transactions...")
+
+        scheduler = PollScheduler(self.plunger.arguments.poll_min_interval, self.plunger.arguments.poll_max_interval)
+        block_watcher = self.plunger.block_watcher(scheduler)
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.check()
+                except Exception as e:
+                    print(f"WARNING: Checking for stuck transactions failed: {e}", file=sys.stderr)
+
+                try:
+                    block_watcher.wait_for_block()
+                except Exception as e:
+                    print(f"WARNING: Watching for new blocks failed ({e}), falling back to polling", file=sys.stderr)
+                    block_watcher.close()
+                    block_watcher = PollingBlockWatcher(self.plunger.session, self.plunger.endpoint_uri, scheduler)
+        finally:
+            block_watcher.close()
+            if self.tracker is not None:
+                self.tracker.close()
+
+    def stop(self):
+        self.stopped.set()
+
+    def check(self, now: float = None):
+        with self.plunging:
+            self.check_stuck(time.time() if now is None else now)
+
+        # Let whoever waits for transactions to get mined know the nonces have been checked again
+        with self.checked:
+            self.checked.notify_all()
+
+    def check_stuck(self, now: float):
+        block_number, last_nonces = self.get_chain_state()
+        self.plunger.last_nonces = last_nonces
+        transactions = self.pending_transactions(last_nonces)
+        if transactions is None:
+            print("WARNING: None of the sources responded, cannot discover pending transactions", file=sys.stderr)
+            return
+
+        # Forget transactions which are not pending anymore, and nonces which have been mined
+        self.first_seen = {(address, tx.nonce, tx.tx_hash): self.first_seen.get((address, tx.nonce, tx.tx_hash), (block_number, now))
+                           for address, address_transactions in transactions.items() for tx in address_transactions}
+        self.replaced = {(address, nonce) for address, nonce in self.replaced if nonce > last_nonces[address]}
+
+        for address, address_transactions in transactions.items():
+            candidates = [tx for tx in address_transactions if (address, tx.nonce) not in self.replaced]
+            if len(candidates) > 0 and self.is_stuck(address, candidates[0], block_number, now):
+                print(f"Replacing {len(candidates)} transaction(s) from {address} stuck since"
+                      f" block {self.first_seen[(address, candidates[0].nonce, candidates[0].tx_hash)][0]}")
+
+                self.replace(address, address_transactions, {nonce for replaced_address, nonce in self.replaced
+                                                             if replaced_address == address})
+
+        # Replacements which are still pending get sent again at a higher price once they have waited long enough
+        if self.plunger.escalation is not None:
+            self.plunger.escalate(block_number, last_nonces)
+
+        self.update_snapshot(block_number, now, transactions)
+
+    def pending_transactions(self, last_nonces: dict) -> Optional[dict]:
+        if self.tracker is None and self.track:
+            try:
+                self.tracker = PendingTracker(self.plunger.session, self.plunger.endpoint_uri, self.plunger.addresses,
+                                              self.plunger.discover_pending_transactions)
+            except RpcError as e:
+                print(f"WARNING: Cannot track pending transactions ({e}), discovering them after each block", file=sys.stderr)
+                self.track = False
+
+        if self.tracker is None:
+            return self.plunger.discover_pending_transactions()
+
+        # Report what has happened to the transactions which are not pending anymore
+        _, mined, replaced = self.tracker.refresh(last_nonces)
+        for address, transaction in mined:
+            print(f"Transaction {transaction.tx_hash} with nonce={transaction.nonce} from {address} has been mined")
+            self.mined.append({'address': address, 'hash': transaction.tx_hash, 'nonce': transaction.nonce})
+        for address, transaction in replaced:
+            print(f"Transaction {transaction.tx_hash} with nonce={transaction.nonce} from {address} has been replaced")
+            self.replaced_transactions.append({'address': address, 'hash': transaction.tx_hash, 'nonce': transaction.nonce})
+
+        return self.tracker.transactions()
+
+    def replace(self, address: str, transactions: list, replaced_nonces: set = frozenset()) -> list:
+        # Replacements are planned from all pending transactions of `address`, so the nonces which have been
+        # replaced already and are still pending do not look like a gap, but these nonces are not replaced again
+        self.plunger.transactions[address] = list(transactions)
+        results = self.plunger.override(address, transactions, replaced_nonces)
+        if self.plunger.escalation is not None:
+            self.plunger.escalation.track(address, results)
+        sent = {result['nonce'] for result in results if 'tx_hash' in result}
+        self.replaced |= {(address, nonce) for nonce in sent}
+        self.replacements_sent += len(sent)
+        return results
+
+    def watched_address(self, address: str) -> Optional[str]:
+        return next((watched for watched in self.plunger.addresses if watched.lower() == address.lower()), None)
+
+    def pending(self, address: str) -> list:
+        # Pending transactions are served from what the last check has found, which the daemon keeps current
+        # after each block, so the pool does not get downloaded again for each request. Only until the first
+        # check has completed they are discovered, though never at the same time as a check.
+        with self.lock:
+            transactions = self.transactions
+        if transactions is not None:
+            return transactions[address]
+
+        with self.plunging:
+            return self.discover_pending(address)
+
+    def discover_pending(self, address: str) -> list:
+        transactions = self.plunger.discover_pending_transactions()
+        if transactions is None:
+            raise RuntimeError("None of the sources responded, cannot discover pending transactions")
+        return transactions[address]
+
+    def plunge(self, address: str) -> list:
+        # Replace all pending transactions of `address` straight away, whether they are stuck or not
+        with self.plunging:
+            _, self.plunger.last_nonces = self.get_chain_state()
+            with self.lock:
+                transactions = self.transactions
+            pending = transactions[address] if transactions is not None else self.discover_pending(address)
+            return self.replace(address, [tx for tx in pending if tx.nonce > self.plunger.last_nonces[address]])
+
+    def wait(self, address: str, timeout: float) -> dict:
+        # Wait until the transactions of `address` pending now get mined, or replaced and their replacements get
+        # mined, checking them again each time the daemon does, i.e. after each new block
+        transactions = self.pending(address)
+        deadline = time.monotonic() + timeout
+        with self.checked:
+            while any(tx.nonce > self.plunger.last_nonces[address] for tx in transactions):
+                if time.monotonic() >= deadline:
+                    break
+                self.checked.wait(deadline - time.monotonic())
+
+        pending = [tx for tx in transactions if tx.nonce > self.plunger.last_nonces[address]]
+        return {'mined': len(pending) == 0, 'pending': self.plunger.transactions_json(pending)}
+
+    def is_stuck(self, address: str, transaction, block_number: int, now: float) -> bool:
+        first_block, first_time = self.first_seen[(address, transaction.nonce, transaction.tx_hash)]
+        return block_number - first_block >= self.stuck_blocks or now - first_time >= self.stuck_seconds
+
+    def get_chain_state(self) -> tuple:
+        return self.plunger.get_chain_state(self.plunger.addresses)
+
+    def update_snapshot(self, block_number: int, now: float, transactions: dict):
+        # Pending transactions are reported in the same format as `--list --json` does, with what the daemon knows about them
+        addresses = {address: [{'hash': tx.tx_hash,
+                                'nonce': tx.nonce,
+                                'first_seen_block': self.first_seen[(address, tx.nonce, tx.tx_hash)][0],
+                                'first_seen_at': self.first_seen[(address, tx.nonce, tx.tx_hash)][1],
+                                'replaced': (address, tx.nonce) in self.replaced} for tx in address_transactions]
+                     for address, address_transactions in transactions.items()}
+        with self.lock:
+            self.transactions = transactions
+            self.snapshot = {'block_number': block_number,
+                             'checked_at': now,
+                             'replacements_sent': self.replacements_sent,
+                             'addresses': addresses,
+                             'mined': list(self.mined),
+                             'replaced': list(self.replaced_transactions)}
+
+    def status(self) -> dict:
+        with self.lock:
+            return dict(self.snapshot)
+
+    def prometheus(self) -> str:
+        status = self.status()
+        lines = ["# HELP plunger_replacements_sent_total Replacement transactions sent by the daemon.",
+                 "# TYPE plunger_replacements_sent_total counter",
+                 f"plunger_replacements_sent_total {self.replacements_sent}",
+                 "# HELP plunger_pending_transactions Pending transactions of each watched address.",
+                 "# TYPE plunger_pending_transactions gauge"]
+        lines += [f'plunger_pending_transactions{{address="{address}"}} {len(transactions)}'
+                  for address, transactions in status.get('addresses', {}).items()]
+        if 'block_number' in status:
+            lines += ["# HELP plunger_block_number Block the pending transactions have been last checked at.",
+                      "# TYPE plunger_block_number gauge",
+                      f"plunger_block_number {status['block_number']}"]
+        return "\n".join(lines) + "\n" + self.plunger.session.metrics.prometheus()
@@ -0,0 +1,84 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Optional
+
+FEE_NAMES = ['gas_price', 'max_fee_per_gas', 'max_priority_fee_per_gas']
+
+
+class Escalation:
+    # Keeps track of the replacement transactions which have been sent, and tells which of them have stayed
+    # pending for `blocks` blocks since they were first seen waiting, so they can be sent again with their fees
+    # multiplied by `multiplier`. Each nonce gets at most `max_attempts` replacements, the first one included,
+    # and fees never go above `max_price`, so getting a nonce unstuck takes a bounded number of blocks.
+    def __init__(self, blocks: int, multiplier: float, max_attempts: int, max_price: Optional[int] = None, min_bump: float = 0):
+        assert isinstance(blocks, int)
+        assert isinstance(multiplier, (int, float))
+        assert isinstance(max_attempts, int)
+        assert isinstance(max_price, int) or (max_price is None)
+        assert isinstance(min_bump, (int, float))
+
+        self.blocks = blocks
+        self.multiplier = multiplier
+        self.max_attempts = max_attempts
+        self.max_price = max_price
+        self.min_bump = min_bump
+        self.replacements = {}
+
+    def track(self, address: str, results: list):
+        # Starts following the replacements which have been sent successfully, as reported by `Plunger.override`
+        for result in results:
+            if 'tx_hash' in result:
+                self.record(address, result['nonce'], {name: result[name] for name in FEE_NAMES if name in result}, None, 1)
+
+    def record(self, address: str, nonce: int, fees: dict, block_number: Optional[int], attempts: int):
+        # The age of a replacement is counted from the first block it has been seen pending in
+        self.replacements[(address, nonce)] = (fees, block_number, attempts)
+
+    def due(self, block_number: int, last_nonces: dict) -> list:
+        # Forget the nonces which have been mined, then return the replacements to escalate as
+        # `(address, nonce, fees, blocks pending, attempts)`, in the order of their nonces
+        self.replacements = {(address, nonce): replacement for (address, nonce), replacement in self.replacements.items()
+                             if address not in last_nonces or nonce > last_nonces[address]}
+
+        due = []
+        for (address, nonce), (fees, sent_block, attempts) in sorted(self.replacements.items()):
+            if sent_block is None:
+                self.record(address, nonce, fees, block_number, attempts)
+            elif block_number - sent_block >= self.blocks and attempts < self.max_attempts:
+                due.append((address, nonce, fees, block_number - sent_block, attempts))
+        return due
+
+    def give_up(self, address: str, nonce: int):
+        fees, sent_block, _ = self.replacements[(address, nonce)]
+        self.record(address, nonce, fees, sent_block, self.max_attempts)
+
+    def escalated_fees(self, fees: dict, market_fees: dict) -> Optional[dict]:
+        # Each fee gets multiplied, or raised to what the market pays now if that is higher, and then capped.
+        # If the cap does not leave room for the minimum bump the node requires, there is no point in sending it.
+        multiplier = round(self.multiplier * 10000)
+        min_bump = round(self.min_bump * 100)
+
+        escalated = {}
+        for name, fee in fees.items():
+            escalated_fee = max(-(-fee * multiplier // 10000), market_fees.get(name, 0))
+            if self.max_price is not None:
+                escalated_fee = min(escalated_fee, self.max_price)
+            if escalated_fee < -(-fee * (10000 + min_bump) // 10000):
+                return None
+            escalated[name] = escalated_fee
+        return escalated
@@ -0,0 +1,88 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+from typing import Callable, Optional
+
+from plunger.cache import is_fresh, read_cache, write_cache
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".plunger", "gas_price.json")
+DEFAULT_CACHE_TTL = 30
+DEFAULT_TIMEOUT = 10
+
+
+class SmartGasPrice:
+    # The fastest gas price reported by a gas price client (a pygasprice-client `Aggregator`), which is only
+    # created once a price is actually needed. The client fetches prices in the background, so instead of
+    # waiting a fixed time we poll it until it has one, giving up after `timeout`. The last price is kept
+    # in `cache_file` for `cache_ttl` seconds, so runs following each other do not need to wait at all.
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, client_factory: Callable, timeout: float = DEFAULT_TIMEOUT,
+                 cache_file: str = DEFAULT_CACHE, cache_ttl: float = DEFAULT_CACHE_TTL):
+        assert callable(client_factory)
+        assert isinstance(timeout, (int, float))
+        assert isinstance(cache_file, str)
+        assert isinstance(cache_ttl, (int, float))
+
+        self.client_factory = client_factory
+        self.timeout = timeout
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        self.client = None
+
+    def fastest_price(self) -> Optional[int]:
+        # Once the client is running, its price is always the most recent one
+        if self.client is not None:
+            return self.wait_for_price(0)
+
+        price = self.read_cache()
+        if price is not None:
+            return price
+
+        self.client = self.client_factory()
+        return self.wait_for_price(self.timeout)
+
+    def wait_for_price(self, timeout: float) -> Optional[int]:
+        deadline = time.monotonic() + timeout
+        while True:
+            price = self.client.fastest_price()
+            if price is not None:
+                self.write_cache(price)
+                return price
+            if time.monotonic() >= deadline:
+                return self.read_cache()
+            time.sleep(self.POLL_INTERVAL)
+
+    def read_cache(self) -> Optional[int]:
+        if self.cache_ttl <= 0:
+            return None
+
+        cached = read_cache(self.cache_file)
+        try:
+            if is_fresh(cached['timestamp'], self.cache_ttl):
+                return int(cached['fastest_price'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def write_cache(self, price: int):
+        if self.cache_ttl <= 0:
+            return
+
+        write_cache(self.cache_file, {'fastest_price': price, 'timestamp': time.time()})
@@ -16,49 +16,169 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import getpass
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 
+import rlp
 from eth_account import Account
+from eth_account.signers.local import LocalAccount
+from eth_keys import keys
+from eth_utils import keccak
+from hexbytes import HexBytes
 from web3 import Web3
 from web3.middleware import construct_sign_and_send_raw_middleware
 
+from plunger.agent import keystore_id
+from plunger.rpc import RpcSession, rpc_call
 
-def register_keys(web3: Web3, keys: Optional[list]):
-    for key in keys or []:
-        register_key(web3, key)
+
+def register_keys(web3: Web3, keys: Optional[list], cache=None, workers: Optional[int] = None) -> list:
+    # If a `KeyCache` or a `KeyAgentClient` is passed as `cache`, each keystore gets decrypted only once.
+    # All passwords are read (and asked for) first, then the keystores which are not cached are decrypted
+    # in parallel by up to `workers` processes (one per core by default), as scrypt is CPU-bound and holds
+    # the GIL. Accounts are returned and their middlewares added in the order the keys were given.
+    assert(isinstance(web3, Web3))
+    assert(isinstance(workers, int) or (workers is None))
+
+    keystores = [read_keystore(*parse_key(key)) for key in keys or []]
+
+    private_keys = {}
+    pending = {}
+    for key_file, pass_file, read_key, key_id in keystores:
+        if key_id in private_keys or key_id in pending:
+            continue
+
+        private_key = cache.get(key_id) if cache is not None else None
+        if private_key is not None:
+            private_keys[key_id] = private_key
+        else:
+            pending[key_id] = (read_key, read_password(key_file, pass_file))
+
+    for key_id, private_key in zip(pending.keys(), decrypt_keystores(list(pending.values()), workers)):
+        private_keys[key_id] = private_key
+        if cache is not None:
+            cache.put(key_id, private_key)
+
+    return [register_private_key(web3, private_keys[key_id]) for _, _, _, key_id in keystores]
 
 
-def register_key(web3: Web3, key: str):
+def register_key(web3: Web3, key: str, cache=None) -> LocalAccount:
     assert(isinstance(web3, Web3))
 
+    return register_key_file(web3, *parse_key(key), cache)
+
+
+def register_key_file(web3: Web3, key_file: str, pass_file: Optional[str] = None, cache=None) -> LocalAccount:
+    assert(isinstance(web3, Web3))
+    assert(isinstance(key_file, str))
+    assert(isinstance(pass_file, str) or (pass_file is None))
+
+    _, _, read_key, key_id = read_keystore(key_file, pass_file)
+
+    # No need to ask for the password if the key has been decrypted already
+    private_key = cache.get(key_id) if cache is not None else None
+    if private_key is None:
+        private_key = decrypt_keystore(read_key, read_password(key_file, pass_file))
+        if cache is not None:
+            cache.put(key_id, private_key)
+
+    return register_private_key(web3, private_key)
+
+
+def parse_key(key: str) -> tuple:
     parsed = {}
     for p in key.split(","):
         var, val = p.split("=")
         parsed[var] = val
 
-    register_key_file(web3, parsed.get('key_file'), parsed.get('pass_file', None))
-
+    return parsed.get('key_file'), parsed.get('pass_file', None)
 
-def register_key_file(web3: Web3, key_file: str, pass_file: Optional[str] = None):
-    assert(isinstance(web3, Web3))
-    assert(isinstance(key_file, str))
-    assert(isinstance(pass_file, str) or (pass_file is None))
 
+def read_keystore(key_file: str, pass_file: Optional[str]) -> tuple:
     with open(key_file) as key_file_open:
         read_key = key_file_open.read()
-        if pass_file:
-            with open(pass_file) as pass_file_open:
-                read_pass = pass_file_open.read().replace("\n", "")
-        else:
-            read_pass = getpass.getpass(prompt=f"Password for {key_file}: ")
 
-        private_key = Account.decrypt(read_key, read_pass)
-        register_private_key(web3, private_key)
+    return key_file, pass_file, read_key, keystore_id(key_file, read_key)
+
+
+def read_password(key_file: str, pass_file: Optional[str]) -> str:
+    if pass_file:
+        with open(pass_file) as pass_file_open:
+            return pass_file_open.read().replace("\n", "")
+    else:
+        return getpass.getpass(prompt=f"Password for {key_file}: ")
+
+
+def decrypt_keystore(read_key: str, read_pass: str) -> bytes:
+    return bytes(Account.decrypt(read_key, read_pass))
+
+
+def decrypt_keystores(keystores: list, workers: Optional[int] = None) -> list:
+    # Decrypts `(keystore, password)` pairs, returning the private keys in the same order
+    workers = min(len(keystores), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return [decrypt_keystore(read_key, read_pass) for read_key, read_pass in keystores]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(decrypt_keystore, *zip(*keystores)))
 
 
-def register_private_key(web3: Web3, private_key):
+def register_private_key(web3: Web3, private_key) -> LocalAccount:
     assert(isinstance(web3, Web3))
 
     account = Account.privateKeyToAccount(private_key)
 
     web3.middleware_onion.add(construct_sign_and_send_raw_middleware(account))
+    return account
+
+
+class LocalSigner:
+    # Builds and signs replacement transactions fully locally. A zero-value transfer to ourselves always
+    # costs 21000 gas, the chain id is known upfront and the nonce comes from the caller, so unlike
+    # `construct_sign_and_send_raw_middleware` there is nothing to ask the node for and only
+    # `eth_sendRawTransaction` goes over the wire.
+    GAS = 21000
+
+    def __init__(self, account: LocalAccount, chain_id: int):
+        assert isinstance(account, LocalAccount)
+        assert isinstance(chain_id, int)
+
+        self.account = account
+        self.chain_id = chain_id
+
+    @property
+    def address(self) -> str:
+        return self.account.address
+
+    def sign_replacement(self, nonce: int, gas_price: Optional[int] = None, max_fee_per_gas: Optional[int] = None,
+                         max_priority_fee_per_gas: Optional[int] = None) -> str:
+        assert isinstance(nonce, int)
+        assert isinstance(gas_price, int) or (gas_price is None)
+        assert isinstance(max_fee_per_gas, int) or (max_fee_per_gas is None)
+        assert isinstance(max_priority_fee_per_gas, int) or (max_priority_fee_per_gas is None)
+
+        if max_fee_per_gas is not None:
+            return self.sign_dynamic_fee_replacement(nonce, max_fee_per_gas, max_priority_fee_per_gas)
+
+        signed = self.account.signTransaction({'to': self.account.address,
+                                               'gas': self.GAS,
+                                               'gasPrice': gas_price,
+                                               'nonce': nonce,
+                                               'value': 0,
+                                               'chainId': self.chain_id})
+        return Web3.toHex(signed.rawTransaction)
+
+    def sign_dynamic_fee_replacement(self, nonce: int, max_fee_per_gas: int, max_priority_fee_per_gas: int) -> str:
+        # `eth_account` cannot sign EIP-1559 transactions yet, so they are encoded as defined by EIP-2718 and EIP-1559:
+        # the type byte followed by the RLP of the fields, with an empty access list, signed over the Keccak hash
+        # of the same without the signature
+        fields = [self.chain_id, nonce, max_priority_fee_per_gas, max_fee_per_gas, self.GAS,
+                  bytes.fromhex(self.account.address[2:]), 0, b'', []]
+        signature = keys.PrivateKey(self.account.key).sign_msg_hash(keccak(b'\x02' + rlp.encode(fields)))
+        return Web3.toHex(b'\x02' + rlp.encode(fields + [signature.v, signature.r, signature.s]))
+
+    def send_replacement(self, session: RpcSession, endpoint_uri: str, nonce: int, gas_price: Optional[int] = None,
+                         max_fee_per_gas: Optional[int] = None, max_priority_fee_per_gas: Optional[int] = None) -> HexBytes:
+        raw_transaction = self.sign_replacement(nonce, gas_price, max_fee_per_gas, max_priority_fee_per_gas)
+        return HexBytes(rpc_call(session, endpoint_uri, "eth_sendRawTransaction", [raw_transaction]))
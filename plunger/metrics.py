@@ -0,0 +1,124 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import threading
+from collections import Counter
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last bucket takes everything slower
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BATCH = "batch"
+
+
+class RequestStats:
+    def __init__(self):
+        self.requests = 0
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def json(self) -> dict:
+        return {'requests': self.requests,
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'seconds': self.seconds,
+                'max_seconds': self.max_seconds,
+                'latency_buckets': {str(bound): count for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], self.buckets)},
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes}
+
+
+class RpcMetrics:
+    # What the HTTP requests sent to the node (by web3 and by plunger itself) took: counts, latency histograms,
+    # sizes, transport retries and failures. Requests with a single JSON-RPC call are grouped by its method,
+    # requests with more calls are grouped as `batch`, and the calls they carry are counted by method as well.
+    # Requests are sent from many threads, by discovery sources and by the daemon API.
+    def __init__(self):
+        self.requests = {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, methods: list, seconds: float, request_bytes: int, response_bytes: int, retries: int = 0, error: bool = False):
+        assert isinstance(methods, list)
+        assert isinstance(seconds, float)
+
+        name = methods[0] if len(methods) == 1 else BATCH
+        with self.lock:
+            stats = self.requests.setdefault(name, RequestStats())
+            stats.requests += 1
+            stats.calls += len(methods)
+            stats.errors += 1 if error else 0
+            stats.retries += retries
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            self.calls.update(methods)
+
+    def json(self) -> dict:
+        with self.lock:
+            return {'requests': {name: stats.json() for name, stats in sorted(self.requests.items())},
+                    'calls': dict(sorted(self.calls.items()))}
+
+    def summary(self) -> list:
+        # One line per request type, the slowest in total first
+        with self.lock:
+            by_time = sorted(self.requests.items(), key=lambda item: item[1].seconds, reverse=True)
+            return [f"{name}: {stats.requests} request(s) with {stats.calls} call(s), {stats.seconds:.3f}s in total,"
+                    f" {stats.seconds / stats.requests * 1000:.1f}ms average, {stats.max_seconds * 1000:.1f}ms max,"
+                    f" {stats.request_bytes} bytes sent, {stats.response_bytes} bytes received"
+                    + (f", {stats.retries} retries" if stats.retries > 0 else "")
+                    + (f", {stats.errors} failed" if stats.errors > 0 else "")
+                    for name, stats in by_time]
+
+    def prometheus(self) -> str:
+        # The Prometheus text exposition format, with the latency histogram buckets being cumulative
+        lines = ["# HELP plunger_rpc_requests_total HTTP requests sent to the node.",
+                 "# TYPE plunger_rpc_requests_total counter"]
+        with self.lock:
+            requests = sorted(self.requests.items())
+            calls = sorted(self.calls.items())
+        for metric, field, description in [('requests_total', 'requests', None),
+                                           ('request_errors_total', 'errors', "HTTP requests to the node which failed."),
+                                           ('request_retries_total', 'retries', "Retries of HTTP requests to the node."),
+                                           ('request_bytes_total', 'request_bytes', "Bytes sent to the node."),
+                                           ('response_bytes_total', 'response_bytes', "Bytes received from the node.")]:
+            if description is not None:
+                lines += [f"# HELP plunger_rpc_{metric} {description}", f"# TYPE plunger_rpc_{metric} counter"]
+            lines += [f'plunger_rpc_{metric}{{method="{name}"}} {getattr(stats, field)}' for name, stats in requests]
+
+        lines += ["# HELP plunger_rpc_calls_total JSON-RPC calls sent to the node, batched or not.",
+                  "# TYPE plunger_rpc_calls_total counter"]
+        lines += [f'plunger_rpc_calls_total{{method="{method}"}} {count}' for method, count in calls]
+
+        lines += ["# HELP plunger_rpc_request_duration_seconds Time HTTP requests to the node took.",
+                  "# TYPE plunger_rpc_request_duration_seconds histogram"]
+        for name, stats in requests:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], stats.buckets):
+                cumulative += count
+                lines.append(f'plunger_rpc_request_duration_seconds_bucket{{method="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'plunger_rpc_request_duration_seconds_sum{{method="{name}"}} {stats.seconds}')
+            lines.append(f'plunger_rpc_request_duration_seconds_count{{method="{name}"}} {stats.requests}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,70 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Optional
+
+
+def stuck_fees(transactions) -> dict:
+    # The highest fee cap and tip paid by the pending transactions with each nonce, both of which
+    # a replacement has to bump. A legacy gas price acts as both of them.
+    fees = {}
+    for transaction in transactions:
+        if transaction.max_fee_per_gas is not None:
+            fee_cap = transaction.max_fee_per_gas
+            tip = transaction.max_priority_fee_per_gas if transaction.max_priority_fee_per_gas is not None else fee_cap
+        elif transaction.gas_price is not None:
+            fee_cap = tip = transaction.gas_price
+        else:
+            continue
+        stuck_fee_cap, stuck_tip = fees.get(transaction.nonce, (0, 0))
+        fees[transaction.nonce] = (max(fee_cap, stuck_fee_cap), max(tip, stuck_tip))
+    return fees
+
+
+def plan_replacements(last_nonce: int, transactions: list) -> list:
+    # Plans the replacement transactions for the pending `transactions` of an address the last mined nonce
+    # of which is `last_nonce`, as `(nonce, stuck fees)` pairs in the order they have to be sent. Stuck fees
+    # are these of the pending transactions the replacement replaces, or `None` if it fills a gap.
+    #
+    # Transactions with nonces which have already been mined are skipped, and the ones sharing a nonce get
+    # a single replacement, bumped over the highest fees among them. Each pending nonce gets one replacement,
+    # but these take consecutive nonces from `last_nonce + 1`, so a nonce gap gets filled by the replacement
+    # of the transaction right after it, and each replacement can get mined as soon as the previous one has.
+    fees = stuck_fees(transaction for transaction in transactions if transaction.nonce > last_nonce)
+    nonces = sorted(set(transaction.nonce for transaction in transactions if transaction.nonce > last_nonce))
+
+    plan = []
+    for index, nonce in enumerate(nonces):
+        replacement_nonce = min(nonce, last_nonce + 1 + index)
+        plan.append((replacement_nonce, fees.get(replacement_nonce)))
+    return plan
+
+
+def clearing_nonces(last_nonce: int, transactions: list, gas_price: int, base_fee: Optional[int] = None) -> set:
+    # Pending nonces which will clear on their own: all nonces from `last_nonce + 1` up to them are pending,
+    # and their transactions already pay at least `gas_price` per gas in the next block, which for EIP-1559
+    # transactions is the base fee and their tip, up to their fee cap.
+    fees = stuck_fees(transaction for transaction in transactions if transaction.nonce > last_nonce)
+
+    clearing = set()
+    nonce = last_nonce + 1
+    while nonce in fees:
+        fee_cap, tip = fees[nonce]
+        if (fee_cap if base_fee is None else min(fee_cap, base_fee + tip)) >= gas_price:
+            clearing.add(nonce)
+        nonce += 1
+    return clearing
@@ -16,135 +16,420 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
-import requests
 import sys
 import time
 import json
+from typing import Optional
 
-from plunger.keys import register_key
-from texttable import Texttable
-from web3 import Web3, HTTPProvider
-from pygasprice_client.aggregator import Aggregator
+# Only lightweight modules are imported upfront. `requests`, `web3` (which brings `eth_account` with it),
+# `websockets`, `texttable` and `pygasprice_client` take hundreds of milliseconds to import, so they are
+# imported by the code paths which need them, and `--help` or `--list` do not have to wait for all of them.
+from plunger.agent import KeyAgentClient, KeyCache
+from plunger.chains import ChainCache, chain_name
+from plunger.gas import DEFAULT_CACHE_TTL, DEFAULT_TIMEOUT, SmartGasPrice
+from plunger.stream import CHUNK_SIZE, iter_items, iter_until
+
+
+def hex_to_int(value: Optional[str]) -> Optional[int]:
+    return int(value, 16) if value is not None else None
+
+
+def hex_to_bytes(value: Optional[str]) -> Optional[bytes]:
+    return bytes.fromhex(value[2:] if value.startswith('0x') else value) if value is not None else None
 
 
 class Transaction:
-    def __init__(self, tx_hash: str, nonce: int):
+    # A pending transaction as reported by the node. Only `tx_hash` and `nonce` identify it, the remaining fields
+    # are kept so replacements can be priced from what the transaction itself pays. Transaction pools can hold
+    # hundreds of thousands of them, so the fields are stored as ints and raw bytes in slots, without a `__dict__`.
+    __slots__ = ('tx_hash', 'nonce', 'gas_price', 'max_fee_per_gas', 'max_priority_fee_per_gas', 'value', 'to', 'data')
+
+    def __init__(self, tx_hash: str, nonce: int, gas_price: Optional[int] = None, max_fee_per_gas: Optional[int] = None,
+                 max_priority_fee_per_gas: Optional[int] = None, value: int = 0, to: Optional[bytes] = None, data: bytes = b''):
         assert isinstance(tx_hash, str)
         assert isinstance(nonce, int)
+        assert isinstance(gas_price, int) or (gas_price is None)
+        assert isinstance(max_fee_per_gas, int) or (max_fee_per_gas is None)
+        assert isinstance(max_priority_fee_per_gas, int) or (max_priority_fee_per_gas is None)
+        assert isinstance(value, int)
+        assert isinstance(to, bytes) or (to is None)
+        assert isinstance(data, bytes)
         self.tx_hash = tx_hash
         self.nonce = nonce
+        self.gas_price = gas_price
+        self.max_fee_per_gas = max_fee_per_gas
+        self.max_priority_fee_per_gas = max_priority_fee_per_gas
+        self.value = value
+        self.to = to
+        self.data = data
+
+    @staticmethod
+    def from_json(item: dict):
+        # Converts a transaction in the JSON-RPC format, as returned by all the sources
+        return Transaction(tx_hash=item['hash'],
+                           nonce=int(item['nonce'], 16),
+                           gas_price=hex_to_int(item.get('gasPrice')),
+                           max_fee_per_gas=hex_to_int(item.get('maxFeePerGas')),
+                           max_priority_fee_per_gas=hex_to_int(item.get('maxPriorityFeePerGas')),
+                           value=hex_to_int(item.get('value')) or 0,
+                           to=hex_to_bytes(item.get('to')),
+                           data=hex_to_bytes(item.get('input')) or b'')
 
     def __eq__(self, other):
-        return self.tx_hash == other.tx_hash and \
+        return isinstance(other, Transaction) and \
+               self.tx_hash == other.tx_hash and \
                self.nonce == other.nonce
 
     def __hash__(self):
-        return hash(self.tx_hash) + hash(self.nonce)
+        return hash((self.tx_hash, self.nonce))
+
+    def __repr__(self):
+        return f"Transaction(tx_hash={self.tx_hash!r}, nonce={self.nonce})"
+
+
+class AddressFileArgumentParser(argparse.ArgumentParser):
+    # Addresses can also be read from `@file`, one per line, each optionally followed by the `--eth-key`
+    # to use for unlocking it. Empty lines and everything after `#` are ignored.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, fromfile_prefix_chars='@', **kwargs)
+        self.file_keys = []
+
+    def convert_arg_line_to_args(self, arg_line: str) -> list:
+        fields = arg_line.split('#')[0].split()
+        if len(fields) > 1:
+            self.file_keys.append(fields[1])
+        return fields[:1]
 
 
 class Plunger:
     SOURCE_PARITY_TXQUEUE = "parity_txqueue"
     SOURCE_JSONRPC_GETBLOCK = "jsonrpc_getblock"
+    SOURCE_PARITY_TXQUEUE_FROM = "parity_txqueue_from"
+    SOURCE_GETH_TXPOOL = "geth_txpool"
+    SOURCE_AUTO = "auto"
+    SOURCES = [SOURCE_PARITY_TXQUEUE, SOURCE_JSONRPC_GETBLOCK, SOURCE_PARITY_TXQUEUE_FROM, SOURCE_GETH_TXPOOL]
+
+    DISCOVERY_MERGE = "merge"
+    DISCOVERY_FIRST = "first"
+
+    WAIT_AUTO = "auto"
+    WAIT_SUBSCRIBE = "subscribe"
+    WAIT_FILTER = "filter"
+    WAIT_POLL = "poll"
+
+    REPLACEMENT_AUTO = "auto"
+    REPLACEMENT_LEGACY = "legacy"
+    REPLACEMENT_EIP1559 = "eip1559"
+
+    SUBSCRIPTION_MAX_INTERVAL = 60
+
+    STUCK_BLOCKS = 5
+    STUCK_SECONDS = 300
+    MIN_BUMP = 12.5
+    ESCALATE_MULTIPLIER = 1.2
+    ESCALATE_MAX_ATTEMPTS = 5
 
     def __init__(self, args: list):
         # Define basic arguments
-        parser = argparse.ArgumentParser(prog='plunger')
-        parser.add_argument("address", help="Ethereum address to check for pending transactions", type=str)
+        parser = AddressFileArgumentParser(prog='plunger')
+        parser.add_argument("address", help="Ethereum address(es) to check for pending transactions,"
+                                            " or @FILE with one `ADDRESS [ETH_KEY]` per line", type=str, nargs='+')
         parser.add_argument("--rpc-host", help="JSON-RPC host (default: `localhost')", default="localhost", type=str)
         parser.add_argument("--rpc-port", help="JSON-RPC port (default: `8545')", default=8545, type=int)
+        parser.add_argument("--rpc-timeout", help="JSON-RPC timeout (in seconds, default: `10')", default=10, type=float)
+        parser.add_argument("--rpc-pool-size", help="Maximum number of JSON-RPC connections kept alive (default: `10')", default=10, type=int)
+        parser.add_argument("--rpc-retries", help="Number of retries if connecting to JSON-RPC fails (default: `3')", default=3, type=int)
+        parser.add_argument("--chain-cache-ttl", help="Time (in seconds) to reuse the client version and chain id fetched by"
+                                                      " an earlier run from the same JSON-RPC endpoint for, 0 disables caching"
+                                                      " (default: `0')", default=0, type=float)
+        parser.add_argument("--rpc-ws-url", help="WebSocket JSON-RPC endpoint (e.g. `ws://localhost:8546') to subscribe to new blocks"
+                                                 " while waiting", default=None, type=str)
         parser.add_argument("--gas-price", help="Gas price (in Wei) for overriding transactions", default=0, type=int)
+        parser.add_argument("--bump-stuck-price", help="Price each replacement transaction at least `--min-bump' percent above"
+                                                       " the pending transaction it replaces, if the gas price it would get"
+                                                       " otherwise is lower (EIP-1559 replacements always are)",
+                            dest='bump_stuck_price', action='store_true')
+        parser.add_argument("--skip-clearing", help="Do not replace pending transactions which already pay at least"
+                                                    " the gas price a replacement would, and have no nonce gap below them,"
+                                                    " as they will get mined on their own",
+                            dest='skip_clearing', action='store_true')
+        parser.add_argument("--min-bump", help=f"Minimum gas price increase (in percent) the node requires from"
+                                               f" a replacement transaction (default: `{self.MIN_BUMP}')",
+                            default=self.MIN_BUMP, type=float)
+        parser.add_argument("--escalate-blocks", help="Send replacement transactions again at a higher gas price each time"
+                                                      " they stay pending for this many blocks (default: not escalated)",
+                            default=None, type=int)
+        parser.add_argument("--escalate-multiplier", help=f"What to multiply the gas price of a replacement transaction by when"
+                                                          f" escalating it (default: `{self.ESCALATE_MULTIPLIER}')",
+                            default=self.ESCALATE_MULTIPLIER, type=float)
+        parser.add_argument("--escalate-max-price", help="Gas price (in Wei) never to escalate replacement transactions above"
+                                                         " (default: no limit)", default=None, type=int)
+        parser.add_argument("--escalate-max-attempts", help=f"Maximum number of replacement transactions to send for each nonce,"
+                                                            f" the first one included (default: `{self.ESCALATE_MAX_ATTEMPTS}')",
+                            default=self.ESCALATE_MAX_ATTEMPTS, type=int)
+        parser.add_argument("--replacement-type", help="Whether to send legacy or EIP-1559 replacement transactions;"
+                                                       " `auto' sends EIP-1559 ones if the latest block has a base fee (default: `auto')",
+                            choices=[self.REPLACEMENT_AUTO, self.REPLACEMENT_LEGACY, self.REPLACEMENT_EIP1559], default=self.REPLACEMENT_AUTO)
         parser.add_argument("--source", help=f"Comma-separated list of sources to use for pending transaction discovery"
-                                             f" (available: {self.SOURCE_PARITY_TXQUEUE}, {self.SOURCE_JSONRPC_GETBLOCK})",
+                                             f" (available: {', '.join(self.SOURCES)}, or {self.SOURCE_AUTO} to pick"
+                                             f" the cheapest one supported by the node)",
                             type=lambda x: x.split(','), required=True)
+        parser.add_argument("--source-timeout", help="Time (in seconds) to wait for a discovery source to respond,"
+                                                     " sources which do not respond in time are ignored (default: `30')",
+                            default=30, type=float)
+        parser.add_argument("--discovery-mode", help="Whether to merge the transactions found by all sources,"
+                                                     " or to take the ones found by the first source to respond (default: `merge')",
+                            choices=[self.DISCOVERY_MERGE, self.DISCOVERY_FIRST], default=self.DISCOVERY_MERGE)
+        parser.add_argument("--wait-mode", help="How to find out about new blocks while waiting: subscribe to them over"
+                                                " `--rpc-ws-url', poll a block filter, or poll the latest block as often as the observed"
+                                                " block time suggests; `auto' tries them in this order (default: `auto')",
+                            choices=[self.WAIT_AUTO, self.WAIT_SUBSCRIBE, self.WAIT_FILTER, self.WAIT_POLL], default=self.WAIT_AUTO)
+        parser.add_argument("--poll-min-interval", help="Shortest interval (in seconds) between polls of the node while waiting,"
+                                                        " used when a block is due (default: `1')", default=1, type=float)
+        parser.add_argument("--poll-max-interval", help="Longest interval (in seconds) between polls of the node while waiting,"
+                                                        " reached by backing off when nothing changes (default: `15')",
+                            default=15, type=float)
         parser.add_argument("-j", '--json', help="Generate result as JSON", dest='json', action='store_true')
+        parser.add_argument('--stats', help="Print JSON-RPC statistics to stderr when done, as JSON with `--json'",
+                            dest='stats', action='store_true')
 
         # Define mutually exclusive action arguments
         action = parser.add_mutually_exclusive_group(required=True)
         action.add_argument('--list', help="List pending transactions", dest='list', action='store_true')
         action.add_argument('--wait', help="Wait for the pending transactions to clear", dest='wait', action='store_true')
         action.add_argument('--override-with-zero-txs', help="Override the pending transactions with zero-value txs", dest='override', action='store_true')
+        action.add_argument('--daemon', help="Keep running, overriding pending transactions once they get stuck", dest='daemon', action='store_true')
+        parser.add_argument('--pipeline', help="Fix the gas price once, sign all replacement transactions upfront"
+                                               " and send them to the node in one batch", dest='pipeline', action='store_true')
+
+        parser.add_argument("--stuck-blocks", help=f"With `--daemon', number of blocks after which a pending transaction"
+                                                   f" is considered stuck (default: `{self.STUCK_BLOCKS}')",
+                            default=self.STUCK_BLOCKS, type=int)
+        parser.add_argument("--stuck-seconds", help=f"With `--daemon', time (in seconds) after which a pending transaction"
+                                                    f" is considered stuck (default: `{self.STUCK_SECONDS}')",
+                            default=self.STUCK_SECONDS, type=float)
+        parser.add_argument("--api-host", help="With `--daemon', host to serve the HTTP API on (default: `localhost')",
+                            default="localhost", type=str)
+        parser.add_argument("--api-port", help="With `--daemon', port to serve the HTTP API on (default: not served)",
+                            default=None, type=int)
 
         # Define arguments for smart gas client
         parser.add_argument("-s", '--smart-gas', help="Use smart gas strategy to plunge", dest='smart_gas', action='store_true')
         parser.add_argument("--ethgasstation-api-key", type=str, default=None, help="ethgasstation API key")
         parser.add_argument("--etherscan-api-key", type=str, default=None, help="etherscan API key")
         parser.add_argument("--poanetwork-url", type=str, default=None, help="Alternative POANetwork URL")
-
-        parser.add_argument("--eth-key", type=str,
-                            help="Ethereum private key to use (e.g. 'key_file=aaa.json,pass_file=aaa.pass') for unlocking account")
+        parser.add_argument("--smart-gas-timeout", type=float, default=DEFAULT_TIMEOUT,
+                            help=f"Maximum time (in seconds) to wait for the smart gas price, after which the gas price"
+                                 f" suggested by the node is used (default: `{DEFAULT_TIMEOUT}')")
+        parser.add_argument("--smart-gas-cache-ttl", type=float, default=DEFAULT_CACHE_TTL,
+                            help=f"Time (in seconds) to reuse the smart gas price fetched by an earlier run for,"
+                                 f" 0 disables caching (default: `{DEFAULT_CACHE_TTL}')")
+
+        parser.add_argument("--eth-key", type=str, action='append',
+                            help="Ethereum private key to use (e.g. 'key_file=aaa.json,pass_file=aaa.pass') for unlocking account,"
+                                 " can be specified multiple times")
+        parser.add_argument("--key-agent", type=str, default=None, metavar='SOCKET',
+                            help=f"Reuse keys decrypted by earlier runs, kept by `plunger-agent' listening on SOCKET"
+                                 " (`plunger-agent' listens on `~/.plunger/agent.sock' by default)")
+        parser.add_argument("--key-ttl", type=float, default=None,
+                            help="Time (in seconds) for the key agent to keep keys decrypted by this run for"
+                                 " (default: the TTL of the agent)")
 
         # Parse the arguments, validate source
         self.arguments = parser.parse_args(args)
+        if self.arguments.wait_mode == self.WAIT_SUBSCRIBE and self.arguments.rpc_ws_url is None:
+            print(f"`--wait-mode {self.WAIT_SUBSCRIBE}` requires `--rpc-ws-url`.", file=sys.stderr)
+            exit(-1)
+        if not 0 < self.arguments.poll_min_interval <= self.arguments.poll_max_interval:
+            print(f"`--poll-min-interval` has to be positive and not greater than `--poll-max-interval`.", file=sys.stderr)
+            exit(-1)
 
-        # Initialize pending transactions list
-        self.transactions = []
+        # Initialize pending transactions of each address
+        self.addresses = list(dict.fromkeys(self.arguments.address))
+        self.transactions = {}
+        self.wait_stats = None
 
-        # Initialize web3.py
+        # Initialize the JSON-RPC session, web3.py is only initialized once it is needed
+        from plunger.rpc import RpcSession
         if self.arguments.rpc_host.startswith("http"):
-            endpoint_uri = f"{self.arguments.rpc_host}:{self.arguments.rpc_port}"
+            self.endpoint_uri = f"{self.arguments.rpc_host}:{self.arguments.rpc_port}"
         else:
-            endpoint_uri = f"http://{self.arguments.rpc_host}:{self.arguments.rpc_port}"
-        self.web3 = Web3(HTTPProvider(endpoint_uri=endpoint_uri))
-        self.web3.eth.defaultAccount = self.arguments.address
-        if self.arguments.eth_key:
-            register_key(self.web3, self.arguments.eth_key)
-
-        if self.arguments.smart_gas:
-            self.gas_client = Aggregator(refresh_interval=60, expiry=600,
-                                         ethgasstation_api_key=self.arguments.ethgasstation_api_key,
-                                         poa_network_alt_url=self.arguments.poanetwork_url,
-                                         etherscan_api_key=self.arguments.etherscan_api_key,
-                                         gasnow_app_name="makerdao/plunger")
-            # wait for gas price client to become available
-            time.sleep(5)
+            self.endpoint_uri = f"http://{self.arguments.rpc_host}:{self.arguments.rpc_port}"
+        self.session = RpcSession(pool_size=self.arguments.rpc_pool_size,
+                                  retries=self.arguments.rpc_retries,
+                                  timeout=self.arguments.rpc_timeout)
+        self._web3 = None
+        self.chain_cache = ChainCache(cache_ttl=self.arguments.chain_cache_ttl)
+
+        # The same keystore is decrypted only once, even if it is listed for many addresses
+        keys = (self.arguments.eth_key or []) + parser.file_keys
+        accounts = []
+        if len(keys) > 0:
+            from plunger.keys import register_keys
+            if self.arguments.key_agent is not None:
+                key_cache = KeyAgentClient(self.arguments.key_agent, ttl=self.arguments.key_ttl)
+            else:
+                key_cache = KeyCache()
+            accounts = register_keys(self.web3, keys, key_cache)
+
+        # Fetch node details and our nonces upfront, all in one round trip
+        self.client_version, self.chain_id, self.last_nonces, self.london = self.get_node_info()
+        if self.arguments.replacement_type == self.REPLACEMENT_EIP1559 and not self.london:
+            print("The latest block has no base fee, cannot send EIP-1559 replacement transactions.", file=sys.stderr)
+            exit(-1)
 
-        self.validate_sources(self.web3)
+        # Replacements for accounts we have the keys of are signed locally, with the chain id fetched above
+        self.signers = {}
+        if len(accounts) > 0:
+            from plunger.keys import LocalSigner
+            self.signers = {account.address.lower(): LocalSigner(account, self.chain_id) for account in accounts}
 
-    def validate_sources(self, web3):
+        # The gas price client only gets started once a replacement transaction is about to be sent
+        if self.arguments.smart_gas:
+            self.smart_gas = SmartGasPrice(self.gas_client, timeout=self.arguments.smart_gas_timeout,
+                                           cache_ttl=self.arguments.smart_gas_cache_ttl)
+
+        self.validate_sources()
+
+        # Replacements which stay pending get sent again at a higher price, which the node only accepts if it is
+        # at least the minimum bump higher
+        self.escalation = None
+        if self.arguments.escalate_blocks is not None:
+            if round(self.arguments.escalate_multiplier * 10000) < 10000 + round(self.arguments.min_bump * 100):
+                print(f"--escalate-multiplier has to be at least {1 + self.arguments.min_bump / 100},"
+                      f" otherwise replacements would get rejected.", file=sys.stderr)
+                exit(-1)
+
+            from plunger.escalation import Escalation
+            self.escalation = Escalation(self.arguments.escalate_blocks, self.arguments.escalate_multiplier,
+                                         self.arguments.escalate_max_attempts, self.arguments.escalate_max_price,
+                                         self.arguments.min_bump)
+
+    @property
+    def web3(self):
+        if self._web3 is None:
+            from web3 import Web3
+            from plunger.provider import SessionHTTPProvider
+            self._web3 = Web3(SessionHTTPProvider(endpoint_uri=self.endpoint_uri, session=self.session))
+            self._web3.eth.defaultAccount = self.addresses[0]
+        return self._web3
+
+    @web3.setter
+    def web3(self, web3):
+        self._web3 = web3
+
+    def gas_client(self):
+        from pygasprice_client.aggregator import Aggregator
+        return Aggregator(refresh_interval=60, expiry=600,
+                          ethgasstation_api_key=self.arguments.ethgasstation_api_key,
+                          poa_network_alt_url=self.arguments.poanetwork_url,
+                          etherscan_api_key=self.arguments.etherscan_api_key,
+                          gasnow_app_name="makerdao/plunger")
+
+    def validate_sources(self):
         # Check if only correct sources have been listed in the value of the `--source` argument
-        unknown_sources = set(self.arguments.source) - {self.SOURCE_PARITY_TXQUEUE, self.SOURCE_JSONRPC_GETBLOCK}
+        unknown_sources = set(self.arguments.source) - set(self.SOURCES) - {self.SOURCE_AUTO}
         if len(unknown_sources) > 0:
             print(f"Unknown source(s): {str(unknown_sources).replace('{', '').replace('}', '')}.", file=sys.stderr)
             exit(-1)
-        is_parity = 'parity' in web3.clientVersion.lower() or 'openethereum' in web3.clientVersion.lower()
+        client_version = self.client_version.lower()
+        is_parity = 'parity' in client_version or 'openethereum' in client_version
+        is_geth = client_version.startswith('geth')
+
+        # Replace `auto` with the cheapest source for this client, i.e. one which filters by sender on the node side
+        if self.SOURCE_AUTO in self.arguments.source:
+            if is_parity:
+                auto_source = self.SOURCE_PARITY_TXQUEUE_FROM
+            elif is_geth:
+                auto_source = self.SOURCE_GETH_TXPOOL
+            else:
+                auto_source = self.SOURCE_JSONRPC_GETBLOCK
+            self.arguments.source = list(dict.fromkeys(auto_source if source == self.SOURCE_AUTO else source
+                                                       for source in self.arguments.source))
+
         if self.SOURCE_PARITY_TXQUEUE in self.arguments.source and not is_parity:
             print(f"WARNING: {self.SOURCE_PARITY_TXQUEUE} requires Parity/OpenEthereum")
-        if self.SOURCE_JSONRPC_GETBLOCK in self.arguments.source and self.web3.eth.chainId == 42 and is_parity:
+        if self.SOURCE_PARITY_TXQUEUE_FROM in self.arguments.source and not is_parity:
+            print(f"WARNING: {self.SOURCE_PARITY_TXQUEUE_FROM} requires Parity/OpenEthereum")
+        if self.SOURCE_GETH_TXPOOL in self.arguments.source and not is_geth:
+            print(f"WARNING: {self.SOURCE_GETH_TXPOOL} requires geth")
+        if self.SOURCE_JSONRPC_GETBLOCK in self.arguments.source and self.chain_id == 42 and is_parity:
             print(f"WARNING: {self.SOURCE_JSONRPC_GETBLOCK} requires Parity/OpenEthereum in mining configuration on Kovan")
 
     def main(self):
-        # Get pending transactions
-        self.transactions = self.get_pending_transactions()
-
-        # List pending transactions, alternatively say there are none
-        self.list(self.transactions)
-
-        # If there is at least one pending transaction...
-        if len(self.transactions) > 0:
-            # ...if called with `--override-with-zero-txs`, all of them to clear
-            if self.arguments.override:
-                self.override(self.transactions)
-
-            # ...if called with either `--override-with-zero-txs` or `--wait`, wait for all of them to clear
-            if self.arguments.override or self.arguments.wait:
-                self.wait(self.transactions)
+        if self.arguments.daemon:
+            self.run_daemon()
+            return
 
-    def list(self, transactions):
+        # Get pending transactions of all addresses at once
+        self.transactions = self.get_pending_transactions()
+        any_pending = any(len(transactions) > 0 for transactions in self.transactions.values())
 
         if self.arguments.json:
-            print(json.dumps(list(map(lambda tx: {'hash': tx.tx_hash, 'nonce': tx.nonce}, transactions))))
-            return
+            self.list_json(self.transactions)
+
+        for address, transactions in self.transactions.items():
+            # List pending transactions, alternatively say there are none
+            if not self.arguments.json:
+                self.list(address, transactions)
+
+            # If there is at least one pending transaction and if called with `--override-with-zero-txs`,
+            # override all of them
+            if len(transactions) > 0 and self.arguments.override:
+                results = self.override(address, transactions)
+                if self.escalation is not None:
+                    self.escalation.track(address, results)
+
+        # If there is at least one pending transaction and if called with either `--override-with-zero-txs`
+        # or `--wait`, wait for all of them to clear
+        if any_pending and (self.arguments.override or self.arguments.wait):
+            self.wait(self.transactions)
+
+        if self.arguments.stats:
+            self.print_stats()
+
+    def run_daemon(self):
+        from plunger.api import ApiServer
+        from plunger.daemon import Daemon
+
+        daemon = Daemon(self, stuck_blocks=self.arguments.stuck_blocks, stuck_seconds=self.arguments.stuck_seconds)
+        api = None
+        if self.arguments.api_port is not None:
+            api = ApiServer(daemon, self.arguments.api_host, self.arguments.api_port).start()
+            print(f"Serving the API on {api.url}")
+
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if api is not None:
+                api.stop()
+
+        if self.arguments.stats:
+            self.print_stats()
+
+    def list_json(self, transactions: dict):
+        # With a single address, a list of its pending transactions is printed, otherwise they are grouped by address
+        result = {address: self.transactions_json(address_transactions) for address, address_transactions in transactions.items()}
+        print(json.dumps(result[self.addresses[0]] if len(self.addresses) == 1 else result))
+
+    @staticmethod
+    def transactions_json(transactions: list) -> list:
+        return list(map(lambda tx: {'hash': tx.tx_hash, 'nonce': tx.nonce}, transactions))
 
+    def list(self, address: str, transactions: list):
         # Print the number of pending transactions
         if len(transactions) == 0:
-            print(f"There are no pending transactions on {self.chain()} from {self.web3.eth.defaultAccount}")
+            print(f"There are no pending transactions on {self.chain()} from {address}")
         elif len(transactions) == 1:
-            print(f"There is 1 pending transaction on {self.chain()} from {self.web3.eth.defaultAccount}:")
+            print(f"There is 1 pending transaction on {self.chain()} from {address}:")
         else:
-            print(f"There are {len(transactions)} pending transactions on {self.chain()} from {self.web3.eth.defaultAccount}:")
+            print(f"There are {len(transactions)} pending transactions on {self.chain()} from {address}:")
 
         # Print the table with pending transactions, if there are any
         if len(transactions) > 0:
+            from texttable import Texttable
             table = Texttable()
             table.set_deco(Texttable.HEADER)
             table.set_cols_dtype(['t', 'i'])
@@ -155,108 +440,521 @@ class Plunger:
             print(table.draw())
             print(f"")
 
-    def override(self, transactions: list):
-        # Override all pending transactions with zero-wei transfer transactions
-        last_nonce = self.get_last_nonce()
-        for nonce in self.unique_nonces(transactions):
-            ## Check for nonce gaps
-            # If gap exists, set pending transaction nonce to 1 above last sent transaction
-            if nonce > last_nonce + 1:
-                nonce = last_nonce + 1
+    def override(self, address: str, transactions: list, replaced_nonces: set = frozenset()) -> list:
+        # Returns the outcome for each nonce, which is also printed. Nonces in `replaced_nonces` already have
+        # a replacement pending, so they are planned for like any other but not replaced again.
+        replaced_nonces = self.clearing_nonces(address, transactions, replaced_nonces)
+        if self.arguments.pipeline:
+            return self.override_pipelined(address, transactions, replaced_nonces)
+
+        from plunger.nonces import plan_replacements
+        from plunger.rpc import RpcError
 
+        # Override all pending transactions with zero-wei transfer transactions
+        results = []
+        last_nonce = self.last_nonces[address]
+        plan = plan_replacements(last_nonce, transactions)
+        stuck_fees = dict(plan)
+        base_fee = None
+        for nonce, _ in plan:
+            if nonce in replaced_nonces:
+                last_nonce = max(last_nonce, nonce)
+                continue
+
+            # If an earlier replacement failed, the following ones move down so they do not leave a nonce gap
+            nonce = min(nonce, last_nonce + 1)
+
+            fees = {}
             try:
-                if self.arguments.smart_gas:
-                    gas_price = int(self.gas_client.fastest_price() * 1.1)
-                else:
-                    gas_price = self.web3.eth.gasPrice if self.arguments.gas_price == 0 else self.arguments.gas_price
-                tx_hash = self.web3.eth.sendTransaction({'from': self.web3.eth.defaultAccount,
-                                                         'to': self.web3.eth.defaultAccount,
-                                                         'gasPrice': gas_price,
-                                                         'nonce': nonce,
-                                                         'value': 0})
+                if self.london and base_fee is None:
+                    base_fee = self.get_base_fee()
+                fees = self.replacement_fees(self.replacement_gas_price(), base_fee, stuck_fees.get(nonce))
+                tx_hash = self.send_replacement(address, nonce, fees)
 
                 # increment last nonce to account for successful transaction
                 last_nonce += 1
 
                 ## Remove sent transaction from pending transaction queue
                 # As transactions are already sorted and duplicates are removed, can safely pop in order
-                self.transactions.pop(0)
+                self.transactions[address].pop(0)
+
+                print(f"Sent replacement transaction with nonce={nonce}{self.describe_fees(fees)}, tx_hash={tx_hash}.")
+                results.append({'nonce': nonce, **fees, 'tx_hash': tx_hash})
+            except Exception as e:
+                print(f"Failed to send replacement transaction with nonce={nonce}{self.describe_fees(fees)}.")
+                print(f"   Error: {e.error if isinstance(e, RpcError) else e}")
+                results.append({'nonce': nonce, **fees, 'error': e.error if isinstance(e, RpcError) else str(e)})
+
+        return results
+
+    def clearing_nonces(self, address: str, transactions: list, replaced_nonces: set) -> set:
+        # With `--skip-clearing`, nonces which will clear on their own are left alone as if they had been replaced
+        if not self.arguments.skip_clearing:
+            return replaced_nonces
+
+        from plunger.nonces import clearing_nonces
+        try:
+            base_fee = self.get_base_fee() if self.london else None
+            clearing = clearing_nonces(self.last_nonces[address], transactions, self.replacement_gas_price(), base_fee)
+        except Exception as e:
+            print(f"WARNING: Cannot get the current gas price ({e}), replacing all pending transactions", file=sys.stderr)
+            return replaced_nonces
+
+        for nonce in sorted(clearing - set(replaced_nonces)):
+            print(f"Pending transaction with nonce={nonce} already pays enough to get mined, not replacing it.")
+        return set(replaced_nonces) | clearing
+
+    def send_replacement(self, address: str, nonce: int, fees: dict) -> str:
+        # Sends a zero-wei transfer to ourselves with `nonce`, signed locally if we have the key
+        from hexbytes import HexBytes
+        from plunger.rpc import rpc_call
+
+        signer = self.signers.get(address.lower())
+        if signer is not None:
+            tx_hash = signer.send_replacement(self.session, self.endpoint_uri, nonce, **fees)
+        elif 'gas_price' in fees:
+            tx_hash = self.web3.eth.sendTransaction({'from': address,
+                                                     'to': address,
+                                                     'gasPrice': fees['gas_price'],
+                                                     'nonce': nonce,
+                                                     'value': 0})
+        else:
+            tx_hash = HexBytes(rpc_call(self.session, self.endpoint_uri, "eth_sendTransaction",
+                                        [self.replacement_transaction(address, nonce, fees)]))
+        return self.web3.toHex(tx_hash)
+
+    def escalate(self, block_number: int, last_nonces: dict):
+        # Send the replacements which have stayed pending for too long again, at escalated fees
+        from plunger.rpc import RpcError
 
-                print(f"Sent replacement transaction with nonce={nonce}, gas_price={gas_price}, tx_hash={self.web3.toHex(tx_hash)}.")
+        due = self.escalation.due(block_number, last_nonces)
+        if len(due) == 0:
+            return
+
+        market_fees = {}
+        try:
+            market_fees = self.replacement_fees(self.replacement_gas_price(), self.get_base_fee() if self.london else None, None)
+        except Exception as e:
+            print(f"WARNING: Cannot get the current gas price ({e}), escalating from the previous one", file=sys.stderr)
+
+        for address, nonce, fees, blocks_pending, attempts in due:
+            escalated_fees = self.escalation.escalated_fees(fees, market_fees)
+            if escalated_fees is None:
+                print(f"Replacement transaction with nonce={nonce} from {address} has been pending for {blocks_pending} block(s),"
+                      f" but its gas price cannot be escalated above {self.arguments.escalate_max_price}.")
+                self.escalation.give_up(address, nonce)
+                continue
+
+            print(f"Replacement transaction with nonce={nonce} from {address} has been pending for {blocks_pending} block(s),"
+                  f" escalating (attempt {attempts + 1} of {self.arguments.escalate_max_attempts}).")
+            try:
+                tx_hash = self.send_replacement(address, nonce, escalated_fees)
+                print(f"Sent replacement transaction with nonce={nonce}{self.describe_fees(escalated_fees)}, tx_hash={tx_hash}.")
+                self.escalation.record(address, nonce, escalated_fees, block_number, attempts + 1)
             except Exception as e:
-                print(f"Failed to send replacement transaction with nonce={nonce}, gas_price={gas_price}.")
-                print(f"   Error: {e}")
+                print(f"Failed to send replacement transaction with nonce={nonce}{self.describe_fees(escalated_fees)}.")
+                print(f"   Error: {e.error if isinstance(e, RpcError) else e}")
+                self.escalation.record(address, nonce, fees, block_number, attempts + 1)
+
+    def override_pipelined(self, address: str, transactions: list, replaced_nonces: set = frozenset()) -> list:
+        # Override all pending transactions with zero-wei transfer transactions, without waiting for each of them
+        # to be sent before preparing the next one. The gas price is fixed once, the transactions are signed locally
+        # if we have the key (or left for the node to sign otherwise), and all of them go to the node in one batch.
+        from plunger.nonces import plan_replacements
+        from plunger.rpc import RpcBatch, RpcError
+
+        plan = [(nonce, stuck_fees) for nonce, stuck_fees in plan_replacements(self.last_nonces[address], transactions)
+                if nonce not in replaced_nonces]
+        signer = self.signers.get(address.lower())
+        calls = []
+        try:
+            fixed_gas_price = self.replacement_gas_price()
+            base_fee = self.get_base_fee() if self.london else None
+            batch = RpcBatch(self.session, self.endpoint_uri)
+            for nonce, stuck_fees in plan:
+                fees = self.replacement_fees(fixed_gas_price, base_fee, stuck_fees)
+                if signer is not None:
+                    calls.append((nonce, fees, batch.add("eth_sendRawTransaction", [signer.sign_replacement(nonce, **fees)])))
+                else:
+                    calls.append((nonce, fees, batch.add("eth_sendTransaction", [self.replacement_transaction(address, nonce, fees)])))
+            batch.execute()
+        except Exception as e:
+            # If the batch could not be prepared or sent, none of the nonces is known to have been replaced
+            error = e.error if isinstance(e, RpcError) else str(e)
+            planned_fees = {nonce: fees for nonce, fees, _ in calls}
+            results = []
+            for nonce, _ in plan:
+                fees = planned_fees.get(nonce, {})
+                print(f"Failed to send replacement transaction with nonce={nonce}{self.describe_fees(fees)}.")
+                print(f"   Error: {error}")
+                results.append({'nonce': nonce, **fees, 'error': error})
+            return results
+
+        # Report the outcome for each nonce the same way as when sending them one by one
+        results = []
+        for nonce, fees, call in calls:
+            try:
+                tx_hash = call.result()
+                self.transactions[address].pop(0)
+                print(f"Sent replacement transaction with nonce={nonce}{self.describe_fees(fees)}, tx_hash={tx_hash}.")
+                results.append({'nonce': nonce, **fees, 'tx_hash': tx_hash})
+            except RpcError as e:
+                print(f"Failed to send replacement transaction with nonce={nonce}{self.describe_fees(fees)}.")
+                print(f"   Error: {e.error}")
+                results.append({'nonce': nonce, **fees, 'error': e.error})
+
+        return results
+
+    @staticmethod
+    def replacement_transaction(address: str, nonce: int, fees: dict) -> dict:
+        # A replacement transaction for the node to sign, in the JSON-RPC format
+        from plunger.keys import LocalSigner
 
-    def wait(self, transactions: list):
+        fee_fields = {'gas_price': 'gasPrice', 'max_fee_per_gas': 'maxFeePerGas', 'max_priority_fee_per_gas': 'maxPriorityFeePerGas'}
+        return {'from': address, 'to': address, 'gas': hex(LocalSigner.GAS),
+                **{fee_fields[name]: hex(value) for name, value in fees.items()},
+                'nonce': hex(nonce), 'value': hex(0)}
+
+    @staticmethod
+    def describe_fees(fees: dict) -> str:
+        return "".join(f", {name}={value}" for name, value in fees.items())
+
+    def replacement_gas_price(self) -> int:
+        if self.arguments.smart_gas:
+            fastest_price = self.smart_gas.fastest_price()
+            if fastest_price is not None:
+                return int(fastest_price * 1.1)
+            print(f"WARNING: Smart gas price not available within {self.arguments.smart_gas_timeout}s,"
+                  f" using the gas price suggested by the node", file=sys.stderr)
+            return self.web3.eth.gasPrice
+        else:
+            return self.web3.eth.gasPrice if self.arguments.gas_price == 0 else self.arguments.gas_price
+
+    def replacement_fees(self, gas_price: int, base_fee: Optional[int], stuck_fees: Optional[tuple]) -> dict:
+        # Legacy replacements pay `gas_price`, so their gas price has to exceed the bumped fee cap of the stuck
+        # transaction, which is the higher of its fees. EIP-1559 replacements take what `gas_price` leaves above
+        # the base fee of the pending block as their tip, and a fee cap which lets the base fee double
+        # before they stop being includable, even though only the base fee and the tip actually get paid.
+        # Their fees are always bumped over the ones of the stuck transaction, as its tip has nothing to do with
+        # our gas price, and a replacement which does not bump both of them never gets accepted.
+        if base_fee is None:
+            return {'gas_price': self.bumped_gas_price(gas_price, stuck_fees[0] if stuck_fees is not None else None)}
+
+        max_priority_fee_per_gas = max(gas_price - base_fee, 0)
+        max_fee_per_gas = 2 * base_fee + max_priority_fee_per_gas
+        if stuck_fees is not None:
+            max_fee_per_gas = self.bumped_gas_price(max_fee_per_gas, stuck_fees[0], always=True)
+            max_priority_fee_per_gas = self.bumped_gas_price(max_priority_fee_per_gas, stuck_fees[1], always=True)
+        return {'max_fee_per_gas': max(max_fee_per_gas, max_priority_fee_per_gas),
+                'max_priority_fee_per_gas': max_priority_fee_per_gas}
+
+    def bumped_gas_price(self, gas_price: int, stuck_price: Optional[int], always: bool = False) -> int:
+        # The node rejects a replacement which does not pay at least `--min-bump` percent more than the pending
+        # transaction with the same nonce, so the price is raised to that straight away instead of failing
+        if not (self.arguments.bump_stuck_price or always) or stuck_price is None:
+            return gas_price
+
+        # Rounded up in integer arithmetic, as being a single wei short is enough to get rejected
+        bump = round(self.arguments.min_bump * 100)
+        return max(gas_price, -(-stuck_price * (10000 + bump) // 10000))
+
+    def wait(self, transactions: dict):
         print(f"Waiting for the transactions to get mined...")
 
-        # When `get_last_nonce()` stops being lower than the highest pending nonce,
-        # it means all pending transactions or their replacements have been mined.
-        if len(self.transactions) > 0:
-            while self.get_last_nonce() < max(self.transactions, key=lambda tx: tx.nonce).nonce:
-                time.sleep(1)
+        # When the last nonce of an address stops being lower than its highest pending nonce,
+        # it means all its pending transactions or their replacements have been mined.
+        # Nonces only change when a block gets mined, so they are checked again only after a new one arrives.
+        highest_nonces = {address: max(address_transactions, key=lambda tx: tx.nonce).nonce
+                          for address, address_transactions in transactions.items() if len(address_transactions) > 0}
+        if self.escalation is not None:
+            # Replacements which may need escalating are waited for as well, to be able to send them again
+            for address, nonce in self.escalation.replacements:
+                highest_nonces[address] = max(highest_nonces.get(address, nonce), nonce)
+        from plunger.blocks import PollingBlockWatcher, PollScheduler
+        started, calls_sent, requests_sent = time.time(), self.session.calls_sent, self.session.requests_sent
+        scheduler = PollScheduler(self.arguments.poll_min_interval, self.arguments.poll_max_interval)
+        block_watcher = self.block_watcher(scheduler)
+        try:
+            while len(highest_nonces) > 0:
+                if self.escalation is not None:
+                    block_number, last_nonces = self.get_chain_state(list(highest_nonces.keys()))
+                    self.escalate(block_number, last_nonces)
+                else:
+                    last_nonces = self.get_last_nonces(list(highest_nonces.keys()))
+                highest_nonces = {address: nonce for address, nonce in highest_nonces.items() if last_nonces[address] < nonce}
+                if len(highest_nonces) > 0:
+                    try:
+                        block_watcher.wait_for_block()
+                    except Exception as e:
+                        print(f"WARNING: Watching for new blocks failed ({e}), falling back to polling", file=sys.stderr)
+                        block_watcher.close()
+                        block_watcher = PollingBlockWatcher(self.session, self.endpoint_uri, scheduler)
+        finally:
+            block_watcher.close()
+            self.wait_stats = (time.time() - started,
+                               self.session.calls_sent - calls_sent,
+                               self.session.requests_sent - requests_sent)
 
         print(f"All pending transactions have been mined.")
 
-    @staticmethod
-    def unique_nonces(transactions: list) -> list:
-        unique_nonces = []
-        for transaction in transactions:
-            if transaction.nonce not in unique_nonces:
-                unique_nonces.append(transaction.nonce)
-        return unique_nonces
+    def block_watcher(self, scheduler: 'PollScheduler') -> 'BlockWatcher':
+        from plunger.blocks import FilterBlockWatcher, PollingBlockWatcher, SubscriptionBlockWatcher
+
+        # Pick the cheapest way of finding out about new blocks the node supports
+        endpoint_uri = self.endpoint_uri
+        if self.arguments.wait_mode in [self.WAIT_AUTO, self.WAIT_SUBSCRIBE] and self.arguments.rpc_ws_url is not None:
+            try:
+                return SubscriptionBlockWatcher(self.arguments.rpc_ws_url, timeout=self.arguments.rpc_timeout,
+                                                max_interval=self.SUBSCRIPTION_MAX_INTERVAL)
+            except Exception as e:
+                print(f"WARNING: Cannot subscribe to new blocks ({e})", file=sys.stderr)
+
+        if self.arguments.wait_mode in [self.WAIT_AUTO, self.WAIT_SUBSCRIBE, self.WAIT_FILTER]:
+            try:
+                return FilterBlockWatcher(self.session, endpoint_uri, scheduler)
+            except Exception as e:
+                print(f"WARNING: Cannot install a block filter ({e})", file=sys.stderr)
+
+        return PollingBlockWatcher(self.session, endpoint_uri, scheduler)
+
+    def print_stats(self):
+        # With `--json`, stdout is left to the pending transactions and the statistics are printed to stderr as JSON
+        if self.arguments.json:
+            print(json.dumps(self.stats_json()), file=sys.stderr)
+            return
+
+        print(f"Sent {self.session.calls_sent} JSON-RPC call(s) in {self.session.requests_sent} HTTP request(s) to the node"
+              f" over {self.session.connections_opened} connection(s)", file=sys.stderr)
+        for line in self.session.metrics.summary():
+            print(f"  {line}", file=sys.stderr)
+        if self.wait_stats is not None:
+            print(f"Waiting took {self.wait_stats[0]:.1f}s, {self.wait_stats[1]} JSON-RPC call(s)"
+                  f" in {self.wait_stats[2]} HTTP request(s)", file=sys.stderr)
+
+    def stats_json(self) -> dict:
+        stats = {'calls_sent': self.session.calls_sent,
+                 'requests_sent': self.session.requests_sent,
+                 'connections_opened': self.session.connections_opened,
+                 **self.session.metrics.json()}
+        if self.wait_stats is not None:
+            stats['wait'] = {'seconds': self.wait_stats[0], 'calls': self.wait_stats[1], 'requests': self.wait_stats[2]}
+        return stats
 
     def chain(self) -> str:
-        if self.web3.eth.chainId == 1:
-            return "mainnet"
-        elif self.web3.eth.chainId == 42:
-            return "kovan"
-        else:
-            return "unknown"
+        return chain_name(self.chain_id)
+
+    def get_last_nonces(self, addresses: list) -> dict:
+        from plunger.rpc import RpcBatch
+
+        # Nonces of all addresses are fetched in one batch
+        batch = RpcBatch(self.session, self.endpoint_uri)
+        transaction_counts = {address: batch.add("eth_getTransactionCount", [address, "latest"]) for address in addresses}
+        batch.execute()
+
+        return {address: int(call.result(), 16)-1 for address, call in transaction_counts.items()}
+
+    def get_chain_state(self, addresses: list) -> tuple:
+        from plunger.rpc import RpcBatch
+
+        # The latest block and nonces of all addresses are fetched in one batch
+        batch = RpcBatch(self.session, self.endpoint_uri)
+        block_number = batch.add("eth_blockNumber", [])
+        transaction_counts = {address: batch.add("eth_getTransactionCount", [address, "latest"]) for address in addresses}
+        batch.execute()
+
+        return int(block_number.result(), 16), \
+               {address: int(call.result(), 16)-1 for address, call in transaction_counts.items()}
+
+    def get_node_info(self) -> tuple:
+        from plunger.rpc import RpcBatch, RpcError
+
+        # These calls are independent of each other, so they can go to the node as one batch. The client version
+        # and chain id are left out if an earlier run has cached them.
+        batch = RpcBatch(self.session, self.endpoint_uri)
+        chain_info = self.chain_cache.read(self.endpoint_uri)
+        if chain_info is None:
+            client_version = batch.add("web3_clientVersion", [])
+            chain_id = batch.add("eth_chainId", [])
+        transaction_counts = {address: batch.add("eth_getTransactionCount", [address, "latest"]) for address in self.addresses}
+
+        # Replacements can be EIP-1559 transactions once the chain has forked to London, i.e. its blocks have a base fee
+        replacing = self.arguments.override or self.arguments.daemon
+        latest_block = batch.add("eth_getBlockByNumber", ["latest", False]) \
+            if replacing and self.arguments.replacement_type != self.REPLACEMENT_LEGACY else None
+        batch.execute()
+
+        try:
+            london = latest_block is not None and latest_block.result().get('baseFeePerGas') is not None
+        except RpcError:
+            london = False
+
+        if chain_info is None:
+            chain_info = client_version.result(), int(chain_id.result(), 16)
+            self.chain_cache.write(self.endpoint_uri, *chain_info)
+
+        return chain_info[0], \
+               chain_info[1], \
+               {address: int(call.result(), 16)-1 for address, call in transaction_counts.items()}, \
+               london
+
+    def get_base_fee(self) -> int:
+        # The base fee of the pending block is the one replacements will pay if included in the next block.
+        # Not all nodes report it, in which case the base fee of the latest block is used instead.
+        from plunger.rpc import RpcBatch, RpcError
+
+        batch = RpcBatch(self.session, self.endpoint_uri)
+        pending_block = batch.add("eth_getBlockByNumber", ["pending", False])
+        latest_block = batch.add("eth_getBlockByNumber", ["latest", False])
+        batch.execute()
+
+        try:
+            if pending_block.result() is not None and pending_block.result().get('baseFeePerGas') is not None:
+                return int(pending_block.result()['baseFeePerGas'], 16)
+        except RpcError:
+            pass
+        return int(latest_block.result()['baseFeePerGas'], 16)
+
+    def get_pending_transactions(self) -> dict:
+        # It is safer to fail than to report no pending transactions if we could not look for them
+        transactions = self.discover_pending_transactions()
+        if transactions is None:
+            print("None of the sources responded, cannot discover pending transactions.", file=sys.stderr)
+            exit(-1)
 
-    def get_last_nonce(self):
-        return self.web3.eth.getTransactionCount(self.web3.eth.defaultAccount)-1
+        return transactions
+
+    def discover_pending_transactions(self) -> Optional[dict]:
+        # Get the list of pending transactions and their details from specified sources, querying all of them at once.
+        # Each source returns the transactions already grouped by sender, so the pool is scanned only once
+        # regardless of the number of addresses. Returns `None` if none of the sources responded.
+        # Sources are run on daemon threads, so the ones which are still running when we are done with them
+        # can neither hold up the run nor the exit of the process
+        import queue
+        import threading
+        transactions = {address: [] for address in self.addresses}
+        deadline = time.monotonic() + self.arguments.source_timeout
+        jobs = self.discovery_jobs(deadline)
+        results = queue.Queue()
+
+        def run(name: str, job):
+            try:
+                results.put((name, job(), None))
+            except Exception as e:
+                results.put((name, None, e))
+
+        for name, job in jobs.items():
+            threading.Thread(target=run, args=(name, job), daemon=True).start()
 
-    def get_pending_transactions(self) -> list:
-        # Get the list of pending transactions and their details from specified sources
-        transactions = []
+        waiting = set(jobs)
+        responded = 0
+        while len(waiting) > 0:
+            try:
+                name, result, error = results.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                for name in [name for name in jobs if name in waiting]:
+                    print(f"WARNING: Source {name} did not respond in {self.arguments.source_timeout}s", file=sys.stderr)
+                break
+
+            waiting.remove(name)
+            if error is not None:
+                print(f"WARNING: Source {name} failed: {error}", file=sys.stderr)
+                continue
+
+            for address, address_transactions in result.items():
+                transactions[address] += address_transactions
+            responded += 1
+
+            if self.arguments.discovery_mode == self.DISCOVERY_FIRST:
+                break
+
+        if responded == 0:
+            return None
+
+        # Ignore these which have been already mined, remove duplicates, sort by nonce and tx_hash
+        return {address: sorted(set(filter(lambda tx: tx.nonce > self.last_nonces[address], address_transactions)),
+                                key=lambda tx: (tx.nonce, tx.tx_hash))
+                for address, address_transactions in transactions.items()}
+
+    def discovery_jobs(self, deadline: float) -> dict:
+        # Sources which download the whole pool are queried separately, as their responses are streamed
+        jobs = {}
         if self.SOURCE_PARITY_TXQUEUE in self.arguments.source:
-            transactions += self.get_pending_transactions_from_parity()
+            jobs[self.SOURCE_PARITY_TXQUEUE] = lambda: self.get_pending_transactions_from_parity(deadline)
         if self.SOURCE_JSONRPC_GETBLOCK in self.arguments.source:
-            transactions += self.get_pending_transactions_from_block()
-
-        # Ignore these which have been already mined
-        last_nonce = self.get_last_nonce()
-        transactions = filter(lambda tx: tx.nonce > last_nonce, transactions)
+            jobs[self.SOURCE_JSONRPC_GETBLOCK] = lambda: self.get_pending_transactions_from_block(deadline)
+
+        # Sources which filter by sender on the node side share one batch when merging,
+        # but each of them needs to be a separate request to be able to take the first one to respond
+        by_sender = [source for source in self.arguments.source
+                     if source in [self.SOURCE_PARITY_TXQUEUE_FROM, self.SOURCE_GETH_TXPOOL]]
+        if self.arguments.discovery_mode == self.DISCOVERY_MERGE and len(by_sender) > 0:
+            jobs[','.join(by_sender)] = lambda: self.get_pending_transactions_by_sender(by_sender)
+        else:
+            for source in by_sender:
+                jobs[source] = lambda source=source: self.get_pending_transactions_by_sender([source])
 
-        # Remove duplicates, sort by nonce and tx_hash
-        return sorted(set(transactions), key=lambda tx: (tx.nonce, tx.tx_hash))
+        return jobs
 
-    def get_pending_transactions_from_parity(self) -> list:
+    def get_pending_transactions_from_parity(self, deadline: float) -> dict:
         # Get the list of pending transactions and their details from Parity transaction pool
-        # First, execute the RPC call and get the response
+        # First, execute the RPC call and stream the response, as the whole pool can be tens of megabytes
         request = {"method": "parity_pendingTransactions", "params": [], "id": 1, "jsonrpc": "2.0"}
-        response = requests.post(self.web3.provider.endpoint_uri + "/rpc", None, request).json()
-
-        # Then extract pending transactions sent by us from the response and convert them into `Transaction` objects
-        items = response['result']
-        items = filter(lambda item: item['from'].lower() == self.web3.eth.defaultAccount.lower(), items)
-        items = filter(lambda item: item['blockNumber'] is None, items)
-        return list(map(lambda item: Transaction(tx_hash=item['hash'], nonce=int(item['nonce'], 16)), items))
+        with self.session.post(self.endpoint_uri + "/rpc", json=request, stream=True,
+                               timeout=self.arguments.source_timeout) as response:
+            # Then extract pending transactions sent by us from the response as it is being parsed
+            chunks = iter_until(response.iter_content(chunk_size=CHUNK_SIZE), deadline)
+            return self.transactions_from_parity(iter_items(chunks, 'result'))
 
-    def get_pending_transactions_from_block(self) -> list:
+    def get_pending_transactions_from_block(self, deadline: float) -> dict:
         # Get the list of pending transactions from the mempool
-        # First, execute the RPC call and get the response
+        # First, execute the RPC call and stream the response
         request = {"method": "eth_getBlockByNumber", "params": ["pending", True], "id": 1, "jsonrpc": "2.0"}
-        response = requests.post(self.web3.provider.endpoint_uri + "/rpc", None, request).json()
-
-        # Then extract pending transactions sent by us from the response and convert them into `Transaction` objects
-        items = response['result']['transactions']
-        items = filter(lambda item: item['from'].lower() == self.web3.eth.defaultAccount.lower(), items)
-        result = []
-        for item in list(items):
-            result.append(Transaction(tx_hash=item['hash'], nonce=int(item['nonce'], 16)))
-        return result
+        with self.session.post(self.endpoint_uri + "/rpc", json=request, stream=True,
+                               timeout=self.arguments.source_timeout) as response:
+            # Then extract pending transactions sent by us from the response and convert them into `Transaction` objects
+            chunks = iter_until(response.iter_content(chunk_size=CHUNK_SIZE), deadline)
+            return self.group_by_sender(iter_items(chunks, 'result.transactions'))
+
+    def get_pending_transactions_by_sender(self, sources: list) -> dict:
+        # Get the list of pending transactions sent by us from sources which filter by sender on the node side
+        # As the responses are small, all these calls (one per source and address) are sent to the node as one batch
+        from plunger.rpc import RpcBatch
+        batch = RpcBatch(self.session, self.endpoint_uri, timeout=self.arguments.source_timeout)
+        calls = []
+        for address in self.addresses:
+            if self.SOURCE_PARITY_TXQUEUE_FROM in sources:
+                calls.append((batch.add("parity_pendingTransactions", [None, {"from": {"eq": address.lower()}}]),
+                              self.transactions_from_parity))
+            if self.SOURCE_GETH_TXPOOL in sources:
+                calls.append((batch.add("txpool_contentFrom", [address]), self.transactions_from_geth))
+        batch.execute()
+
+        transactions = {}
+        for call, convert in calls:
+            for address, address_transactions in convert(call.result()).items():
+                transactions.setdefault(address, []).extend(address_transactions)
+        return transactions
+
+    def transactions_from_parity(self, items) -> dict:
+        # Extract pending transactions from Parity transaction pool
+        items = filter(lambda item: item['blockNumber'] is None, items)
+        return self.group_by_sender(items)
+
+    def transactions_from_geth(self, result: dict) -> dict:
+        # The geth transaction pool contains both executable (`pending`) transactions and ones blocked
+        # by a nonce gap (`queued`), each grouped by nonce
+        return self.group_by_sender(item for pool in result.values() for item in pool.values())
+
+    def group_by_sender(self, items) -> dict:
+        # Split transactions by sender in one pass, dropping these not sent by us,
+        # and convert them into `Transaction` objects
+        senders = {address.lower(): address for address in self.addresses}
+        transactions = {}
+        for item in items:
+            address = senders.get(item['from'].lower())
+            if address is not None:
+                transactions.setdefault(address, []).append(Transaction.from_json(item))
+        return transactions
 
 
 if __name__ == "__main__":
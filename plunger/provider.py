@@ -0,0 +1,40 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from web3 import HTTPProvider
+
+from plunger.rpc import RpcSession
+
+
+class SessionHTTPProvider(HTTPProvider):
+    # `HTTPProvider` in web3 5.6 uses its own session cached per endpoint, so we need to override
+    # `make_request` for web3 calls to go through `RpcSession`.
+    def __init__(self, endpoint_uri: str, session: RpcSession):
+        assert isinstance(endpoint_uri, str)
+        assert isinstance(session, RpcSession)
+        super().__init__(endpoint_uri=endpoint_uri)
+
+        self.session = session
+
+    def make_request(self, method, params):
+        self.logger.debug("Making request HTTP. URI: %s, Method: %s", self.endpoint_uri, method)
+        request_data = self.encode_rpc_request(method, params)
+        raw_response = self.session.post(self.endpoint_uri, data=request_data, headers=self.get_request_headers())
+        raw_response.raise_for_status()
+        response = self.decode_rpc_response(raw_response.content)
+        self.logger.debug("Getting response HTTP. URI: %s, Method: %s, Response: %s", self.endpoint_uri, method, response)
+        return response
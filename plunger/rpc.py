@@ -0,0 +1,192 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import json
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from plunger.metrics import RpcMetrics
+
+
+class RpcSession(requests.Session):
+    # A keep-alive session shared by web3 (see `plunger.provider.SessionHTTPProvider`) and the raw JSON-RPC calls,
+    # so all of them reuse the same pool of connections instead of paying for a TCP (and TLS) handshake on each call.
+    def __init__(self, pool_size: int = 10, retries: int = 3, timeout: float = 10):
+        assert isinstance(pool_size, int)
+        assert isinstance(retries, int)
+        assert isinstance(timeout, (int, float))
+        super().__init__()
+
+        self.timeout = timeout
+        self.requests_sent = 0
+        self.calls_sent = 0
+        self.batches_supported = True
+        self.metrics = RpcMetrics()
+
+        # Only retry failures to connect, as a request which reached the node could have been already executed
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.1))
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        self.requests_sent += 1
+        self.calls_sent += len(kwargs['json']) if isinstance(kwargs.get('json'), list) else 1
+
+        methods = self.rpc_methods(kwargs)
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception:
+            self.metrics.record(methods, time.perf_counter() - started, 0, 0, error=True)
+            raise
+
+        request_bytes = len(response.request.body or b'')
+        retries = getattr(response.raw, 'retries', None)
+        retries = len(retries.history) if retries is not None else 0
+        if kwargs.get('stream'):
+            # Streamed responses are timed and counted once they have been read
+            response.iter_content = self.counted(response.iter_content, methods, started, request_bytes, retries, not response.ok)
+        else:
+            self.metrics.record(methods, time.perf_counter() - started, request_bytes, len(response.content), retries, not response.ok)
+        return response
+
+    def counted(self, iter_content, methods: list, started: float, request_bytes: int, retries: int, error: bool):
+        def counted_iter_content(*args, **kwargs):
+            response_bytes = 0
+            try:
+                for chunk in iter_content(*args, **kwargs):
+                    response_bytes += len(chunk)
+                    yield chunk
+            finally:
+                self.metrics.record(methods, time.perf_counter() - started, request_bytes, response_bytes, retries, error)
+        return counted_iter_content
+
+    @staticmethod
+    def rpc_methods(kwargs: dict) -> list:
+        # web3 sends requests already encoded, plunger itself lets `requests` encode them
+        body = kwargs.get('json')
+        if body is None and kwargs.get('data') is not None:
+            try:
+                body = json.loads(kwargs['data'])
+            except ValueError:
+                pass
+        calls = body if isinstance(body, list) else [body]
+        return [call.get('method', "unknown") if isinstance(call, dict) else "unknown" for call in calls] or ["unknown"]
+
+    @property
+    def connections_opened(self) -> int:
+        connections = 0
+        for adapter in set(self.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                connections += pools[key].num_connections
+        return connections
+
+
+class RpcError(Exception):
+    def __init__(self, method: str, error):
+        super().__init__(f"{method} failed: {error}")
+        self.method = method
+        self.error = error
+
+
+class RpcCall:
+    def __init__(self, id: int, method: str, params: list):
+        assert isinstance(id, int)
+        assert isinstance(method, str)
+        assert isinstance(params, list)
+
+        self.id = id
+        self.method = method
+        self.params = params
+        self.response = None
+
+    def request(self) -> dict:
+        return {"method": self.method, "params": self.params, "id": self.id, "jsonrpc": "2.0"}
+
+    def result(self):
+        assert self.response is not None
+        if 'error' in self.response or 'result' not in self.response:
+            raise RpcError(self.method, self.response.get('error'))
+        return self.response['result']
+
+
+class RpcBatch:
+    # Collects independent JSON-RPC calls and sends them to the node in one round trip.
+    # If the node rejects batch requests, the calls are sent one by one instead
+    # and further batches on the same session are not attempted.
+    ids = itertools.count(1)
+
+    def __init__(self, session: RpcSession, endpoint_uri: str, timeout: float = None):
+        assert isinstance(session, RpcSession)
+        assert isinstance(endpoint_uri, str)
+        assert isinstance(timeout, (int, float)) or (timeout is None)
+
+        self.session = session
+        self.endpoint_uri = endpoint_uri
+        self.timeout = timeout or session.timeout
+        self.calls = []
+
+    def add(self, method: str, params: list) -> RpcCall:
+        call = RpcCall(next(self.ids), method, params)
+        self.calls.append(call)
+        return call
+
+    def execute(self):
+        if len(self.calls) > 1 and self.session.batches_supported:
+            responses = self.send_batch()
+            if responses is not None:
+                for call in self.calls:
+                    call.response = responses.get(call.id, {'error': "No response in batch"})
+                return
+            self.session.batches_supported = False
+
+        for call in self.calls:
+            call.response = self.send(call.request(), call.method)
+
+    def send_batch(self):
+        # Returns `None` only if the node has rejected the batch with a JSON-RPC error, as nodes which do not
+        # support batches do. Any other failure, e.g. an HTTP error returned by a proxy, is not a reason
+        # to stop sending batches and gets raised instead.
+        responses = self.send([call.request() for call in self.calls], "batch")
+        if isinstance(responses, list):
+            return {item.get('id'): item for item in responses if isinstance(item, dict)}
+        if isinstance(responses, dict) and 'error' in responses:
+            return None
+        raise RpcError("batch", f"Unexpected response: {responses}")
+
+    def send(self, request, method: str):
+        response = self.session.post(self.endpoint_uri, json=request, timeout=self.timeout)
+        try:
+            return response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise RpcError(method, f"Invalid response: {response.text[:100]}")
+
+
+def rpc_call(session: RpcSession, endpoint_uri: str, method: str, params: list):
+    # A single JSON-RPC call made outside of web3, raising `RpcError` if it fails
+    batch = RpcBatch(session, endpoint_uri)
+    call = batch.add(method, params)
+    batch.execute()
+    return call.result()
@@ -0,0 +1,142 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import codecs
+import json
+import re
+import time
+from typing import Iterable, Iterator
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+class _Reader:
+    # Holds only the part of the response which has not been consumed yet, so memory usage
+    # is bound by the chunk size and the size of the largest single item, not by the whole body.
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+
+    def fill(self) -> bool:
+        self.buffer = self.buffer[self.position:]
+        self.position = 0
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON-RPC response")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Malformed JSON-RPC response, expected '{char}' at '{self.buffer[self.position:self.position+20]}'")
+        self.position += 1
+
+    def skip(self, char: str) -> bool:
+        if self.peek() == char:
+            self.position += 1
+            return True
+        return False
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # Most likely the value spans over to the next chunk
+                if not self.fill():
+                    raise
+                continue
+
+            # A number can be silently truncated at the chunk boundary
+            if end == len(self.buffer) and self.fill():
+                continue
+
+            self.position = end
+            return value
+
+    def object(self, path: list, top_level: bool) -> Iterator:
+        self.expect('{')
+        if self.skip('}'):
+            return
+
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key == path[0] and len(path) > 1 and self.peek() == '{':
+                yield from self.object(path[1:], False)
+            elif key == path[0] and len(path) == 1 and self.peek() == '[':
+                yield from self.array()
+            else:
+                value = self.value()
+                if top_level and key == 'error':
+                    raise ValueError(f"JSON-RPC error: {value}")
+
+            if not self.skip(','):
+                self.expect('}')
+                return
+
+    def drain(self):
+        # Read whatever follows the response, so the connection can go back to the pool
+        for _ in self.chunks:
+            pass
+
+    def array(self) -> Iterator:
+        self.expect('[')
+        if self.skip(']'):
+            return
+
+        while True:
+            yield self.value()
+            if not self.skip(','):
+                self.expect(']')
+                return
+
+
+def iter_items(chunks: Iterable[bytes], path: str) -> Iterator:
+    # Incrementally parse a JSON-RPC response and yield the items of the array found under `path`,
+    # which is a dot-separated list of keys, e.g. `result` for `parity_pendingTransactions`
+    # or `result.transactions` for `eth_getBlockByNumber`. Only one item is decoded at a time,
+    # so the caller can filter them out as they go without the whole response ever being in memory.
+    assert isinstance(path, str)
+
+    reader = _Reader(chunks)
+    yield from reader.object(path.split('.'), True)
+    reader.drain()
+
+
+def iter_until(chunks: Iterable[bytes], deadline: float) -> Iterator[bytes]:
+    # The read timeout only limits the time between chunks, so a response which keeps trickling in
+    # is cut off once `deadline` (as in `time.monotonic()`) has passed
+    for chunk in chunks:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Response has not been received in time")
+        yield chunk
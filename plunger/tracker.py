@@ -0,0 +1,131 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Callable, Optional
+
+from plunger.plunger import Transaction
+from plunger.rpc import RpcBatch, RpcError, RpcSession, rpc_call
+
+
+class PendingTracker:
+    # Keeps the set of pending transactions of `addresses` up to date without downloading the transaction pool
+    # again each time. After an initial discovery, only the transactions which arrived since the last refresh
+    # are fetched, as reported by an `eth_newPendingTransactionFilter` filter, and transactions with nonces
+    # which have been mined are dropped, looking up their receipts to tell the ones which got mined from
+    # the ones which got replaced. The cost of a refresh thus depends on the churn of the pool, not on its size.
+    # If the filter gets dropped by the node, and every `resync_every` refreshes anyway, the whole set is
+    # discovered again using `discover`.
+    def __init__(self, session: RpcSession, endpoint_uri: str, addresses: list, discover: Callable, resync_every: int = 100):
+        assert isinstance(session, RpcSession)
+        assert isinstance(endpoint_uri, str)
+        assert isinstance(addresses, list)
+        assert callable(discover)
+        assert isinstance(resync_every, int)
+
+        self.session = session
+        self.endpoint_uri = endpoint_uri
+        self.senders = {address.lower(): address for address in addresses}
+        self.discover = discover
+        self.resync_every = resync_every
+        self.refreshes = 0
+        self.pending = {address: {} for address in addresses}
+        self.filter_id = rpc_call(self.session, self.endpoint_uri, "eth_newPendingTransactionFilter", [])
+        self.resync()
+
+    def transactions(self) -> dict:
+        # Pending transactions grouped by address and sorted the same way `get_pending_transactions` does
+        return {address: [transaction for _, transaction in sorted(address_pending.items())]
+                for address, address_pending in self.pending.items()}
+
+    def refresh(self, last_nonces: dict) -> tuple:
+        # Returns the transactions which have been found, mined and replaced since the last refresh,
+        # each as a list of `(address, transaction)` pairs
+        self.refreshes += 1
+        if self.refreshes % self.resync_every == 0:
+            self.resync()
+            added = []
+        else:
+            added = self.fetch_new()
+
+        mined, replaced = self.drop_mined(last_nonces)
+        return added, mined, replaced
+
+    def resync(self):
+        transactions = self.discover()
+        if transactions is None:
+            raise RuntimeError("None of the sources responded, cannot discover pending transactions")
+
+        self.pending = {address: {(tx.nonce, tx.tx_hash): tx for tx in transactions.get(address, [])} for address in self.pending}
+
+    def fetch_new(self) -> list:
+        try:
+            tx_hashes = rpc_call(self.session, self.endpoint_uri, "eth_getFilterChanges", [self.filter_id])
+        except RpcError:
+            # The node dropped the filter, so transactions could have been missed
+            self.filter_id = rpc_call(self.session, self.endpoint_uri, "eth_newPendingTransactionFilter", [])
+            self.resync()
+            return []
+
+        # Only the transactions which have just arrived are looked up, all of them in one batch
+        batch = RpcBatch(self.session, self.endpoint_uri)
+        calls = [batch.add("eth_getTransactionByHash", [tx_hash]) for tx_hash in tx_hashes]
+        if len(calls) > 0:
+            batch.execute()
+
+        added = []
+        for call in calls:
+            item = self.result_or_none(call)
+            address = self.senders.get(item['from'].lower()) if item is not None else None
+            if address is not None and item.get('blockNumber') is None:
+                transaction = Transaction.from_json(item)
+                if (transaction.nonce, transaction.tx_hash) not in self.pending[address]:
+                    self.pending[address][(transaction.nonce, transaction.tx_hash)] = transaction
+                    added.append((address, transaction))
+        return added
+
+    def drop_mined(self, last_nonces: dict) -> tuple:
+        dropped = [(address, transaction) for address, address_pending in self.pending.items()
+                   for transaction in address_pending.values() if transaction.nonce <= last_nonces[address]]
+        if len(dropped) == 0:
+            return [], []
+
+        # Out of the transactions with the same nonce, only the one which has a receipt got mined
+        batch = RpcBatch(self.session, self.endpoint_uri)
+        receipts = [batch.add("eth_getTransactionReceipt", [transaction.tx_hash]) for _, transaction in dropped]
+        batch.execute()
+
+        mined, replaced = [], []
+        for (address, transaction), receipt in zip(dropped, receipts):
+            del self.pending[address][(transaction.nonce, transaction.tx_hash)]
+            if self.result_or_none(receipt) is not None:
+                mined.append((address, transaction))
+            else:
+                replaced.append((address, transaction))
+        return mined, replaced
+
+    @staticmethod
+    def result_or_none(call) -> Optional[dict]:
+        try:
+            return call.result()
+        except RpcError:
+            return None
+
+    def close(self):
+        try:
+            rpc_call(self.session, self.endpoint_uri, "eth_uninstallFilter", [self.filter_id])
+        except Exception:
+            pass
@@ -38,4 +38,8 @@ PYTHONPATH=$PYTHONPATH:./lib/pygasprice-client py.test --cov=plunger --cov-repor
 TEST_RESULT=$((TEST_RESULT+$?))
 docker-compose down
 
+# These tests do not need a node, or bring their own
+PYTHONPATH=$PYTHONPATH:./lib/pygasprice-client py.test --cov=plunger --cov-report=term --cov-append tests/test_stream.py tests/test_rpc.py tests/test_batch.py tests/test_discovery.py tests/test_multiple_addresses.py tests/test_blocks.py tests/test_pipeline.py tests/test_keys.py tests/test_agent.py tests/test_gas.py tests/test_startup.py tests/test_daemon.py tests/test_tracker.py tests/test_eip1559.py tests/test_escalation.py tests/test_nonces.py tests/test_chains.py tests/test_metrics.py $@
+TEST_RESULT=$((TEST_RESULT+$?))
+
 exit $TEST_RESULT
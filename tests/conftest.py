@@ -25,6 +25,7 @@ from pytest import fixture
 from web3 import HTTPProvider, Web3
 
 from plunger.keys import register_key
+from tests.mock_node import MockNode, MockSubscriptionNode
 
 @contextmanager
 def captured_output():
@@ -49,6 +50,20 @@ def web3():
     return web3
 
 
+@fixture
+def mock_node():
+    node = MockNode().start()
+    yield node
+    node.stop()
+
+
+@fixture
+def mock_subscription_node():
+    node = MockSubscriptionNode().start()
+    yield node
+    node.stop()
+
+
 @fixture
 def datadir(request):
     return py.path.local(request.module.__file__).join("..").join("data")
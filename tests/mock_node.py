@@ -0,0 +1,197 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import websockets
+
+
+class MockError(Exception):
+    # Raised by result functions to make the node respond with a JSON-RPC error
+    def __init__(self, message: str, code: int = -32010):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.node.lock:
+            self.server.node.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.server.node.fail_http():
+            response = b"<html><body>502 Bad Gateway</body></html>"
+            self.send_response(502)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+            return
+
+        response = self.server.node.respond(self.path, body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockNode:
+    # A scriptable stand-in for an Ethereum node. `results` maps JSON-RPC method names
+    # either to their results or to functions calculating results from the request params.
+    # If `batches` is not set, the node rejects batch requests like some hosted nodes do.
+    def __init__(self, results: dict = None, batches: bool = True):
+        self.results = dict(results or {})
+        self.batches = batches
+        self.requests = []
+        self.paths = []
+        self.http_requests = 0
+        self.http_errors = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+        self.server = _Server(('localhost', 0), _Handler)
+        self.server.node = self
+
+    @property
+    def endpoint_uri(self) -> str:
+        return f"http://localhost:{self.server.server_address[1]}"
+
+    @property
+    def calls(self) -> list:
+        return [request['method'] for request in self.requests]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_http(self) -> bool:
+        # The next `http_errors` requests get answered with an HTTP error, like a proxy in front of the node does
+        with self.lock:
+            if self.http_errors > 0:
+                self.http_errors -= 1
+                return True
+            return False
+
+    def respond(self, path: str, body: bytes) -> bytes:
+        return json.dumps(self.handle(path, json.loads(body))).encode('utf-8')
+
+    def handle(self, path: str, body):
+        with self.lock:
+            self.http_requests += 1
+            self.paths.append(path)
+
+        if isinstance(body, list):
+            if not self.batches:
+                return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Batch requests not supported"}}
+            return [self.call(request) for request in body]
+
+        return self.call(body)
+
+    def call(self, request: dict) -> dict:
+        with self.lock:
+            self.requests.append(request)
+
+        method = request['method']
+        if method not in self.results:
+            return {"jsonrpc": "2.0", "id": request['id'], "error": {"code": -32601, "message": f"Method {method} not found"}}
+
+        result = self.results[method]
+        if callable(result):
+            try:
+                result = result(request['params'])
+            except MockError as e:
+                return {"jsonrpc": "2.0", "id": request['id'], "error": {"code": e.code, "message": e.message}}
+        return {"jsonrpc": "2.0", "id": request['id'], "result": result}
+
+
+class MockSubscriptionNode:
+    # A WebSocket endpoint accepting `eth_subscribe newHeads`, which notifies subscribers
+    # each time `new_head()` is called. If `subscriptions` is not set, subscribing fails.
+    def __init__(self, subscriptions: bool = True):
+        self.subscriptions = subscriptions
+        self.requests = []
+        self.subscribers = []
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://localhost:{self.server.sockets[0].getsockname()[1]}"
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(websockets.serve(self.handle, 'localhost', 0))
+            started.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        return self
+
+    def stop(self):
+        async def close():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def handle(self, websocket, path):
+        async for message in websocket:
+            request = json.loads(message)
+            self.requests.append(request)
+            if self.subscriptions and request['method'] == 'eth_subscribe':
+                self.subscribers.append(websocket)
+                await websocket.send(json.dumps({"jsonrpc": "2.0", "id": request['id'], "result": "0x1"}))
+            else:
+                await websocket.send(json.dumps({"jsonrpc": "2.0", "id": request['id'],
+                                                 "error": {"code": -32601, "message": "Method not found"}}))
+
+    def new_head(self, number: int):
+        notification = json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                                   "params": {"subscription": "0x1", "result": {"number": hex(number)}}})
+        for websocket in list(self.subscribers):
+            asyncio.run_coroutine_threadsafe(websocket.send(notification), self.loop).result()
+
+    def disconnect(self):
+        for websocket in list(self.subscribers):
+            asyncio.run_coroutine_threadsafe(websocket.close(), self.loop).result()
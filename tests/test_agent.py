@@ -0,0 +1,219 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import socket
+import stat
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from eth_account import Account
+from web3 import Web3
+
+from plunger import keys
+from plunger.agent import KeyAgent, KeyAgentClient, KeyCache, keystore_id
+from plunger.keys import register_keys
+from plunger.plunger import Plunger
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+
+KEY1 = "key_file=tests/data/key1.json,pass_file=/dev/null"
+KEY2 = "key_file=tests/data/key2.json,pass_file=/dev/null"
+
+
+@pytest.fixture
+def decryptions(monkeypatch):
+    decrypted = []
+    decrypt = Account.decrypt
+
+    def counting_decrypt(keyfile_json, password):
+        decrypted.append(keyfile_json)
+        return decrypt(keyfile_json, password)
+
+    monkeypatch.setattr(Account, 'decrypt', counting_decrypt)
+    # Decryptions made by worker processes would not be counted
+    monkeypatch.setattr(keys, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    return decrypted
+
+
+@pytest.fixture
+def agent(tmpdir):
+    agent = KeyAgent(str(tmpdir.join('agent').join('agent.sock')), ttl=60)
+    threading.Thread(target=agent.serve_forever, daemon=True).start()
+    yield agent
+    agent.shutdown()
+
+
+class TestKeyCache:
+    def test_should_forget_keys_once_their_ttl_expires(self):
+        # given
+        cache = KeyCache(ttl=60)
+        cache.put('a', b'\x01', ttl=0.05)
+        cache.put('b', b'\x02')
+
+        # when
+        time.sleep(0.1)
+
+        # then
+        assert cache.get('a') is None
+        assert cache.get('b') == b'\x02'
+
+    def test_should_not_keep_keys_longer_than_its_own_ttl(self):
+        # given
+        cache = KeyCache(ttl=0.05)
+        cache.put('a', b'\x01', ttl=3600)
+
+        # when
+        time.sleep(0.1)
+
+        # then
+        assert cache.get('a') is None
+
+    def test_should_evict_keys_of_one_keystore_or_all_of_them(self):
+        # given
+        cache = KeyCache()
+        cache.put(keystore_id('tests/data/key1.json', 'v1'), b'\x01')
+        cache.put(keystore_id('tests/data/key1.json', 'v2'), b'\x02')
+        cache.put(keystore_id('tests/data/key2.json', 'v1'), b'\x03')
+
+        # expect
+        assert cache.evict('tests/data/key1.json') == 2
+        assert cache.get(keystore_id('tests/data/key2.json', 'v1')) == b'\x03'
+        assert cache.evict() == 1
+
+    def test_should_decrypt_each_keystore_only_once(self, decryptions):
+        # given
+        cache = KeyCache()
+
+        # when
+        accounts = register_keys(Web3(), [KEY1, KEY2, KEY1], cache)
+
+        # then
+        assert len(decryptions) == 2
+        assert accounts[0].address == accounts[2].address
+
+
+class TestKeyAgent:
+    def test_should_only_be_accessible_by_its_owner(self, agent):
+        assert stat.S_IMODE(os.stat(agent.socket_path).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(os.path.dirname(agent.socket_path)).st_mode) == 0o700
+
+    def test_should_reuse_keys_decrypted_by_earlier_runs(self, agent, decryptions):
+        # when
+        first = register_keys(Web3(), [KEY1, KEY2], KeyAgentClient(agent.socket_path))
+        second = register_keys(Web3(), [KEY1, KEY2], KeyAgentClient(agent.socket_path))
+
+        # then
+        assert len(decryptions) == 2
+        assert [account.address for account in first] == [account.address for account in second]
+
+    def test_should_decrypt_again_after_eviction(self, agent, decryptions):
+        # given
+        client = KeyAgentClient(agent.socket_path)
+        register_keys(Web3(), [KEY1, KEY2], client)
+
+        # when
+        assert client.evict(os.path.abspath('tests/data/key1.json')) == 1
+        register_keys(Web3(), [KEY1, KEY2], client)
+
+        # then
+        assert len(decryptions) == 3
+
+    def test_should_replace_socket_left_behind_by_earlier_agent(self, tmpdir):
+        # given
+        socket_path = str(tmpdir.join('agent.sock'))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(socket_path)
+
+        # when
+        agent = KeyAgent(socket_path)
+        threading.Thread(target=agent.serve_forever, daemon=True).start()
+
+        # then
+        assert KeyAgentClient(socket_path).evict() == 0
+        agent.shutdown()
+
+    def test_should_not_start_if_another_agent_is_running(self, agent):
+        # expect
+        with pytest.raises(ValueError, match="already listening"):
+            KeyAgent(agent.socket_path)
+        assert KeyAgentClient(agent.socket_path).evict() == 0
+
+    def test_should_not_remove_file_which_is_not_a_socket(self, tmpdir):
+        # given
+        socket_path = tmpdir.join('agent.sock')
+        socket_path.write("some data")
+
+        # expect
+        with pytest.raises(ValueError, match="not a socket"):
+            KeyAgent(str(socket_path))
+        assert socket_path.read() == "some data"
+
+    def test_should_evict_keys_by_paths_relative_to_the_client(self, tmpdir):
+        # given
+        socket_path = str(tmpdir.join('agent.sock'))
+        agent = subprocess.Popen([sys.executable, "-m", "plunger.agent", "--socket", socket_path], cwd=str(tmpdir),
+                                 env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)), stderr=subprocess.DEVNULL)
+        try:
+            client = KeyAgentClient(socket_path)
+            for _ in range(100):
+                if os.path.exists(socket_path):
+                    break
+                time.sleep(0.05)
+            client.put(keystore_id('tests/data/key1.json', 'v1'), b'\x01')
+
+            # expect
+            assert client.evict('tests/data/key1.json') == 1
+        finally:
+            agent.terminate()
+            agent.wait()
+
+    def test_should_decrypt_keys_if_agent_is_not_running(self, tmpdir, decryptions):
+        # given
+        client = KeyAgentClient(str(tmpdir.join('missing.sock')))
+
+        # when
+        with captured_output() as (out, err):
+            accounts = register_keys(Web3(), [KEY1], client)
+
+        # then
+        assert len(accounts) == 1
+        assert len(decryptions) == 1
+        assert "WARNING: Cannot use the key agent" in err.getvalue()
+
+
+class TestPlungerKeyAgent(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def test_should_use_key_agent(self, mock_node, datadir, agent, decryptions):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+
+        # when
+        for _ in range(2):
+            plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --list --eth-key {KEY1}"
+                                                           f" --key-agent {agent.socket_path} {self.some_account}"))
+
+            # then
+            assert self.some_account.lower() in plunger.signers
+
+        # and
+        assert len(decryptions) == 1
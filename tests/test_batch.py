@@ -0,0 +1,138 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+import pytest
+import requests
+
+from plunger.plunger import Plunger
+from plunger.rpc import RpcBatch, RpcError, RpcSession, rpc_call
+from tests.conftest import args, captured_output
+
+
+class TestRpcBatch:
+    def test_should_send_independent_calls_in_one_request(self, mock_node):
+        # given
+        mock_node.results = {'web3_clientVersion': 'Geth/v1.10.1', 'eth_chainId': '0x1'}
+        batch = RpcBatch(RpcSession(), mock_node.endpoint_uri)
+
+        # when
+        client_version = batch.add("web3_clientVersion", [])
+        chain_id = batch.add("eth_chainId", [])
+        gas_price = batch.add("eth_gasPrice", [])
+        batch.execute()
+
+        # then
+        assert mock_node.http_requests == 1
+        assert client_version.result() == 'Geth/v1.10.1'
+        assert chain_id.result() == '0x1'
+        with pytest.raises(RpcError, match="eth_gasPrice failed"):
+            gas_price.result()
+
+    def test_should_fall_back_to_separate_requests_if_node_rejects_batches(self, mock_node):
+        # given
+        mock_node.results = {'web3_clientVersion': 'Geth/v1.10.1', 'eth_chainId': '0x1'}
+        mock_node.batches = False
+        session = RpcSession()
+
+        # when
+        for _ in range(2):
+            batch = RpcBatch(session, mock_node.endpoint_uri)
+            client_version = batch.add("web3_clientVersion", [])
+            chain_id = batch.add("eth_chainId", [])
+            batch.execute()
+
+            assert client_version.result() == 'Geth/v1.10.1'
+            assert chain_id.result() == '0x1'
+
+        # then
+        assert session.batches_supported is False
+        assert mock_node.http_requests == 1 + 2 + 2
+
+    def test_should_keep_sending_batches_after_http_errors(self, mock_node):
+        # given
+        mock_node.results = {'web3_clientVersion': 'Geth/v1.10.1', 'eth_chainId': '0x1'}
+        mock_node.http_errors = 1
+        session = RpcSession()
+
+        # when
+        batch = RpcBatch(session, mock_node.endpoint_uri)
+        batch.add("web3_clientVersion", [])
+        batch.add("eth_chainId", [])
+        with pytest.raises(requests.exceptions.HTTPError, match="502"):
+            batch.execute()
+
+        batch = RpcBatch(session, mock_node.endpoint_uri)
+        chain_id = batch.add("eth_chainId", [])
+        batch.add("web3_clientVersion", [])
+        batch.execute()
+
+        # then
+        assert chain_id.result() == '0x1'
+        assert session.batches_supported is True
+        assert mock_node.http_requests == 1
+
+    def test_should_raise_http_errors_of_separate_requests(self, mock_node):
+        # given
+        mock_node.results = {'eth_chainId': '0x1'}
+        mock_node.http_errors = 1
+
+        # expect
+        with pytest.raises(requests.exceptions.HTTPError, match="502"):
+            rpc_call(RpcSession(), mock_node.endpoint_uri, "eth_chainId", [])
+
+
+class TestPlungerMockNodeUtils:
+    @staticmethod
+    def plunger_args(mock_node, arguments: str) -> list:
+        host, port = mock_node.endpoint_uri.rsplit(':', 1)
+        return args(f"--rpc-host {host} --rpc-port {port} {arguments}")
+
+    @staticmethod
+    def mock_parity_node(mock_node, datadir, account: str):
+        parity = json.loads(datadir.join('parity').join('response.json').read_text('utf-8').replace('OUR_ADDRESS', account.upper()))
+        geth = json.loads(datadir.join('geth').join('response.json').read_text('utf-8').replace('OUR_ADDRESS', account.upper()))
+        mock_node.results = {'web3_clientVersion': 'OpenEthereum//v3.0.1-stable',
+                             'eth_chainId': '0x1',
+                             'eth_getTransactionCount': '0x9',
+                             'parity_pendingTransactions': parity['result'],
+                             'txpool_contentFrom': geth['result']}
+
+
+class TestPlungerBatch(TestPlungerMockNodeUtils):
+    @pytest.mark.parametrize("batches, http_requests", [(True, 2), (False, 6)])
+    def test_should_list_pending_transactions_in_two_round_trips(self, mock_node, datadir, batches, http_requests):
+        # given
+        some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+        self.mock_parity_node(mock_node, datadir, some_account)
+        mock_node.batches = batches
+
+        # when
+        with captured_output() as (out, err):
+            Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from,geth_txpool --json --list {some_account}")).main()
+
+        # then
+        assert json.loads(out.getvalue().splitlines()[-1]) == [
+            {'hash': '0x72e7a42d3e1b0773f62cfa9ee2bc54ff904a908ac2a668678f9c4880fd046f7a', 'nonce': 9},
+            {'hash': '0x124cb0887d0ea364b402fcc1369b7f9bf4d651bc77d2445aefbeab538dd3aab9', 'nonce': 10},
+            {'hash': '0x53050e62c81fbe440d97d703860096467089bd37b2ad4cc6c699acf217436a64', 'nonce': 11},
+            {'hash': '0x8d5ab0e9a5c3b7f3e1d2b6a5c4f8e9d0a1b2c3d4e5f60718293a4b5c6d7e8f90', 'nonce': 12}
+        ]
+        assert mock_node.http_requests == http_requests
+        assert mock_node.calls == ['web3_clientVersion', 'eth_chainId', 'eth_getTransactionCount',
+                                   'parity_pendingTransactions', 'txpool_contentFrom']
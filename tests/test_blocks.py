@@ -0,0 +1,309 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+import pytest
+
+from plunger.blocks import FilterBlockWatcher, PollingBlockWatcher, PollScheduler, SubscriptionBlockWatcher
+from plunger.plunger import Plunger
+from plunger.rpc import RpcError, RpcSession
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+
+
+class MockChain:
+    # Mines a block every `block_every` filter polls, each block mining one transaction of ours
+    def __init__(self, nonce: int, block_every: int):
+        self.nonce = nonce
+        self.block_every = block_every
+        self.polls = 0
+
+    def get_filter_changes(self, params):
+        self.polls += 1
+        if self.polls % self.block_every == 0:
+            self.nonce += 1
+            return ["0x%064x" % self.polls]
+        return []
+
+    def get_transaction_count(self, params):
+        return hex(self.nonce)
+
+
+class TestPollScheduler:
+    def test_should_poll_at_min_interval_while_block_time_is_unknown(self):
+        # given
+        scheduler = PollScheduler(1, 8, jitter=0)
+
+        # expect
+        assert [scheduler.next(now=0) for _ in range(4)] == [1, 1, 1, 1]
+
+        # when
+        scheduler.block_seen(now=0)
+
+        # then
+        assert scheduler.next(now=1) == 1
+
+    def test_should_sleep_until_next_block_is_expected_then_back_off(self):
+        # given
+        scheduler = PollScheduler(1, 30, jitter=0)
+        scheduler.block_seen(now=100)
+        scheduler.block_seen(now=112)
+
+        # expect
+        assert scheduler.block_time == 12
+        assert scheduler.next(now=113) == 11
+        assert scheduler.next(now=123.5) == 1
+        assert [scheduler.next(now=124) for _ in range(6)] == [1, 2, 4, 8, 16, 30]
+
+        # when
+        scheduler.block_seen(now=130)
+
+        # then
+        assert scheduler.block_time == pytest.approx(13.8)
+        assert scheduler.next(now=130) == pytest.approx(13.8)
+
+    def test_should_use_block_time_reported_by_node(self):
+        # given
+        scheduler = PollScheduler(1, 30, jitter=0)
+
+        # when
+        scheduler.block_seen(blocks=2, block_time=5, now=100)
+
+        # then
+        assert scheduler.next(now=101) == 4
+
+    def test_should_stay_within_min_and_max_intervals(self):
+        # given
+        scheduler = PollScheduler(2, 10, jitter=0)
+        scheduler.block_seen(block_time=60, now=0)
+
+        # expect
+        assert scheduler.next(now=0) == 10
+        assert scheduler.next(now=59.5) == 2
+
+    def test_should_add_jitter(self):
+        # given
+        intervals = [PollScheduler(1, 8, jitter=0.2).next() for _ in range(50)]
+
+        # expect
+        assert all(1 <= interval <= 1.2 for interval in intervals)
+        assert len(set(intervals)) > 1
+
+
+class TestPollingBlockWatcher:
+    def test_should_return_once_a_new_block_is_seen(self, mock_node):
+        # given
+        blocks = iter([{'number': '0x64', 'timestamp': '0x3e8'}, {'number': '0x64', 'timestamp': '0x3e8'},
+                       {'number': '0x66', 'timestamp': '0x400'}])
+        mock_node.results = {'eth_getBlockByNumber': lambda params: next(blocks)}
+        scheduler = PollScheduler(0.01, 0.01)
+        watcher = PollingBlockWatcher(RpcSession(), mock_node.endpoint_uri, scheduler)
+
+        # when
+        watcher.wait_for_block()
+
+        # then
+        assert mock_node.calls == ['eth_getBlockByNumber'] * 3
+        assert scheduler.block_time == 12
+
+    def test_should_return_after_each_interval_if_node_cannot_tell_blocks(self, mock_node):
+        # given
+        watcher = PollingBlockWatcher(RpcSession(), mock_node.endpoint_uri, PollScheduler(0.01, 0.01))
+
+        # when
+        watcher.wait_for_block()
+
+        # then
+        assert mock_node.calls == ['eth_getBlockByNumber'] * 2
+
+
+class TestFilterBlockWatcher:
+    def test_should_return_only_once_filter_reports_a_block(self, mock_node):
+        # given
+        chain = MockChain(nonce=9, block_every=3)
+        mock_node.results = {'eth_newBlockFilter': '0xf1', 'eth_getFilterChanges': chain.get_filter_changes}
+        watcher = FilterBlockWatcher(RpcSession(), mock_node.endpoint_uri, PollScheduler(0.01, 0.01))
+
+        # when
+        watcher.wait_for_block()
+
+        # then
+        assert chain.polls == 3
+        assert mock_node.calls == ['eth_newBlockFilter'] + ['eth_getFilterChanges'] * 3
+
+    def test_should_install_new_filter_if_node_dropped_it(self, mock_node):
+        # given
+        filter_ids = iter(['0xf1', '0xf2'])
+        mock_node.results = {'eth_newBlockFilter': lambda params: next(filter_ids)}
+        watcher = FilterBlockWatcher(RpcSession(), mock_node.endpoint_uri, PollScheduler(0.01, 0.01))
+
+        # when
+        watcher.wait_for_block()
+
+        # then
+        assert watcher.filter_id == '0xf2'
+
+    def test_should_fail_if_node_does_not_support_filters(self, mock_node):
+        with pytest.raises(RpcError, match="eth_newBlockFilter"):
+            FilterBlockWatcher(RpcSession(), mock_node.endpoint_uri, PollScheduler())
+
+
+class TestSubscriptionBlockWatcher:
+    @pytest.mark.timeout(10)
+    def test_should_return_once_new_head_arrives(self, mock_subscription_node):
+        # given
+        watcher = SubscriptionBlockWatcher(mock_subscription_node.ws_url)
+        threading.Timer(0.2, lambda: mock_subscription_node.new_head(1)).start()
+
+        # when
+        started = time.time()
+        watcher.wait_for_block()
+        watcher.close()
+
+        # then
+        assert time.time() - started >= 0.2
+        assert mock_subscription_node.requests[0]['method'] == 'eth_subscribe'
+        assert mock_subscription_node.requests[0]['params'] == ['newHeads']
+
+    @pytest.mark.timeout(10)
+    def test_should_fail_if_node_rejects_subscription(self, mock_subscription_node):
+        # given
+        mock_subscription_node.subscriptions = False
+
+        # expect
+        with pytest.raises(ConnectionError, match="eth_subscribe failed"):
+            SubscriptionBlockWatcher(mock_subscription_node.ws_url)
+
+    @pytest.mark.timeout(10)
+    def test_should_fail_if_subscription_gets_lost(self, mock_subscription_node):
+        # given
+        watcher = SubscriptionBlockWatcher(mock_subscription_node.ws_url)
+
+        # when
+        mock_subscription_node.disconnect()
+
+        # then
+        with pytest.raises(ConnectionError, match="has been lost"):
+            watcher.wait_for_block()
+
+
+class TestPlungerWaitForBlocks(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def plunger(self, mock_node, datadir, arguments: str) -> Plunger:
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        return Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --wait --poll-min-interval 0.01"
+                                                    f" --poll-max-interval 0.04 {arguments} {self.some_account}"))
+
+    @pytest.mark.timeout(10)
+    def test_should_check_nonce_only_when_block_filter_reports_a_block(self, mock_node, datadir):
+        # given
+        chain = MockChain(nonce=9, block_every=5)
+        plunger = self.plunger(mock_node, datadir, "")
+        mock_node.results['eth_newBlockFilter'] = '0xf1'
+        mock_node.results['eth_getFilterChanges'] = chain.get_filter_changes
+        mock_node.results['eth_getTransactionCount'] = chain.get_transaction_count
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("All pending transactions have been mined.\n")
+        assert chain.polls == 15
+        assert mock_node.calls.count('eth_getTransactionCount') == 1 + 1 + 3
+        assert mock_node.calls[-1] == 'eth_uninstallFilter'
+
+    @pytest.mark.timeout(10)
+    def test_should_fall_back_to_polling_if_node_does_not_support_filters(self, mock_node, datadir):
+        # given
+        nonces = iter(['0x9', '0x9', '0xa', '0xb', '0xc'])
+        plunger = self.plunger(mock_node, datadir, "")
+        mock_node.results['eth_getTransactionCount'] = lambda params: next(nonces)
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("All pending transactions have been mined.\n")
+        assert "WARNING: Cannot install a block filter" in err.getvalue()
+        assert mock_node.calls.count('eth_getTransactionCount') == 1 + 5
+
+    @pytest.mark.timeout(10)
+    def test_should_check_nonce_only_when_subscription_reports_a_block(self, mock_node, mock_subscription_node, datadir):
+        # given
+        nonces = iter(['0x9', '0xc'])
+        plunger = self.plunger(mock_node, datadir, f"--rpc-ws-url {mock_subscription_node.ws_url}")
+        mock_node.results['eth_getTransactionCount'] = lambda params: next(nonces)
+        threading.Timer(0.5, lambda: mock_subscription_node.new_head(1)).start()
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("All pending transactions have been mined.\n")
+        assert mock_node.calls.count('eth_getTransactionCount') == 1 + 2
+        assert 'eth_newBlockFilter' not in mock_node.calls
+
+    @pytest.mark.timeout(10)
+    def test_should_fall_back_to_polling_if_subscription_gets_lost(self, mock_node, mock_subscription_node, datadir):
+        # given
+        nonces = iter(['0x9', '0x9', '0x9', '0xc'])
+        plunger = self.plunger(mock_node, datadir, f"--rpc-ws-url {mock_subscription_node.ws_url} --wait-mode subscribe")
+        mock_node.results['eth_getTransactionCount'] = lambda params: next(nonces)
+        threading.Timer(0.5, mock_subscription_node.disconnect).start()
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("All pending transactions have been mined.\n")
+        assert "WARNING: Watching for new blocks failed" in err.getvalue()
+        assert mock_node.calls.count('eth_getTransactionCount') == 1 + 4
+
+    def test_should_require_ws_url_to_subscribe(self, mock_node, datadir):
+        with pytest.raises(SystemExit):
+            with captured_output() as (out, err):
+                self.plunger(mock_node, datadir, "--wait-mode subscribe")
+
+    def test_should_require_min_interval_not_greater_than_max_interval(self, mock_node, datadir):
+        with pytest.raises(SystemExit):
+            with captured_output() as (out, err):
+                self.plunger(mock_node, datadir, "--poll-min-interval 1 --poll-max-interval 0.5")
+
+    @pytest.mark.timeout(10)
+    def test_should_report_calls_used_by_wait(self, mock_node, datadir):
+        # given
+        chain = MockChain(nonce=9, block_every=2)
+        plunger = self.plunger(mock_node, datadir, "--stats")
+        mock_node.results['eth_newBlockFilter'] = '0xf1'
+        mock_node.results['eth_getFilterChanges'] = chain.get_filter_changes
+        mock_node.results['eth_getTransactionCount'] = chain.get_transaction_count
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        # newBlockFilter, 4 nonce checks, 6 filter polls and uninstallFilter
+        assert "Waiting took " in err.getvalue()
+        assert ", 12 JSON-RPC call(s) in 12 HTTP request(s)" in err.getvalue()
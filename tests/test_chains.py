@@ -0,0 +1,119 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+
+import pytest
+
+from plunger import plunger as plunger_module
+from plunger.chains import ChainCache, chain_name
+from plunger.plunger import Plunger
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+
+
+class TestChainCache:
+    @staticmethod
+    def chain_cache(tmpdir, cache_ttl: float = 30) -> ChainCache:
+        return ChainCache(cache_file=str(tmpdir.join('chains.json')), cache_ttl=cache_ttl)
+
+    def test_should_reuse_chain_cached_by_earlier_run(self, tmpdir):
+        # given
+        self.chain_cache(tmpdir).write("http://localhost:8545", "Geth/v1.10.1", 5)
+
+        # expect
+        assert self.chain_cache(tmpdir).read("http://localhost:8545") == ("Geth/v1.10.1", 5)
+
+    def test_should_keep_chains_of_each_endpoint_separately(self, tmpdir):
+        # given
+        self.chain_cache(tmpdir).write("http://localhost:8545", "Geth/v1.10.1", 5)
+        self.chain_cache(tmpdir).write("http://localhost:8645", "OpenEthereum//v3.0.1-stable", 42)
+
+        # expect
+        assert self.chain_cache(tmpdir).read("http://localhost:8545") == ("Geth/v1.10.1", 5)
+        assert self.chain_cache(tmpdir).read("http://localhost:8645") == ("OpenEthereum//v3.0.1-stable", 42)
+        assert self.chain_cache(tmpdir).read("http://localhost:8745") is None
+
+    def test_should_not_reuse_expired_chain(self, tmpdir):
+        # given
+        tmpdir.join('chains.json').write(json.dumps({"http://localhost:8545": {'client_version': "Geth/v1.10.1", 'chain_id': 5,
+                                                                               'timestamp': time.time() - 31}}))
+
+        # expect
+        assert self.chain_cache(tmpdir).read("http://localhost:8545") is None
+
+    def test_should_not_cache_if_disabled(self, tmpdir):
+        # when
+        self.chain_cache(tmpdir, cache_ttl=0).write("http://localhost:8545", "Geth/v1.10.1", 5)
+
+        # then
+        assert not tmpdir.join('chains.json').exists()
+        assert self.chain_cache(tmpdir).read("http://localhost:8545") is None
+
+    def test_should_ignore_corrupted_cache(self, tmpdir):
+        # given
+        tmpdir.join('chains.json').write("[1, 2")
+
+        # when
+        self.chain_cache(tmpdir).write("http://localhost:8545", "Geth/v1.10.1", 5)
+
+        # then
+        assert self.chain_cache(tmpdir).read("http://localhost:8545") == ("Geth/v1.10.1", 5)
+
+
+class TestChainName:
+    @pytest.mark.parametrize("chain_id, name", [(1, "mainnet"), (5, "goerli"), (42, "kovan"),
+                                                (11155111, "sepolia"), (17, "unknown")])
+    def test_should_name_known_chains(self, chain_id, name):
+        assert chain_name(chain_id) == name
+
+
+class TestPlungerChainCache(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def list(self, mock_node, arguments: str):
+        with captured_output() as (out, err):
+            Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from {arguments} --list {self.some_account}")).main()
+        return out.getvalue()
+
+    def test_should_not_ask_node_for_chain_again_within_ttl(self, mock_node, datadir, tmpdir, monkeypatch):
+        # given
+        monkeypatch.setattr(plunger_module, 'ChainCache',
+                            lambda cache_ttl: ChainCache(cache_file=str(tmpdir.join('chains.json')), cache_ttl=cache_ttl))
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        self.list(mock_node, "--chain-cache-ttl 60")
+        mock_node.requests.clear()
+
+        # when
+        out = self.list(mock_node, "--chain-cache-ttl 60")
+
+        # then
+        assert "pending transactions on mainnet" in out
+        assert mock_node.calls == ['eth_getTransactionCount', 'parity_pendingTransactions']
+
+    def test_should_ask_node_for_chain_every_time_by_default(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        self.list(mock_node, "")
+        mock_node.requests.clear()
+
+        # when
+        self.list(mock_node, "")
+
+        # then
+        assert mock_node.calls == ['web3_clientVersion', 'eth_chainId', 'eth_getTransactionCount', 'parity_pendingTransactions']
@@ -0,0 +1,296 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+import time
+
+import requests
+
+from plunger.api import ApiServer
+from plunger.daemon import Daemon
+from plunger.plunger import Plunger
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+from tests.test_pipeline import MockPool
+
+
+class MockPendingChain:
+    # Transactions sent from `address` stay pending until `mine()` is called
+    def __init__(self, address: str, nonce: int, pending: list):
+        self.address = address
+        self.nonce = nonce
+        self.block_number = 100
+        self.pending = {nonce: "0x%064x" % nonce for nonce in pending}
+        self.pool = MockPool()
+
+    def results(self) -> dict:
+        return {'web3_clientVersion': 'OpenEthereum//v3.0.1-stable',
+                'eth_chainId': '0x1',
+                'eth_gasPrice': hex(5000000000),
+                'eth_estimateGas': hex(21000),
+                'eth_blockNumber': lambda params: hex(self.block_number),
+                'eth_getBlockByNumber': lambda params: {'number': hex(self.block_number), 'timestamp': hex(self.block_number),
+                                                                 'gasLimit': hex(10000000)},
+                'eth_getTransactionCount': lambda params: hex(self.nonce),
+                'eth_sendTransaction': self.send_transaction,
+                'parity_pendingTransactions': lambda params: [{'hash': tx_hash, 'nonce': hex(nonce), 'from': self.address.lower(),
+                                                               'blockNumber': None} for nonce, tx_hash in self.pending.items()]}
+
+    def send_transaction(self, params):
+        tx_hash = self.pool.send_transaction(params)
+        self.pending[int(params[0]['nonce'], 16)] = tx_hash
+        return tx_hash
+
+    def mine(self, blocks: int = 1):
+        self.block_number += blocks
+        for nonce in sorted(self.pending.keys())[:1]:
+            del self.pending[nonce]
+            self.nonce = nonce + 1
+
+
+class DaemonTestUtils(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def daemon(self, mock_node, chain: MockPendingChain, arguments: str = "") -> Daemon:
+        mock_node.results = chain.results()
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --daemon {arguments} {self.some_account}"))
+        return Daemon(plunger, stuck_blocks=plunger.arguments.stuck_blocks, stuck_seconds=plunger.arguments.stuck_seconds)
+
+    @staticmethod
+    def wait_for_status(api: ApiServer, block_number: int) -> dict:
+        for _ in range(100):
+            status = requests.get(api.url + "/status").json()
+            if status.get('block_number') == block_number:
+                return status
+            time.sleep(0.05)
+        return status
+
+
+class TestDaemon(DaemonTestUtils):
+    def test_should_replace_transactions_pending_for_too_many_blocks(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9, 10])
+        daemon = self.daemon(mock_node, chain, "--stuck-blocks 3")
+
+        # when
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            chain.block_number += 2
+            daemon.check(now=1)
+
+        # then
+        assert chain.pool.sent == []
+
+        # when
+        with captured_output() as (out, err):
+            chain.block_number += 1
+            daemon.check(now=2)
+
+        # then
+        assert out.getvalue() == f"""Replacing 2 transaction(s) from {self.some_account} stuck since block 100
+Sent replacement transaction with nonce=9, gas_price=5000000000, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef09.
+Sent replacement transaction with nonce=10, gas_price=5000000000, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef0a.
+"""
+        assert [tx['nonce'] for tx in chain.pool.sent] == [9, 10]
+
+    def test_should_replace_transactions_pending_for_too_long(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9])
+        daemon = self.daemon(mock_node, chain, "--stuck-seconds 60")
+
+        # when
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            daemon.check(now=59)
+            daemon.check(now=60)
+
+        # then
+        assert [tx['nonce'] for tx in chain.pool.sent] == [9]
+
+    def test_should_replace_each_nonce_only_once(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9, 10])
+        daemon = self.daemon(mock_node, chain, "--stuck-blocks 1")
+
+        # when
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            chain.block_number += 1
+            daemon.check(now=1)
+            chain.mine()
+            daemon.check(now=2)
+            chain.block_number += 5
+            daemon.check(now=3)
+
+        # then
+        assert [tx['nonce'] for tx in chain.pool.sent] == [9, 10]
+        assert daemon.status()['replacements_sent'] == 2
+        assert daemon.status()['addresses'][self.some_account] == [{'hash': "0x%064x" % (0xbeef00 + 10), 'nonce': 10,
+                                                                     'first_seen_block': 102, 'first_seen_at': 2,
+                                                                     'replaced': True}]
+
+    def test_should_replace_new_transactions_sent_after_earlier_replacements(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9])
+        daemon = self.daemon(mock_node, chain, "--stuck-blocks 1")
+
+        # when
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            chain.block_number += 1
+            daemon.check(now=1)
+            chain.pending[10] = "0x%064x" % 10
+            daemon.check(now=2)
+            chain.block_number += 1
+            daemon.check(now=3)
+
+        # then
+        assert [tx['nonce'] for tx in chain.pool.sent] == [9, 10]
+        assert daemon.status()['replacements_sent'] == 2
+
+    def test_should_escalate_replacements_which_stay_pending(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9])
+        daemon = self.daemon(mock_node, chain, "--stuck-blocks 1 --escalate-blocks 2")
+
+        # when
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            chain.block_number += 1
+            daemon.check(now=1)
+            chain.block_number += 1
+            daemon.check(now=2)
+            chain.block_number += 1
+            daemon.check(now=3)
+
+        # then
+        assert [(tx['nonce'], tx['gasPrice']) for tx in chain.pool.sent] == [(9, 5000000000), (9, 6000000000)]
+        assert daemon.status()['replacements_sent'] == 1
+
+    def test_should_keep_running_and_serve_status(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9])
+        daemon = self.daemon(mock_node, chain, "--wait-mode poll --poll-min-interval 0.01 --poll-max-interval 0.02 --stuck-blocks 2")
+        api = ApiServer(daemon).start()
+        thread = threading.Thread(target=daemon.run, daemon=True)
+
+        # when
+        with captured_output() as (out, err):
+            thread.start()
+            for _ in range(3):
+                time.sleep(0.1)
+                chain.block_number += 1
+            status = self.wait_for_status(api, block_number=103)
+            daemon.stop()
+            chain.block_number += 1
+            thread.join(5)
+            api.stop()
+
+        # then
+        assert not thread.is_alive()
+        assert [tx['nonce'] for tx in chain.pool.sent] == [9]
+        assert status['block_number'] == 103
+        assert status['addresses'][self.some_account][0]['replaced'] is True
+
+
+class TestApiServer(DaemonTestUtils):
+    def api(self, mock_node, chain: MockPendingChain) -> tuple:
+        daemon = self.daemon(mock_node, chain)
+        return daemon, ApiServer(daemon).start()
+
+    def test_should_list_pending_transactions_like_list_json_does(self, mock_node):
+        # given
+        daemon, api = self.api(mock_node, MockPendingChain(self.some_account, 9, [9, 10]))
+
+        # when
+        response = requests.get(f"{api.url}/pending/{self.some_account.lower()}")
+        api.stop()
+
+        # then
+        assert response.status_code == 200
+        assert response.json() == [{'hash': "0x%064x" % 9, 'nonce': 9}, {'hash': "0x%064x" % 10, 'nonce': 10}]
+
+    def test_should_list_pending_transactions_found_by_the_last_check(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9, 10])
+        daemon, api = self.api(mock_node, chain)
+        with captured_output() as (out, err):
+            daemon.check()
+        calls = len(mock_node.calls)
+
+        # when
+        responses = [requests.get(f"{api.url}/pending/{self.some_account}") for _ in range(3)]
+        api.stop()
+
+        # then
+        assert all(response.json() == [{'hash': "0x%064x" % 9, 'nonce': 9}, {'hash': "0x%064x" % 10, 'nonce': 10}]
+                   for response in responses)
+        assert len(mock_node.calls) == calls
+
+    def test_should_plunge_straight_away(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9])
+        daemon, api = self.api(mock_node, chain)
+
+        # when
+        with captured_output() as (out, err):
+            response = requests.post(f"{api.url}/plunge/{self.some_account}")
+        api.stop()
+
+        # then
+        assert response.json() == [{'nonce': 9, 'gas_price': 5000000000, 'tx_hash': "0x%064x" % (0xbeef00 + 9)}]
+        assert [tx['nonce'] for tx in chain.pool.sent] == [9]
+
+    def test_should_wait_until_transactions_get_mined(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9])
+        daemon, api = self.api(mock_node, chain)
+
+        def mine():
+            time.sleep(0.2)
+            chain.mine()
+            daemon.check()
+
+        # when
+        threading.Thread(target=mine, daemon=True).start()
+        started = time.monotonic()
+        response = requests.get(f"{api.url}/wait/{self.some_account}?timeout=5")
+        api.stop()
+
+        # then
+        assert response.json() == {'mined': True, 'pending': []}
+        assert time.monotonic() - started < 2
+
+    def test_should_stop_waiting_after_timeout(self, mock_node):
+        # given
+        daemon, api = self.api(mock_node, MockPendingChain(self.some_account, 9, [9]))
+
+        # when
+        response = requests.get(f"{api.url}/wait/{self.some_account}?timeout=0.1")
+        api.stop()
+
+        # then
+        assert response.json() == {'mined': False, 'pending': [{'hash': "0x%064x" % 9, 'nonce': 9}]}
+
+    def test_should_reject_unknown_addresses_and_endpoints(self, mock_node):
+        # given
+        daemon, api = self.api(mock_node, MockPendingChain(self.some_account, 9, [9]))
+
+        # expect
+        assert requests.get(f"{api.url}/pending/0x0101010101010101010101010101010101010101").status_code == 404
+        assert requests.get(f"{api.url}/plunge/{self.some_account}").status_code == 404
+        assert requests.get(f"{api.url}/wait/{self.some_account}?timeout=soon").status_code == 400
+        api.stop()
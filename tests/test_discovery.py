@@ -0,0 +1,164 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import pytest
+
+from plunger.plunger import Plunger, Transaction
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+
+
+def delayed(seconds: float, result):
+    return lambda params: time.sleep(seconds) or result
+
+
+class TestPlungerDiscovery(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def test_should_merge_transactions_from_all_sources(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+
+        # when
+        with captured_output() as (out, err):
+            Plunger(self.plunger_args(mock_node, f"--source parity_txqueue,geth_txpool --json --list {self.some_account}")).main()
+
+        # then
+        assert list(map(lambda tx: tx['nonce'], json.loads(out.getvalue().splitlines()[-1]))) == [9, 10, 11, 12]
+
+    def test_should_send_calls_filtering_by_sender_to_the_endpoint_itself(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+
+        # when
+        with captured_output() as (out, err):
+            Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from,geth_txpool --list {self.some_account}")).main()
+
+        # then
+        assert 'txpool_contentFrom' in mock_node.calls
+        assert set(mock_node.paths) == {"/"}
+
+    def test_should_query_sources_concurrently(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['parity_pendingTransactions'] = delayed(1, mock_node.results['parity_pendingTransactions'])
+        mock_node.results['txpool_contentFrom'] = delayed(1, mock_node.results['txpool_contentFrom'])
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue,geth_txpool --list {self.some_account}"))
+
+        # when
+        started = time.time()
+        transactions = plunger.get_pending_transactions()[self.some_account]
+
+        # then
+        assert time.time() - started < 1.9
+        assert list(map(lambda tx: tx.nonce, transactions)) == [9, 10, 11, 12]
+
+    def test_should_take_transactions_from_the_first_source_to_respond(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['parity_pendingTransactions'] = delayed(2, mock_node.results['parity_pendingTransactions'])
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue,geth_txpool --discovery-mode first --list {self.some_account}"))
+
+        # when
+        started = time.time()
+        transactions = plunger.get_pending_transactions()[self.some_account]
+
+        # then
+        assert time.time() - started < 1.5
+        assert list(map(lambda tx: tx.nonce, transactions)) == [9, 10, 12]
+
+    def test_should_exit_without_waiting_for_sources_which_are_not_needed(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['parity_pendingTransactions'] = delayed(8, mock_node.results['parity_pendingTransactions'])
+        args = self.plunger_args(mock_node, f"--source parity_txqueue_from,geth_txpool --discovery-mode first"
+                                            f" --list {self.some_account}")
+
+        # when
+        started = time.time()
+        output = subprocess.check_output([sys.executable, "-m", "plunger.plunger"] + args,
+                                         env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+        # then
+        assert time.time() - started < 5
+        assert "There are 3 pending transactions" in output.decode('utf-8')
+
+    def test_should_ignore_sources_which_fail_or_time_out(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['parity_pendingTransactions'] = delayed(2, [])
+        del mock_node.results['txpool_contentFrom']
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue,geth_txpool,jsonrpc_getblock"
+                                                       f" --source-timeout 0.5 --list {self.some_account}"))
+        mock_node.results['eth_getBlockByNumber'] = {'transactions': []}
+
+        # when
+        with captured_output() as (out, err):
+            transactions = plunger.get_pending_transactions()[self.some_account]
+
+        # then
+        assert transactions == []
+        assert "WARNING: Source geth_txpool failed: txpool_contentFrom failed" in err.getvalue()
+        # either the source timeout or the read timeout of its request can fire first
+        assert re.search("WARNING: Source parity_txqueue (did not respond in 0.5s|failed: .*Read timed out)", err.getvalue())
+
+    def test_should_fail_if_no_source_responds(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        del mock_node.results['txpool_contentFrom']
+        plunger = Plunger(self.plunger_args(mock_node, f"--source geth_txpool --list {self.some_account}"))
+
+        # when
+        with captured_output() as (out, err):
+            with pytest.raises(SystemExit):
+                plunger.get_pending_transactions()
+
+        # then
+        assert "None of the sources responded" in err.getvalue()
+
+    def test_should_keep_prices_and_payloads_of_discovered_transactions(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue --list {self.some_account}"))
+
+        # when
+        transactions = plunger.get_pending_transactions()[self.some_account]
+
+        # then
+        assert [tx.gas_price for tx in transactions] == [0xbdfd63e00, 0xbdfd63e00, 0xba43b7400]
+        assert [tx.value for tx in transactions] == [0, 0x5bc1f972efb8000, 0x370f72a2bbef800]
+        assert transactions[0].to == bytes.fromhex("b97048628db6b661d4c2aa833e95dbe1a905b280")
+        assert transactions[0].data[:4] == bytes.fromhex("a9059cbb")
+        assert transactions[1].data == b''
+        assert transactions[0].max_fee_per_gas is None
+
+    def test_should_identify_transactions_by_hash_and_nonce_only(self):
+        # given
+        transaction = Transaction.from_json({'hash': "0x01", 'nonce': "0x9", 'gasPrice': "0x3b9aca00"})
+        same_transaction = Transaction.from_json({'hash': "0x01", 'nonce': "0x9", 'gasPrice': "0xbdfd63e00"})
+
+        # expect
+        assert transaction == same_transaction
+        assert len({transaction, same_transaction, Transaction("0x01", 10)}) == 2
+        assert not hasattr(transaction, '__dict__')
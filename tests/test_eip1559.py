@@ -0,0 +1,174 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from plunger.plunger import Plunger
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+from tests.test_pipeline import MockPool
+
+GWEI = 1000000000
+
+
+class TestPlungerEip1559(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def mock_london_node(self, mock_node, datadir, pool: MockPool):
+        # The node suggests a gas price of 32 GWei, 2 GWei above the base fee of the pending block
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['eth_sendRawTransaction'] = pool.send_raw_transaction
+        mock_node.results['eth_sendTransaction'] = pool.send_transaction
+        mock_node.results['eth_gasPrice'] = hex(32*GWEI)
+        mock_node.results['eth_getBlockByNumber'] = lambda params: {'number': '0x1', 'gasLimit': hex(10000000),
+                                                                    'baseFeePerGas': hex(30*GWEI if params[0] == 'pending' else 20*GWEI)}
+
+    @staticmethod
+    def cheapen_stuck_transactions(mock_node):
+        # Stuck transactions paying 1 GWei leave the fees of their replacements as they are
+        for item in mock_node.results['parity_pendingTransactions']:
+            item['gasPrice'] = hex(1*GWEI)
+
+    def plunger(self, mock_node, arguments: str) -> Plunger:
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs {arguments}"
+                                                       f" {self.some_account}"))
+        plunger.wait = lambda transactions: None
+        return plunger
+
+    def test_should_send_eip1559_replacements_if_the_chain_has_a_base_fee(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        self.cheapen_stuck_transactions(mock_node)
+        plunger = self.plunger(mock_node, "--eth-key key_file=tests/data/key1.json,pass_file=/dev/null")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert pool.sent == [{'from': self.some_account, 'to': self.some_account.lower(), 'nonce': nonce,
+                              'maxFeePerGas': 62*GWEI, 'maxPriorityFeePerGas': 2*GWEI,
+                              'gas': 21000, 'value': 0, 'chainId': 1, 'type': 2} for nonce in [9, 10, 11]]
+        assert "Sent replacement transaction with nonce=9, max_fee_per_gas=62000000000, max_priority_fee_per_gas=2000000000," \
+               " tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef09." in out.getvalue()
+
+    def test_should_let_node_sign_eip1559_replacements_if_there_is_no_key(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        self.cheapen_stuck_transactions(mock_node)
+        plunger = self.plunger(mock_node, "--pipeline")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert pool.sent == [{'from': self.some_account, 'to': self.some_account, 'nonce': nonce,
+                              'maxFeePerGas': 62*GWEI, 'maxPriorityFeePerGas': 2*GWEI,
+                              'gas': 21000, 'value': 0} for nonce in [9, 10, 11]]
+
+    def test_should_use_base_fee_of_the_latest_block_if_the_pending_one_has_none(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        mock_node.results['eth_getBlockByNumber'] = lambda params: None if params[0] == 'pending' else \
+            {'number': '0x1', 'gasLimit': hex(10000000), 'baseFeePerGas': hex(20*GWEI)}
+        self.cheapen_stuck_transactions(mock_node)
+        plunger = self.plunger(mock_node, "--eth-key key_file=tests/data/key1.json,pass_file=/dev/null")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [(tx['maxFeePerGas'], tx['maxPriorityFeePerGas']) for tx in pool.sent] == [(52*GWEI, 12*GWEI)] * 3
+
+    def test_should_bump_both_fees_of_stuck_eip1559_transactions(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        stuck_transaction = next(item for item in mock_node.results['parity_pendingTransactions'] if item['nonce'] == '0x9')
+        stuck_transaction.update({'maxFeePerGas': hex(100*GWEI), 'maxPriorityFeePerGas': hex(3*GWEI)})
+        plunger = self.plunger(mock_node, "--bump-stuck-price --eth-key key_file=tests/data/key1.json,pass_file=/dev/null")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        # the legacy transactions with nonces 10 and 11 act as if both their fees were their gas price
+        assert [(tx['nonce'], tx['maxFeePerGas'], tx['maxPriorityFeePerGas']) for tx in pool.sent] == \
+               [(9, 112500000000, 3375000000), (10, 62*GWEI, 57375000000), (11, 62*GWEI, 56250000000)]
+
+    def test_should_bump_fees_of_stuck_transactions_even_if_not_asked_to(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        stuck_transaction = next(item for item in mock_node.results['parity_pendingTransactions'] if item['nonce'] == '0x9')
+        stuck_transaction.update({'maxFeePerGas': hex(40*GWEI), 'maxPriorityFeePerGas': hex(8*GWEI)})
+        plunger = self.plunger(mock_node, "--eth-key key_file=tests/data/key1.json,pass_file=/dev/null")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert (pool.sent[0]['maxFeePerGas'], pool.sent[0]['maxPriorityFeePerGas']) == (62*GWEI, 9*GWEI)
+
+    def test_should_send_legacy_replacements_if_asked_to(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        plunger = self.plunger(mock_node, "--replacement-type legacy --eth-key key_file=tests/data/key1.json,pass_file=/dev/null")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [(tx['nonce'], tx['gasPrice']) for tx in pool.sent] == [(9, 32*GWEI), (10, 32*GWEI), (11, 32*GWEI)]
+        assert 'eth_getBlockByNumber' not in mock_node.calls
+
+    def test_should_send_legacy_replacements_if_the_chain_has_no_base_fee(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        mock_node.results['eth_getBlockByNumber'] = {'number': '0x1', 'gasLimit': hex(10000000)}
+        plunger = self.plunger(mock_node, "--eth-key key_file=tests/data/key1.json,pass_file=/dev/null")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [(tx['nonce'], tx['gasPrice']) for tx in pool.sent] == [(9, 32*GWEI), (10, 32*GWEI), (11, 32*GWEI)]
+
+    def test_should_fail_if_eip1559_replacements_are_not_supported(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_london_node(mock_node, datadir, pool)
+        mock_node.results['eth_getBlockByNumber'] = {'number': '0x1', 'gasLimit': hex(10000000)}
+
+        # when
+        with captured_output() as (out, err):
+            with pytest.raises(SystemExit):
+                self.plunger(mock_node, "--replacement-type eip1559")
+
+        # then
+        assert "The latest block has no base fee, cannot send EIP-1559 replacement transactions." in err.getvalue()
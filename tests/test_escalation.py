@@ -0,0 +1,177 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from plunger.escalation import Escalation
+from plunger.plunger import Plunger
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+from tests.test_pipeline import MockPool
+
+GWEI = 1000000000
+
+
+class MockMarketChain:
+    # A new block gets mined each time the block number is asked for, and the pending transaction with nonce 9
+    # only gets mined once a replacement paying at least `clearing_price` has been sent, or at `last_block` anyway
+    def __init__(self, address: str, clearing_price: int, last_block: int = 1000):
+        self.address = address
+        self.clearing_price = clearing_price
+        self.last_block = last_block
+        self.block_number = 100
+        self.nonce = 9
+        self.pool = MockPool()
+
+    def results(self) -> dict:
+        return {'web3_clientVersion': 'OpenEthereum//v3.0.1-stable',
+                'eth_chainId': '0x1',
+                'eth_gasPrice': hex(5*GWEI),
+                'eth_estimateGas': hex(21000),
+                'eth_blockNumber': lambda params: hex(self.next_block()),
+                'eth_getBlockByNumber': lambda params: {'number': hex(self.block_number), 'timestamp': hex(self.block_number),
+                                                        'gasLimit': hex(10000000)},
+                'eth_getTransactionCount': lambda params: hex(self.nonce),
+                'eth_sendTransaction': self.pool.send_transaction,
+                'parity_pendingTransactions': lambda params: [{'hash': "0x%064x" % 9, 'nonce': hex(9), 'gasPrice': hex(5*GWEI),
+                                                               'from': self.address.lower(), 'blockNumber': None}]
+                if self.nonce == 9 else []}
+
+    def next_block(self) -> int:
+        self.block_number += 1
+        if any(tx['gasPrice'] >= self.clearing_price for tx in self.pool.sent) or self.block_number >= self.last_block:
+            self.nonce = 10
+        return self.block_number
+
+
+class TestEscalation:
+    def test_should_escalate_replacements_pending_for_enough_blocks(self):
+        # given
+        escalation = Escalation(blocks=2, multiplier=1.2, max_attempts=3)
+        escalation.track("0x01", [{'nonce': 5, 'gas_price': 100, 'tx_hash': "0x0a"},
+                                  {'nonce': 6, 'gas_price': 100, 'error': "too low"},
+                                  {'nonce': 7, 'gas_price': 100, 'tx_hash': "0x0b"}])
+
+        # expect
+        assert escalation.due(10, {"0x01": 4}) == []
+        assert escalation.due(11, {"0x01": 4}) == []
+        assert escalation.due(12, {"0x01": 5}) == [("0x01", 7, {'gas_price': 100}, 2, 1)]
+
+    def test_should_give_up_after_max_attempts(self):
+        # given
+        escalation = Escalation(blocks=1, multiplier=1.2, max_attempts=2)
+        escalation.track("0x01", [{'nonce': 5, 'gas_price': 100, 'tx_hash': "0x0a"}])
+        escalation.due(10, {"0x01": 4})
+
+        # when
+        escalation.record("0x01", 5, {'gas_price': 120}, 11, 2)
+
+        # then
+        assert escalation.due(20, {"0x01": 4}) == []
+
+    def test_should_multiply_all_fees_but_not_go_below_the_market(self):
+        # given
+        escalation = Escalation(blocks=1, multiplier=1.2, max_attempts=3, min_bump=12.5)
+
+        # expect
+        assert escalation.escalated_fees({'gas_price': 100}, {}) == {'gas_price': 120}
+        assert escalation.escalated_fees({'gas_price': 100}, {'gas_price': 150}) == {'gas_price': 150}
+        assert escalation.escalated_fees({'max_fee_per_gas': 1001, 'max_priority_fee_per_gas': 10},
+                                         {'max_fee_per_gas': 900, 'max_priority_fee_per_gas': 20}) == \
+               {'max_fee_per_gas': 1202, 'max_priority_fee_per_gas': 20}
+
+    def test_should_not_escalate_above_max_price(self):
+        # given
+        escalation = Escalation(blocks=1, multiplier=1.2, max_attempts=3, max_price=115, min_bump=12.5)
+
+        # expect
+        assert escalation.escalated_fees({'gas_price': 100}, {}) == {'gas_price': 115}
+        assert escalation.escalated_fees({'gas_price': 105}, {}) is None
+
+
+class TestPlungerEscalation(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def plunger(self, mock_node, chain: MockMarketChain, arguments: str) -> Plunger:
+        mock_node.results = chain.results()
+        return Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs --gas-price {6*GWEI}"
+                                                    f" --wait-mode poll --poll-min-interval 0.01 --poll-max-interval 0.01"
+                                                    f" {arguments} {self.some_account}"))
+
+    def test_should_escalate_replacements_until_they_get_mined(self, mock_node):
+        # given
+        chain = MockMarketChain(self.some_account, clearing_price=8*GWEI)
+        plunger = self.plunger(mock_node, chain, "--escalate-blocks 2")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [tx['gasPrice'] for tx in chain.pool.sent] == [6*GWEI, 7200000000, 8640000000]
+        assert f"Replacement transaction with nonce=9 from {self.some_account} has been pending for 2 block(s)," \
+               f" escalating (attempt 2 of 5)." in out.getvalue()
+        assert out.getvalue().endswith("All pending transactions have been mined.\n")
+
+    def test_should_not_escalate_more_than_max_attempts_times(self, mock_node):
+        # given
+        chain = MockMarketChain(self.some_account, clearing_price=100*GWEI, last_block=112)
+        plunger = self.plunger(mock_node, chain, "--escalate-blocks 2 --escalate-max-attempts 3")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [tx['gasPrice'] for tx in chain.pool.sent] == [6*GWEI, 7200000000, 8640000000]
+
+    def test_should_stop_escalating_at_max_price(self, mock_node):
+        # given
+        chain = MockMarketChain(self.some_account, clearing_price=100*GWEI, last_block=112)
+        plunger = self.plunger(mock_node, chain, f"--escalate-blocks 2 --escalate-max-price {8*GWEI}")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [tx['gasPrice'] for tx in chain.pool.sent] == [6*GWEI, 7200000000]
+        assert f"but its gas price cannot be escalated above {8*GWEI}." in out.getvalue()
+
+    def test_should_not_escalate_by_default(self, mock_node):
+        # given
+        chain = MockMarketChain(self.some_account, clearing_price=100*GWEI, last_block=110)
+        plunger = self.plunger(mock_node, chain, "")
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [tx['gasPrice'] for tx in chain.pool.sent] == [6*GWEI]
+
+    def test_should_refuse_multipliers_below_the_minimum_bump(self, mock_node):
+        # given
+        chain = MockMarketChain(self.some_account, clearing_price=8*GWEI)
+
+        # when
+        with captured_output() as (out, err):
+            with pytest.raises(SystemExit):
+                self.plunger(mock_node, chain, "--escalate-blocks 2 --escalate-multiplier 1.1")
+
+        # then
+        assert "--escalate-multiplier has to be at least 1.125" in err.getvalue()
@@ -0,0 +1,148 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import time
+
+import pytest
+
+from plunger.gas import SmartGasPrice
+from plunger.plunger import Plunger
+from tests.conftest import captured_output
+from tests.test_pipeline import MockPool
+from tests.test_batch import TestPlungerMockNodeUtils
+
+
+class MockGasClient:
+    # Has no price until it has been asked for one `delay` times
+    def __init__(self, price: int = 1000000000, delay: int = 0):
+        self.price = price
+        self.delay = delay
+
+    def fastest_price(self):
+        if self.delay > 0:
+            self.delay -= 1
+            return None
+        return self.price
+
+
+class TestSmartGasPrice:
+    def smart_gas(self, tmpdir, clients: list, timeout: float = 1, cache_ttl: float = 30) -> SmartGasPrice:
+        smart_gas = SmartGasPrice(lambda: clients.append(MockGasClient(delay=3)) or clients[-1],
+                                  timeout=timeout, cache_file=str(tmpdir.join('gas_price.json')), cache_ttl=cache_ttl)
+        smart_gas.POLL_INTERVAL = 0.01
+        return smart_gas
+
+    def test_should_only_start_client_when_price_is_needed(self, tmpdir):
+        # given
+        clients = []
+        smart_gas = self.smart_gas(tmpdir, clients)
+        assert clients == []
+
+        # when
+        price = smart_gas.fastest_price()
+
+        # then
+        assert price == 1000000000
+        assert len(clients) == 1
+
+    def test_should_give_up_waiting_for_price_after_timeout(self, tmpdir):
+        # given
+        smart_gas = self.smart_gas(tmpdir, [], timeout=0.01, cache_ttl=0)
+
+        # when
+        started = time.monotonic()
+        price = smart_gas.fastest_price()
+
+        # then
+        assert price is None
+        assert time.monotonic() - started < 0.5
+
+    def test_should_reuse_price_cached_by_earlier_run(self, tmpdir):
+        # given
+        self.smart_gas(tmpdir, []).fastest_price()
+        clients = []
+
+        # when
+        price = self.smart_gas(tmpdir, clients).fastest_price()
+
+        # then
+        assert price == 1000000000
+        assert clients == []
+
+    def test_should_not_reuse_expired_price(self, tmpdir):
+        # given
+        tmpdir.join('gas_price.json').write(json.dumps({'fastest_price': 5, 'timestamp': time.time() - 31}))
+        clients = []
+
+        # when
+        price = self.smart_gas(tmpdir, clients).fastest_price()
+
+        # then
+        assert price == 1000000000
+        assert len(clients) == 1
+
+
+class TestPlungerSmartGas(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def plunger(self, mock_node, datadir, arguments: str) -> Plunger:
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['eth_sendTransaction'] = MockPool().send_transaction
+        mock_node.results['eth_gasPrice'] = hex(5000000000)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --smart-gas --smart-gas-cache-ttl 0"
+                                                       f" {arguments} {self.some_account}"))
+        plunger.wait = lambda transactions: None
+        return plunger
+
+    def test_should_not_start_gas_client_when_only_listing(self, mock_node, datadir):
+        # given
+        plunger = self.plunger(mock_node, datadir, "--list")
+        plunger.smart_gas.client_factory = lambda: pytest.fail("Gas client should not be started")
+
+        # when
+        started = time.monotonic()
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert time.monotonic() - started < 1
+        assert out.getvalue().startswith("There are 3 pending transactions")
+
+    def test_should_fall_back_to_node_gas_price_if_smart_gas_not_available(self, mock_node, datadir):
+        # given
+        plunger = self.plunger(mock_node, datadir, "--override-with-zero-txs --pipeline --smart-gas-timeout 0.05")
+        plunger.smart_gas.client_factory = lambda: MockGasClient(delay=1000)
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert "WARNING: Smart gas price not available within 0.05s, using the gas price suggested by the node" in err.getvalue()
+        assert "Sent replacement transaction with nonce=9, gas_price=5000000000" in out.getvalue()
+
+    def test_should_use_fastest_price_increased_by_ten_percent(self, mock_node, datadir):
+        # given
+        plunger = self.plunger(mock_node, datadir, "--override-with-zero-txs --pipeline")
+        plunger.smart_gas.client_factory = lambda: MockGasClient(price=10000000000, delay=2)
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert "Sent replacement transaction with nonce=9, gas_price=11000000000" in out.getvalue()
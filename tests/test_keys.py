@@ -0,0 +1,130 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import getpass
+
+from eth_account import Account
+from web3 import Web3
+
+from plunger.keys import LocalSigner, register_key, register_keys
+from plunger.plunger import Plunger
+from plunger.rpc import RpcSession
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+from tests.test_pipeline import MockPool
+
+
+class TestRegisterKeys:
+    keys = ["key_file=tests/data/key2.json,pass_file=/dev/null",
+            "key_file=tests/data/key1.json,pass_file=/dev/null",
+            "key_file=tests/data/key2.json,pass_file=/dev/null"]
+
+    def test_should_decrypt_keystores_in_parallel_keeping_their_order(self):
+        # given
+        expected = [register_key(Web3(), key).address for key in self.keys]
+
+        # when
+        accounts = register_keys(Web3(), self.keys, workers=2)
+
+        # then
+        assert [account.address for account in accounts] == expected
+
+    def test_should_ask_for_all_passwords_before_decrypting(self, monkeypatch):
+        # given
+        events = []
+        decrypt = Account.decrypt
+        monkeypatch.setattr(getpass, 'getpass', lambda prompt: events.append(prompt) or "")
+        monkeypatch.setattr(Account, 'decrypt', lambda keyfile_json, password: events.append("decrypt") or decrypt(keyfile_json, password))
+
+        # when
+        register_keys(Web3(), ["key_file=tests/data/key1.json", "key_file=tests/data/key2.json"], workers=1)
+
+        # then
+        assert events == ["Password for tests/data/key1.json: ", "Password for tests/data/key2.json: ", "decrypt", "decrypt"]
+
+
+class TestLocalSigner:
+    account = Account.privateKeyToAccount("0x" + "11" * 32)
+
+    def test_should_sign_zero_value_transfer_to_ourselves(self):
+        # given
+        signer = LocalSigner(self.account, 42)
+
+        # when
+        raw = signer.sign_replacement(nonce=7, gas_price=3000000000)
+
+        # then
+        pool = MockPool()
+        pool.send_raw_transaction([raw])
+        assert pool.sent == [{'from': self.account.address, 'to': self.account.address.lower(), 'nonce': 7,
+                              'gasPrice': 3000000000, 'gas': 21000, 'value': 0, 'chainId': 42}]
+
+    def test_should_sign_eip1559_zero_value_transfer_to_ourselves(self):
+        # given
+        signer = LocalSigner(self.account, 42)
+
+        # when
+        raw = signer.sign_replacement(nonce=7, max_fee_per_gas=62000000000, max_priority_fee_per_gas=2000000000)
+
+        # then
+        pool = MockPool()
+        pool.send_raw_transaction([raw])
+        assert pool.sent == [{'from': self.account.address, 'to': self.account.address.lower(), 'nonce': 7,
+                              'maxFeePerGas': 62000000000, 'maxPriorityFeePerGas': 2000000000,
+                              'gas': 21000, 'value': 0, 'chainId': 42, 'type': 2}]
+
+    def test_should_only_send_raw_transaction(self, mock_node):
+        # given
+        pool = MockPool()
+        mock_node.results = {'eth_sendRawTransaction': pool.send_raw_transaction}
+        signer = LocalSigner(self.account, 1)
+
+        # when
+        tx_hash = signer.send_replacement(RpcSession(), mock_node.endpoint_uri, nonce=3, gas_price=1)
+
+        # then
+        assert tx_hash.hex() == "0x%064x" % (0xbeef00 + 3)
+        assert mock_node.calls == ['eth_sendRawTransaction']
+
+
+class TestPlungerLocalSigning(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def test_should_send_replacements_without_asking_node_to_fill_them(self, mock_node, datadir):
+        # given
+        pool = MockPool(rejected=[10])
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['eth_sendRawTransaction'] = pool.send_raw_transaction
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs --gas-price 7"
+                                                       f" --eth-key key_file=tests/data/key1.json,pass_file=/dev/null"
+                                                       f" {self.some_account}"))
+        plunger.wait = lambda transactions: None
+        calls = len(mock_node.calls)
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("""
+Sent replacement transaction with nonce=9, gas_price=7, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef09.
+Failed to send replacement transaction with nonce=10, gas_price=7.
+   Error: {'code': -32010, 'message': 'Transaction gas price is too low. There is another transaction with same nonce in the queue.'}
+Failed to send replacement transaction with nonce=10, gas_price=7.
+   Error: {'code': -32010, 'message': 'Transaction gas price is too low. There is another transaction with same nonce in the queue.'}
+""")
+        assert mock_node.calls[calls:] == ['parity_pendingTransactions'] + ['eth_sendRawTransaction'] * 3
@@ -0,0 +1,175 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+import pytest
+import requests
+
+from plunger.api import ApiServer
+from plunger.metrics import RpcMetrics
+from plunger.plunger import Plunger
+from plunger.rpc import RpcBatch, RpcSession, rpc_call
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+from tests.test_daemon import DaemonTestUtils, MockPendingChain
+
+
+class TestRpcMetrics:
+    def test_should_group_requests_by_method_and_batches(self):
+        # given
+        metrics = RpcMetrics()
+
+        # when
+        metrics.record(["eth_chainId"], 0.002, 60, 40)
+        metrics.record(["eth_chainId"], 0.2, 60, 40)
+        metrics.record(["eth_chainId", "eth_getTransactionCount"], 0.03, 150, 90, retries=1)
+        metrics.record(["eth_sendTransaction"], 1.5, 0, 0, error=True)
+
+        # then
+        stats = metrics.json()
+        assert stats['calls'] == {'eth_chainId': 3, 'eth_getTransactionCount': 1, 'eth_sendTransaction': 1}
+        assert stats['requests']['eth_chainId']['requests'] == 2
+        assert stats['requests']['eth_chainId']['request_bytes'] == 120
+        assert stats['requests']['eth_chainId']['max_seconds'] == 0.2
+        assert stats['requests']['eth_chainId']['latency_buckets']['0.005'] == 1
+        assert stats['requests']['eth_chainId']['latency_buckets']['0.25'] == 1
+        assert stats['requests']['batch']['calls'] == 2
+        assert stats['requests']['batch']['retries'] == 1
+        assert stats['requests']['eth_sendTransaction']['errors'] == 1
+
+    def test_should_export_cumulative_histograms_to_prometheus(self):
+        # given
+        metrics = RpcMetrics()
+        metrics.record(["eth_blockNumber"], 0.002, 60, 40)
+        metrics.record(["eth_blockNumber"], 0.3, 60, 40)
+
+        # when
+        lines = metrics.prometheus().splitlines()
+
+        # then
+        assert 'plunger_rpc_requests_total{method="eth_blockNumber"} 2' in lines
+        assert 'plunger_rpc_calls_total{method="eth_blockNumber"} 2' in lines
+        assert 'plunger_rpc_request_duration_seconds_bucket{method="eth_blockNumber",le="0.005"} 1' in lines
+        assert 'plunger_rpc_request_duration_seconds_bucket{method="eth_blockNumber",le="0.25"} 1' in lines
+        assert 'plunger_rpc_request_duration_seconds_bucket{method="eth_blockNumber",le="0.5"} 2' in lines
+        assert 'plunger_rpc_request_duration_seconds_bucket{method="eth_blockNumber",le="+Inf"} 2' in lines
+        assert 'plunger_rpc_request_duration_seconds_count{method="eth_blockNumber"} 2' in lines
+
+
+class TestRpcSessionMetrics:
+    def test_should_measure_single_calls_and_batches(self, mock_node):
+        # given
+        mock_node.results = {'eth_chainId': '0x1', 'eth_blockNumber': '0x10'}
+        session = RpcSession()
+
+        # when
+        rpc_call(session, mock_node.endpoint_uri, "eth_chainId", [])
+        batch = RpcBatch(session, mock_node.endpoint_uri)
+        batch.add("eth_chainId", [])
+        batch.add("eth_blockNumber", [])
+        batch.execute()
+
+        # then
+        stats = session.metrics.json()
+        assert stats['calls'] == {'eth_blockNumber': 1, 'eth_chainId': 2}
+        assert stats['requests']['eth_chainId']['requests'] == 1
+        assert stats['requests']['eth_chainId']['request_bytes'] > 0
+        assert stats['requests']['eth_chainId']['response_bytes'] > 0
+        assert stats['requests']['batch']['calls'] == 2
+
+    def test_should_measure_streamed_responses_once_read(self, mock_node):
+        # given
+        mock_node.results = {'parity_pendingTransactions': [{'nonce': hex(nonce)} for nonce in range(100)]}
+        session = RpcSession()
+        request = {"method": "parity_pendingTransactions", "params": [], "id": 1, "jsonrpc": "2.0"}
+
+        # when
+        with session.post(mock_node.endpoint_uri, json=request, stream=True) as response:
+            assert session.metrics.json()['requests'] == {}
+            content = b"".join(response.iter_content(chunk_size=100))
+
+        # then
+        assert session.metrics.json()['requests']['parity_pendingTransactions']['response_bytes'] == len(content)
+
+    def test_should_count_failed_requests(self):
+        # given
+        session = RpcSession(retries=0, timeout=1)
+
+        # when
+        with pytest.raises(requests.exceptions.ConnectionError):
+            rpc_call(session, "http://localhost:1", "eth_chainId", [])
+
+        # then
+        assert session.metrics.json()['requests']['eth_chainId']['errors'] == 1
+
+
+class TestPlungerStats(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def test_should_print_statistics_of_each_method(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --stats --list {self.some_account}"))
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert err.getvalue().startswith("Sent 4 JSON-RPC call(s) in 2 HTTP request(s) to the node")
+        assert "  batch: 1 request(s) with 3 call(s)" in err.getvalue()
+        assert "  parity_pendingTransactions: 1 request(s) with 1 call(s)" in err.getvalue()
+
+    def test_should_print_statistics_as_json(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --stats --json --list {self.some_account}"))
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert len(json.loads(out.getvalue())) == 3
+        stats = json.loads(err.getvalue())
+        assert stats['calls_sent'] == 4
+        assert stats['calls'] == {'eth_chainId': 1, 'eth_getTransactionCount': 1, 'parity_pendingTransactions': 1,
+                                  'web3_clientVersion': 1}
+
+
+class TestDaemonMetrics(DaemonTestUtils):
+    def test_should_serve_prometheus_metrics(self, mock_node):
+        # given
+        chain = MockPendingChain(self.some_account, 9, [9, 10])
+        daemon = self.daemon(mock_node, chain, "--stuck-blocks 1")
+        api = ApiServer(daemon).start()
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            chain.block_number += 1
+            daemon.check(now=1)
+
+        # when
+        response = requests.get(f"{api.url}/metrics")
+        api.stop()
+
+        # then
+        assert response.headers['Content-Type'].startswith("text/plain")
+        lines = response.text.splitlines()
+        assert "plunger_replacements_sent_total 2" in lines
+        assert f'plunger_pending_transactions{{address="{self.some_account}"}} 2' in lines
+        assert 'plunger_rpc_calls_total{method="eth_sendTransaction"} 2' in lines
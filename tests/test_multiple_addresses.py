@@ -0,0 +1,123 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import re
+
+from plunger.plunger import Plunger
+from tests.conftest import captured_output
+from tests.test_batch import TestPlungerMockNodeUtils
+
+
+class MockAccounts:
+    # Mines every transaction as soon as it is sent, like the development chain used by other tests
+    def __init__(self, nonces: dict):
+        self.nonces = {address.lower(): nonce for address, nonce in nonces.items()}
+        self.sent = []
+
+    def get_transaction_count(self, params):
+        return hex(self.nonces[params[0].lower()])
+
+    def send_transaction(self, params):
+        transaction = params[0]
+        self.sent.append((transaction['from'], int(transaction['nonce'], 16)))
+        self.nonces[transaction['from'].lower()] = max(self.nonces[transaction['from'].lower()], int(transaction['nonce'], 16) + 1)
+        return "0x%064x" % len(self.sent)
+
+
+class TestPlungerMultipleAddresses(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+    other_account = "0x00a329c0648769A73afAc7F9381E08FB43dBEA72"
+
+    def mock_two_accounts(self, mock_node, datadir) -> MockAccounts:
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['parity_pendingTransactions'] += [
+            {'from': self.other_account.lower(), 'hash': "0x%064x" % 0xaaa3, 'nonce': "0x3", 'blockNumber': None},
+            {'from': self.other_account.lower(), 'hash': "0x%064x" % 0xaaa5, 'nonce': "0x5", 'blockNumber': None}
+        ]
+
+        accounts = MockAccounts({self.some_account: 9, self.other_account: 3})
+        mock_node.results['eth_getTransactionCount'] = accounts.get_transaction_count
+        mock_node.results['eth_sendTransaction'] = accounts.send_transaction
+        mock_node.results['eth_estimateGas'] = '0x5208'
+        mock_node.results['eth_blockNumber'] = '0x1'
+        mock_node.results['eth_getBlockByNumber'] = {'number': '0x1', 'gasLimit': '0x7a1200'}
+        return accounts
+
+    def test_should_list_pending_transactions_of_all_addresses_scanning_the_pool_once(self, mock_node, datadir):
+        # given
+        self.mock_two_accounts(mock_node, datadir)
+
+        # when
+        with captured_output() as (out, err):
+            Plunger(self.plunger_args(mock_node, f"--source parity_txqueue --json --list"
+                                                 f" {self.some_account} {self.other_account}")).main()
+
+        # then
+        assert json.loads(out.getvalue()) == {
+            self.some_account: [
+                {'hash': '0x72e7a42d3e1b0773f62cfa9ee2bc54ff904a908ac2a668678f9c4880fd046f7a', 'nonce': 9},
+                {'hash': '0x124cb0887d0ea364b402fcc1369b7f9bf4d651bc77d2445aefbeab538dd3aab9', 'nonce': 10},
+                {'hash': '0x53050e62c81fbe440d97d703860096467089bd37b2ad4cc6c699acf217436a64', 'nonce': 11}
+            ],
+            self.other_account: [
+                {'hash': "0x%064x" % 0xaaa3, 'nonce': 3},
+                {'hash': "0x%064x" % 0xaaa5, 'nonce': 5}
+            ]
+        }
+        assert mock_node.calls.count('parity_pendingTransactions') == 1
+        assert mock_node.http_requests == 2
+
+    def test_should_override_and_wait_for_all_addresses_read_from_file(self, mock_node, datadir, tmpdir):
+        # given
+        accounts = self.mock_two_accounts(mock_node, datadir)
+        addresses_file = tmpdir.join('addresses')
+        addresses_file.write(f"# keepers\n{self.some_account}\n\n{self.other_account}\n")
+
+        # when
+        with captured_output() as (out, err):
+            Plunger(self.plunger_args(mock_node, f"--source parity_txqueue --override-with-zero-txs --gas-price 1"
+                                                 f" @{addresses_file}")).main()
+
+        # then
+        assert re.match(f"""There are 3 pending transactions on mainnet from {self.some_account}:
+
+                              TxHash                                 Nonce
+==========================================================================
+0x72e7a42d3e1b0773f62cfa9ee2bc54ff904a908ac2a668678f9c4880fd046f7a       9
+0x124cb0887d0ea364b402fcc1369b7f9bf4d651bc77d2445aefbeab538dd3aab9      10
+0x53050e62c81fbe440d97d703860096467089bd37b2ad4cc6c699acf217436a64      11
+
+Sent replacement transaction with nonce=9, gas_price=1, tx_hash=0x[0-9a-f]{{64}}.
+Sent replacement transaction with nonce=10, gas_price=1, tx_hash=0x[0-9a-f]{{64}}.
+Sent replacement transaction with nonce=11, gas_price=1, tx_hash=0x[0-9a-f]{{64}}.
+There are 2 pending transactions on mainnet from {self.other_account}:
+
+                              TxHash                                 Nonce
+==========================================================================
+{'0x%064x' % 0xaaa3}       3
+{'0x%064x' % 0xaaa5}       5
+
+Sent replacement transaction with nonce=3, gas_price=1, tx_hash=0x[0-9a-f]{{64}}.
+Sent replacement transaction with nonce=4, gas_price=1, tx_hash=0x[0-9a-f]{{64}}.
+Waiting for the transactions to get mined...
+All pending transactions have been mined.
+$""", out.getvalue(), re.MULTILINE)
+
+        # and
+        assert accounts.sent == [(self.some_account, 9), (self.some_account, 10), (self.some_account, 11),
+                                 (self.other_account, 3), (self.other_account, 4)]
@@ -0,0 +1,149 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+
+import pytest
+
+from plunger.nonces import clearing_nonces, plan_replacements, stuck_fees
+from plunger.plunger import Transaction
+
+
+def transaction(nonce: int, gas_price: int = 1000) -> Transaction:
+    return Transaction("0x%064x" % (nonce * 1000 + gas_price), nonce, gas_price=gas_price)
+
+
+def random_pool(seed: int) -> tuple:
+    # A last mined nonce, and pending transactions around it with gaps and duplicates, in no particular order
+    generator = random.Random(seed)
+    last_nonce = generator.randint(-1, 20)
+    transactions = [Transaction("0x%064x" % index, generator.randint(max(last_nonce - 3, 0), last_nonce + 30),
+                                gas_price=generator.randint(1, 100))
+                    for index in range(generator.randint(0, 40))]
+    return last_nonce, transactions
+
+
+def reference_plan(last_nonce: int, transactions: list) -> list:
+    # What `Plunger.override` used to do: each unique pending nonce, one by one, moved down to
+    # right above the last sent transaction if there is a gap
+    nonces = []
+    for transaction in sorted(transactions, key=lambda transaction: transaction.nonce):
+        if transaction.nonce > last_nonce and transaction.nonce not in nonces:
+            nonces.append(transaction.nonce)
+
+    plan = []
+    for nonce in nonces:
+        plan.append(min(nonce, last_nonce + 1))
+        last_nonce += 1
+    return plan
+
+
+class TestPlanReplacements:
+    def test_should_fill_nonce_gap_with_the_next_transaction(self):
+        # given
+        transactions = [transaction(9), transaction(11)]
+
+        # expect
+        assert plan_replacements(8, transactions) == [(9, (1000, 1000)), (10, None)]
+
+    def test_should_start_from_nonce_zero_if_nothing_has_been_mined(self):
+        # given
+        transactions = [transaction(9), transaction(11)]
+
+        # expect
+        assert plan_replacements(-1, transactions) == [(0, None), (1, None)]
+
+    def test_should_replace_duplicates_once_over_their_highest_fees(self):
+        # given
+        transactions = [transaction(10, 300), transaction(9, 200), transaction(9, 100),
+                        Transaction("0x01", 9, max_fee_per_gas=150, max_priority_fee_per_gas=250)]
+
+        # expect
+        assert plan_replacements(8, transactions) == [(9, (200, 250)), (10, (300, 300))]
+
+    def test_should_skip_nonces_which_have_been_mined(self):
+        # given
+        transactions = [transaction(7), transaction(8), transaction(9)]
+
+        # expect
+        assert plan_replacements(8, transactions) == [(9, (1000, 1000))]
+        assert plan_replacements(9, transactions) == []
+
+    @pytest.mark.parametrize('seed', range(200))
+    def test_should_plan_consecutive_nonces_for_each_pending_one(self, seed):
+        # given
+        last_nonce, transactions = random_pool(seed)
+        pending_nonces = sorted(set(transaction.nonce for transaction in transactions if transaction.nonce > last_nonce))
+
+        # when
+        plan = plan_replacements(last_nonce, transactions)
+
+        # then
+        assert [nonce for nonce, _ in plan] == list(range(last_nonce + 1, last_nonce + 1 + len(pending_nonces)))
+        assert all(nonce <= pending_nonce for (nonce, _), pending_nonce in zip(plan, pending_nonces))
+        assert [nonce for nonce, _ in plan] == reference_plan(last_nonce, transactions)
+
+    @pytest.mark.parametrize('seed', range(200))
+    def test_should_bump_over_the_highest_fees_of_each_replaced_nonce(self, seed):
+        # given
+        last_nonce, transactions = random_pool(seed)
+
+        # when
+        plan = plan_replacements(last_nonce, transactions)
+
+        # then
+        for nonce, fees in plan:
+            gas_prices = [transaction.gas_price for transaction in transactions if transaction.nonce == nonce]
+            assert fees == ((max(gas_prices), max(gas_prices)) if gas_prices else None)
+
+
+class TestClearingNonces:
+    def test_should_find_nonces_which_already_pay_enough(self):
+        # given
+        transactions = [transaction(9, 500), transaction(10, 100), transaction(10, 300), transaction(11, 200)]
+
+        # expect
+        assert clearing_nonces(8, transactions, 300) == {9, 10}
+        assert clearing_nonces(8, transactions, 1000) == set()
+
+    def test_should_not_expect_nonces_above_a_gap_to_clear(self):
+        # given
+        transactions = [transaction(9, 500), transaction(11, 500), transaction(12, 500)]
+
+        # expect
+        assert clearing_nonces(8, transactions, 300) == {9}
+        assert clearing_nonces(9, transactions, 300) == set()
+
+    def test_should_take_what_eip1559_transactions_pay_in_the_next_block(self):
+        # given
+        transactions = [Transaction("0x01", 9, max_fee_per_gas=500, max_priority_fee_per_gas=50),
+                        Transaction("0x02", 10, max_fee_per_gas=350, max_priority_fee_per_gas=200)]
+
+        # expect
+        assert clearing_nonces(8, transactions, 300, base_fee=200) == {10}
+        assert clearing_nonces(8, transactions, 300, base_fee=250) == {9, 10}
+        assert clearing_nonces(8, transactions, 400, base_fee=250) == set()
+
+
+class TestStuckFees:
+    def test_should_treat_legacy_gas_price_as_both_fees(self):
+        # given
+        transactions = [transaction(9, 40), Transaction("0x01", 9, max_fee_per_gas=30, max_priority_fee_per_gas=35),
+                        Transaction("0x02", 10, max_fee_per_gas=1000), Transaction("0x03", 11)]
+
+        # expect
+        assert stuck_fees(transactions) == {9: (40, 40), 10: (1000, 1000)}
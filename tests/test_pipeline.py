@@ -0,0 +1,291 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import requests
+import rlp
+from eth_account import Account
+from eth_keys import keys
+from eth_utils import big_endian_to_int, keccak
+from hexbytes import HexBytes
+
+from plunger import nonces, rpc
+from plunger.plunger import Plunger, Transaction
+from tests.conftest import captured_output
+from tests.mock_node import MockError
+from tests.test_batch import TestPlungerMockNodeUtils
+
+
+class MockPool:
+    # Accepts replacement transactions, rejecting these with nonces listed in `rejected`
+    # and these which do not pay at least 12.5% more than the prices listed in `stuck_prices`
+    def __init__(self, rejected: list = None, stuck_prices: dict = None):
+        self.rejected = rejected or []
+        self.stuck_prices = stuck_prices or {}
+        self.sent = []
+
+    def send_raw_transaction(self, params):
+        raw = HexBytes(params[0])
+        if raw[0] == 2:
+            return self.send_dynamic_fee_transaction(raw)
+
+        nonce, gas_price, gas, to, value, data, v, r, s = [HexBytes(field) for field in rlp.decode(raw)]
+        return self.accept({'from': Account.recoverTransaction(raw), 'to': to.hex(), 'nonce': big_endian_to_int(nonce),
+                            'gasPrice': big_endian_to_int(gas_price), 'gas': big_endian_to_int(gas),
+                            'value': big_endian_to_int(value), 'chainId': (big_endian_to_int(v) - 35) // 2})
+
+    def send_dynamic_fee_transaction(self, raw: bytes):
+        fields = rlp.decode(raw[1:])
+        chain_id, nonce, max_priority_fee_per_gas, max_fee_per_gas, gas, to, value = fields[:7]
+        v, r, s = [big_endian_to_int(field) for field in fields[9:]]
+        sender = keys.Signature(vrs=(v, r, s)).recover_public_key_from_msg_hash(keccak(b'\x02' + rlp.encode(fields[:9])))
+        return self.accept({'from': sender.to_checksum_address(), 'to': HexBytes(to).hex(), 'nonce': big_endian_to_int(nonce),
+                            'maxFeePerGas': big_endian_to_int(max_fee_per_gas),
+                            'maxPriorityFeePerGas': big_endian_to_int(max_priority_fee_per_gas),
+                            'gas': big_endian_to_int(gas), 'value': big_endian_to_int(value),
+                            'chainId': big_endian_to_int(chain_id), 'type': 2})
+
+    def send_transaction(self, params):
+        return self.accept({key: value if key in ['from', 'to'] else int(value, 16) for key, value in params[0].items()})
+
+    def accept(self, transaction: dict) -> str:
+        if transaction['nonce'] in self.rejected or \
+                transaction.get('gasPrice', transaction.get('maxFeePerGas')) * 8 < self.stuck_prices.get(transaction['nonce'], 0) * 9:
+            raise MockError("Transaction gas price is too low. There is another transaction with same nonce in the queue.")
+        self.sent.append(transaction)
+        return "0x%064x" % (0xbeef00 + transaction['nonce'])
+
+
+class TestPlungerPipeline(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def mock_pool(self, mock_node, datadir, pool: MockPool):
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['eth_sendRawTransaction'] = pool.send_raw_transaction
+        mock_node.results['eth_sendTransaction'] = pool.send_transaction
+        mock_node.results['eth_gasPrice'] = hex(5000000000)
+
+    def test_should_sign_locally_and_send_all_replacements_in_one_batch(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs --pipeline"
+                                                       f" --eth-key key_file=tests/data/key1.json,pass_file=/dev/null"
+                                                       f" {self.some_account}"))
+        plunger.wait = lambda transactions: None
+        http_requests = mock_node.http_requests
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("""
+Sent replacement transaction with nonce=9, gas_price=5000000000, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef09.
+Sent replacement transaction with nonce=10, gas_price=5000000000, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef0a.
+Sent replacement transaction with nonce=11, gas_price=5000000000, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef0b.
+""")
+        assert pool.sent == [{'from': self.some_account, 'to': self.some_account.lower(), 'nonce': nonce,
+                              'gasPrice': 5000000000, 'gas': 21000, 'value': 0, 'chainId': 1} for nonce in [9, 10, 11]]
+
+        # and
+        assert mock_node.calls[-4:] == ['eth_gasPrice'] + ['eth_sendRawTransaction'] * 3
+        assert mock_node.http_requests - http_requests == 1 + 1 + 1
+
+    def test_should_let_node_sign_replacements_if_there_is_no_key(self, mock_node, datadir):
+        # given
+        pool = MockPool()
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs --pipeline"
+                                                       f" --gas-price 7 {self.some_account}"))
+        plunger.wait = lambda transactions: None
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert pool.sent == [{'from': self.some_account, 'to': self.some_account, 'nonce': nonce,
+                              'gasPrice': 7, 'gas': 21000, 'value': 0} for nonce in [9, 10, 11]]
+        assert mock_node.calls[-3:] == ['eth_sendTransaction'] * 3
+
+    def test_should_report_each_failed_replacement(self, mock_node, datadir):
+        # given
+        pool = MockPool(rejected=[10])
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs --pipeline"
+                                                       f" --gas-price 7 {self.some_account}"))
+        waited_for = []
+        plunger.wait = lambda transactions: waited_for.append({address: [tx.nonce for tx in txs]
+                                                               for address, txs in transactions.items()})
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("""
+Sent replacement transaction with nonce=9, gas_price=7, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef09.
+Failed to send replacement transaction with nonce=10, gas_price=7.
+   Error: {'code': -32010, 'message': 'Transaction gas price is too low. There is another transaction with same nonce in the queue.'}
+Sent replacement transaction with nonce=11, gas_price=7, tx_hash=0x0000000000000000000000000000000000000000000000000000000000beef0b.
+""")
+        assert waited_for == [{self.some_account: [11]}]
+
+    @pytest.mark.parametrize("pipeline", ["", "--pipeline"])
+    def test_should_report_each_nonce_as_failed_if_the_gas_price_is_not_available(self, mock_node, datadir, pipeline):
+        # given
+        pool = MockPool()
+        self.mock_pool(mock_node, datadir, pool)
+        del mock_node.results['eth_gasPrice']
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs {pipeline}"
+                                                       f" {self.some_account}"))
+        waited_for = []
+        plunger.wait = lambda transactions: waited_for.append({address: [tx.nonce for tx in txs]
+                                                               for address, txs in transactions.items()})
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert pool.sent == []
+        assert out.getvalue().count("Failed to send replacement transaction with nonce=") == 3
+        assert out.getvalue().count("Error: {'code': -32601, 'message': 'Method eth_gasPrice not found'}") == 3
+        assert waited_for == [{self.some_account: [9, 10, 11]}]
+
+    def test_should_report_each_nonce_as_failed_if_the_batch_cannot_be_sent(self, mock_node, datadir, monkeypatch):
+        # given
+        pool = MockPool()
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs --pipeline"
+                                                       f" --gas-price 7 {self.some_account}"))
+        plunger.wait = lambda transactions: None
+
+        execute = rpc.RpcBatch.execute
+
+        def failing_execute(batch):
+            if batch.calls[0].method.startswith('eth_send'):
+                raise requests.exceptions.ConnectionError("Connection reset by peer")
+            execute(batch)
+
+        monkeypatch.setattr(rpc.RpcBatch, 'execute', failing_execute)
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert out.getvalue().endswith("".join(f"Failed to send replacement transaction with nonce={nonce}, gas_price=7.\n"
+                                               f"   Error: Connection reset by peer\n" for nonce in [9, 10, 11]))
+
+
+class TestPlungerReplacementPricing(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    # Gas prices of the pending transactions in `tests/data/parity`
+    stuck_prices = {9: 51000000000, 10: 51000000000, 11: 50000000000}
+
+    def mock_pool(self, mock_node, datadir, pool: MockPool):
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        mock_node.results['eth_sendRawTransaction'] = pool.send_raw_transaction
+        mock_node.results['eth_sendTransaction'] = pool.send_transaction
+        mock_node.results['eth_gasPrice'] = hex(5000000000)
+        mock_node.results['eth_estimateGas'] = hex(21000)
+        mock_node.results['eth_blockNumber'] = '0x1'
+        mock_node.results['eth_getBlockByNumber'] = {'number': '0x1', 'gasLimit': hex(10000000)}
+
+    @pytest.mark.parametrize("pipeline", ["", "--pipeline"])
+    def test_should_bump_the_price_of_each_stuck_transaction(self, mock_node, datadir, pipeline):
+        # given
+        pool = MockPool(stuck_prices=self.stuck_prices)
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs {pipeline}"
+                                                       f" --bump-stuck-price {self.some_account}"))
+        plunger.wait = lambda transactions: None
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [(tx['nonce'], tx['gasPrice']) for tx in pool.sent] == [(9, 57375000000), (10, 57375000000), (11, 56250000000)]
+        assert "Failed" not in out.getvalue()
+
+    @pytest.mark.parametrize("pipeline", ["", "--pipeline"])
+    def test_should_not_replace_transactions_which_pay_enough_if_asked_to(self, mock_node, datadir, pipeline):
+        # given
+        pool = MockPool()
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs {pipeline}"
+                                                       f" --skip-clearing --gas-price 50500000000 {self.some_account}"))
+        plunger.wait = lambda transactions: None
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [(tx['nonce'], tx['gasPrice']) for tx in pool.sent] == [(11, 50500000000)]
+        assert "Pending transaction with nonce=10 already pays enough to get mined, not replacing it." in out.getvalue()
+
+    def test_should_keep_the_oracle_price_if_it_is_higher(self, mock_node, datadir):
+        # given
+        pool = MockPool(stuck_prices=self.stuck_prices)
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs"
+                                                       f" --bump-stuck-price --gas-price 60000000000 {self.some_account}"))
+        plunger.wait = lambda transactions: None
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert [(tx['nonce'], tx['gasPrice']) for tx in pool.sent] == [(9, 60000000000), (10, 60000000000), (11, 60000000000)]
+
+    def test_should_not_bump_prices_by_default(self, mock_node, datadir):
+        # given
+        pool = MockPool(stuck_prices=self.stuck_prices)
+        self.mock_pool(mock_node, datadir, pool)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --override-with-zero-txs {self.some_account}"))
+        plunger.wait = lambda transactions: None
+
+        # when
+        with captured_output() as (out, err):
+            plunger.main()
+
+        # then
+        assert pool.sent == []
+        assert out.getvalue().count("Failed to send replacement transaction") == 3
+
+    def test_should_bump_legacy_replacements_above_the_fee_cap_of_eip1559_transactions(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+        plunger = Plunger(self.plunger_args(mock_node, f"--source parity_txqueue_from --list --bump-stuck-price {self.some_account}"))
+        transactions = [Transaction("0x01", 9, gas_price=30, max_fee_per_gas=40, max_priority_fee_per_gas=2),
+                        Transaction("0x02", 9, gas_price=35),
+                        Transaction("0x03", 10, gas_price=1000)]
+
+        # when
+        stuck_fees = nonces.stuck_fees(transactions)
+
+        # then
+        assert stuck_fees == {9: (40, 35), 10: (1000, 1000)}
+        assert plunger.replacement_fees(1, None, stuck_fees[9]) == {'gas_price': 45}
+        assert plunger.replacement_fees(1, None, stuck_fees[10]) == {'gas_price': 1125}
+        assert plunger.replacement_fees(1, None, None) == {'gas_price': 1}
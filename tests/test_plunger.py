@@ -75,6 +75,16 @@ class TestPlungerUtils:
         response = datadir.join('parity').join('response.json').read_text('utf-8')
         response = response.replace('OUR_ADDRESS', account.upper())
         mock.post(f"http://localhost:8545/rpc", text=response)
+        # `parity_txqueue_from` goes to the same endpoint as all other calls
+        mock.post(f"http://localhost:8545/", text=response,
+                  additional_matcher=lambda request: b'parity_pendingTransactions' in (request.body or b''))
+
+    @staticmethod
+    def mock_3_pending_txs_in_geth_txpool(mock, datadir, account: str):
+        response = datadir.join('geth').join('response.json').read_text('utf-8')
+        response = response.replace('OUR_ADDRESS', account.upper())
+        mock.post(f"http://localhost:8545/", text=response,
+                  additional_matcher=lambda request: b'txpool_contentFrom' in (request.body or b''))
 
 
 class TestPlunger(TestPlungerUtils):
@@ -174,6 +184,58 @@ class TestPlunger(TestPlungerUtils):
             }
         ]
 
+    def test_should_ask_parity_for_our_transactions_only_when_using_parity_txqueue_from(self, web3, datadir):
+        # given
+        some_account = web3.eth.accounts[0]
+
+        # when
+        with requests_mock.Mocker(real_http=True) as mock:
+            self.mock_3_pending_txs_in_parity_txqueue(mock, datadir, some_account)
+
+            with captured_output() as (json_out, err):
+                Plunger(args(f"--rpc-port 8545 --source parity_txqueue_from --json --list {some_account}")).main()
+
+            request = mock.last_request.json()
+
+        # then
+        assert request['method'] == 'parity_pendingTransactions'
+        assert request['params'] == [None, {'from': {'eq': some_account.lower()}}]
+        assert list(map(lambda tx: tx['nonce'], json.loads(json_out.getvalue()))) == [9, 10, 11]
+
+    def test_should_detect_pending_and_queued_transactions_in_geth_txpool(self, web3, datadir):
+        # given
+        some_account = web3.eth.accounts[0]
+
+        # when
+        with requests_mock.Mocker(real_http=True) as mock:
+            self.mock_3_pending_txs_in_geth_txpool(mock, datadir, some_account)
+
+            with captured_output() as (out, err):
+                plunger = Plunger(args(f"--rpc-port 8545 --source geth_txpool --list {some_account}"))
+                transactions = plunger.get_pending_transactions_by_sender([Plunger.SOURCE_GETH_TXPOOL])[some_account]
+
+            request = mock.last_request.json()
+
+        # then
+        assert "WARNING: geth_txpool requires geth" in out.getvalue()
+        assert request['method'] == 'txpool_contentFrom'
+        assert request['params'] == [some_account]
+        assert sorted(map(lambda tx: (tx.nonce, tx.tx_hash), transactions)) == [
+            (9, '0x72e7a42d3e1b0773f62cfa9ee2bc54ff904a908ac2a668678f9c4880fd046f7a'),
+            (10, '0x124cb0887d0ea364b402fcc1369b7f9bf4d651bc77d2445aefbeab538dd3aab9'),
+            (12, '0x8d5ab0e9a5c3b7f3e1d2b6a5c4f8e9d0a1b2c3d4e5f60718293a4b5c6d7e8f90')
+        ]
+
+    def test_should_pick_cheapest_source_supported_by_the_node_when_auto(self, web3):
+        # given
+        some_account = web3.eth.accounts[0]
+
+        # when
+        plunger = Plunger(args(f"--rpc-port 8545 --source auto,parity_txqueue_from,jsonrpc_getblock --list {some_account}"))
+
+        # then
+        assert plunger.arguments.source == ['parity_txqueue_from', 'jsonrpc_getblock']
+
     @pytest.mark.skip("cannot mock different request methods on same endpoint, cannot configure different endpoints for same plunger")
     def test_should_ignore_duplicates_when_using_two_sources(self, web3, datadir):
         # given
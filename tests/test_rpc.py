@@ -0,0 +1,40 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from web3 import Web3
+
+from plunger.provider import SessionHTTPProvider
+from plunger.rpc import RpcSession
+
+
+class TestRpcSession:
+    def test_should_share_one_connection_between_web3_and_raw_requests(self, mock_node):
+        # given
+        mock_node.results = {'eth_chainId': '0x2a', 'parity_pendingTransactions': []}
+        session = RpcSession(pool_size=2)
+        web3 = Web3(SessionHTTPProvider(endpoint_uri=mock_node.endpoint_uri, session=session))
+
+        # when
+        for _ in range(5):
+            assert web3.eth.chainId == 42
+        request = {"method": "parity_pendingTransactions", "params": [], "id": 1, "jsonrpc": "2.0"}
+        assert session.post(mock_node.endpoint_uri + "/rpc", json=request).json()['result'] == []
+
+        # then
+        assert session.requests_sent == 6
+        assert session.connections_opened == 1
+        assert mock_node.connections == 1
@@ -0,0 +1,96 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import subprocess
+import sys
+import time
+
+from tests.test_batch import TestPlungerMockNodeUtils
+
+# Modules which take long to import and should only be imported by the code paths needing them,
+# importing `plunger.plunger` used to take about 0.6s with all of them and takes less than 0.1s without them
+HEAVY_MODULES = {'requests', 'web3', 'eth_account', 'websockets', 'texttable', 'pygasprice_client'}
+
+# How much longer (in seconds) starting an interpreter which imports `plunger.plunger` may take than starting
+# one which does nothing. It is generous, as timings on CI vary, but far below what the heavy modules cost.
+IMPORT_TIME_THRESHOLD = 0.4
+
+RUN_PLUNGER = """
+import contextlib, io, json, sys
+from plunger.plunger import Plunger
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        Plunger(json.loads(sys.argv[1])).main()
+    except SystemExit:
+        pass
+print(json.dumps({'modules': sorted(set(module.split('.')[0] for module in sys.modules))}))
+"""
+
+
+def run_plunger(args: list) -> dict:
+    # Plunger is run in a fresh interpreter, as the tests themselves have all the modules imported already
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, "-c", RUN_PLUNGER, json.dumps(args)], env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def startup_time(code: str) -> float:
+    # The shortest of a few runs, as a run can only get slower because of something else running at the same time
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    times = []
+    for _ in range(3):
+        started = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", code], env=env)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+class TestStartup(TestPlungerMockNodeUtils):
+    some_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+
+    def test_should_print_help_without_importing_heavy_modules(self):
+        # when
+        result = run_plunger(["--help"])
+
+        # then
+        assert HEAVY_MODULES.isdisjoint(result['modules'])
+
+    def test_should_import_quickly(self):
+        # expect
+        assert startup_time("import plunger.plunger") - startup_time("pass") < IMPORT_TIME_THRESHOLD
+
+    def test_should_list_as_json_without_importing_web3(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+
+        # when
+        result = run_plunger(self.plunger_args(mock_node, f"--source parity_txqueue --list --json {self.some_account}"))
+
+        # then
+        assert 'parity_pendingTransactions' in mock_node.calls
+        assert HEAVY_MODULES.intersection(result['modules']) == {'requests'}
+
+    def test_should_only_import_texttable_to_list_as_table(self, mock_node, datadir):
+        # given
+        self.mock_parity_node(mock_node, datadir, self.some_account)
+
+        # when
+        result = run_plunger(self.plunger_args(mock_node, f"--source parity_txqueue --list {self.some_account}"))
+
+        # then
+        assert HEAVY_MODULES.intersection(result['modules']) == {'requests', 'texttable'}
@@ -0,0 +1,79 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+
+import pytest
+
+from plunger.stream import iter_items, iter_until
+
+
+def chunked(data: bytes, size: int) -> list:
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+class TestStream:
+    def test_should_yield_the_same_items_as_json_loads_regardless_of_chunk_size(self, datadir):
+        # given
+        data = datadir.join('parity').join('response.json').read_binary()
+        expected = json.loads(data)['result']
+
+        # expect
+        for size in [1, 2, 7, 64, 1024, len(data)]:
+            assert list(iter_items(chunked(data, size), 'result')) == expected
+
+    def test_should_find_items_under_nested_path(self, datadir):
+        # given
+        data = datadir.join('jsonrpc').join('response.json').read_binary()
+        expected = json.loads(data)['result']['transactions']
+
+        # expect
+        for size in [1, 13, len(data)]:
+            assert list(iter_items(chunked(data, size), 'result.transactions')) == expected
+
+    def test_should_handle_escapes_multibyte_characters_and_trailing_numbers(self):
+        # given
+        data = '{"result": [{"a": "x\\"]}\\\\"}, {"b": "żółw"}, 12345], "id": 1234567}'.encode('utf-8')
+
+        # expect
+        for size in [1, 3, len(data)]:
+            assert list(iter_items(chunked(data, size), 'result')) == [{"a": "x\"]}\\"}, {"b": "żółw"}, 12345]
+
+    def test_should_yield_nothing_for_empty_or_null_results(self):
+        assert list(iter_items([b'{"jsonrpc": "2.0", "result": [], "id": 1}'], 'result')) == []
+        assert list(iter_items([b'{"jsonrpc": "2.0", "result": null, "id": 1}'], 'result.transactions')) == []
+        assert list(iter_items([b'{}'], 'result')) == []
+
+    def test_should_raise_on_error_response(self):
+        with pytest.raises(ValueError, match="JSON-RPC error"):
+            list(iter_items([b'{"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": 1}'], 'result'))
+
+    def test_should_raise_on_truncated_response(self):
+        with pytest.raises(ValueError):
+            list(iter_items([b'{"jsonrpc": "2.0", "result": [{"a": 1}, {"b"'], 'result'))
+
+    def test_should_stop_reading_response_which_does_not_arrive_in_time(self):
+        # given
+        def trickling():
+            while True:
+                time.sleep(0.05)
+                yield b' '
+
+        # expect
+        with pytest.raises(TimeoutError):
+            list(iter_until(trickling(), time.monotonic() + 0.2))
@@ -0,0 +1,174 @@
+# This file is part of Plunger.
+#
+# Copyright (C) 2017-2020 reverendus, EdNoepel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from plunger.daemon import Daemon
+from plunger.plunger import Plunger, Transaction
+from plunger.tracker import PendingTracker
+from tests.conftest import captured_output
+from tests.mock_node import MockError
+from tests.test_batch import TestPlungerMockNodeUtils
+from tests.test_pipeline import MockPool
+
+
+class MockTxPool:
+    # A transaction pool which reports the hashes of transactions added to it through a pending transaction filter
+    def __init__(self, nonces: dict):
+        self.nonces = dict(nonces)
+        self.pending = {}
+        self.receipts = {}
+        self.new = []
+        self.filter_dropped = False
+        self.block_number = 100
+
+    def add(self, sender: str, nonce: int, tx_hash: str):
+        self.pending[tx_hash] = {'hash': tx_hash, 'nonce': hex(nonce), 'from': sender.lower(), 'blockNumber': None}
+        self.new.append(tx_hash)
+
+    def mine(self, tx_hash: str):
+        mined = self.pending[tx_hash]
+        for other_hash, item in list(self.pending.items()):
+            if item['from'] == mined['from'] and item['nonce'] == mined['nonce']:
+                del self.pending[other_hash]
+        self.receipts[tx_hash] = {'transactionHash': tx_hash, 'status': '0x1'}
+        self.nonces[mined['from']] = int(mined['nonce'], 16) + 1
+        self.block_number += 1
+
+    def get_filter_changes(self, params):
+        if self.filter_dropped:
+            self.filter_dropped = False
+            raise MockError("Filter not found", -32000)
+        new, self.new = self.new, []
+        return new
+
+    def results(self) -> dict:
+        return {'web3_clientVersion': 'OpenEthereum//v3.0.1-stable',
+                'eth_chainId': '0x1',
+                'eth_blockNumber': lambda params: hex(self.block_number),
+                'eth_getTransactionCount': lambda params: hex(self.nonces.get(params[0].lower(), 0)),
+                'eth_newPendingTransactionFilter': '0x1',
+                'eth_uninstallFilter': True,
+                'eth_getFilterChanges': self.get_filter_changes,
+                'eth_getTransactionByHash': lambda params: self.pending.get(params[0]),
+                'eth_getTransactionReceipt': lambda params: self.receipts.get(params[0]),
+                'parity_pendingTransactions': lambda params: list(self.pending.values())}
+
+
+class TestPendingTracker(TestPlungerMockNodeUtils):
+    our_account = "0x6c626f45e3b7aE5A3998478753634790fd0E82EE"
+    other_account = "0x0101010101010101010101010101010101010101"
+
+    def plunger(self, mock_node, pool: MockTxPool) -> Plunger:
+        mock_node.results = pool.results()
+        return Plunger(self.plunger_args(mock_node, f"--source parity_txqueue --daemon {self.our_account}"))
+
+    def tracker(self, mock_node, pool: MockTxPool) -> PendingTracker:
+        plunger = self.plunger(mock_node, pool)
+        return PendingTracker(plunger.session, plunger.endpoint_uri, plunger.addresses, plunger.discover_pending_transactions)
+
+    def test_should_only_fetch_transactions_which_arrived_since_last_refresh(self, mock_node):
+        # given
+        pool = MockTxPool({self.our_account.lower(): 9})
+        pool.add(self.our_account, 9, "0x09")
+        pool.add(self.other_account, 1, "0x01")
+        tracker = self.tracker(mock_node, pool)
+        pool.new = []
+
+        # when
+        pool.add(self.our_account, 10, "0x0a")
+        pool.add(self.other_account, 2, "0x02")
+        added, mined, replaced = tracker.refresh({self.our_account: 8})
+
+        # then
+        assert added == [(self.our_account, Transaction("0x0a", 10))]
+        assert tracker.transactions() == {self.our_account: [Transaction("0x09", 9), Transaction("0x0a", 10)]}
+        assert mock_node.calls.count('parity_pendingTransactions') == 1
+        assert mock_node.calls.count('eth_getTransactionByHash') == 2
+
+    def test_should_tell_mined_transactions_from_replaced_ones(self, mock_node):
+        # given
+        pool = MockTxPool({self.our_account.lower(): 9})
+        pool.add(self.our_account, 9, "0x09")
+        pool.add(self.our_account, 10, "0x0a")
+        tracker = self.tracker(mock_node, pool)
+        pool.add(self.our_account, 9, "0x19")
+        tracker.refresh({self.our_account: 8})
+
+        # when
+        pool.mine("0x19")
+        added, mined, replaced = tracker.refresh({self.our_account: 9})
+
+        # then
+        assert mined == [(self.our_account, Transaction("0x19", 9))]
+        assert replaced == [(self.our_account, Transaction("0x09", 9))]
+        assert tracker.transactions() == {self.our_account: [Transaction("0x0a", 10)]}
+
+    def test_should_discover_again_if_filter_gets_dropped(self, mock_node):
+        # given
+        pool = MockTxPool({self.our_account.lower(): 9})
+        tracker = self.tracker(mock_node, pool)
+        pool.add(self.our_account, 9, "0x09")
+        pool.filter_dropped = True
+
+        # when
+        tracker.refresh({self.our_account: 8})
+
+        # then
+        assert tracker.transactions() == {self.our_account: [Transaction("0x09", 9)]}
+        assert mock_node.calls.count('parity_pendingTransactions') == 2
+        assert mock_node.calls.count('eth_newPendingTransactionFilter') == 2
+
+    def test_should_be_used_by_daemon(self, mock_node):
+        # given
+        pool = MockTxPool({self.our_account.lower(): 9})
+        pool.add(self.our_account, 9, "0x09")
+        daemon = Daemon(self.plunger(mock_node, pool), stuck_blocks=1000, stuck_seconds=1000)
+
+        # when
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            pool.mine("0x09")
+            daemon.check(now=1)
+
+        # then
+        assert out.getvalue() == f"Transaction 0x09 with nonce=9 from {self.our_account} has been mined\n"
+        assert daemon.status()['mined'] == [{'address': self.our_account, 'hash': "0x09", 'nonce': 9}]
+        assert mock_node.calls.count('parity_pendingTransactions') == 1
+
+    def test_should_replace_each_nonce_once_even_if_it_has_many_transactions(self, mock_node):
+        # given
+        pool = MockTxPool({self.our_account.lower(): 9})
+        pool.add(self.our_account, 9, "0x09")
+        pool.add(self.our_account, 9, "0x19")
+        pool.add(self.our_account, 10, "0x0a")
+        sent = MockPool()
+        plunger = self.plunger(mock_node, pool)
+        mock_node.results.update({'eth_gasPrice': hex(5000000000),
+                                  'eth_estimateGas': hex(21000),
+                                  'eth_getBlockByNumber': {'number': hex(100), 'gasLimit': hex(10000000)},
+                                  'eth_sendTransaction': sent.send_transaction})
+        daemon = Daemon(plunger, stuck_blocks=1, stuck_seconds=1000)
+
+        # when
+        with captured_output() as (out, err):
+            daemon.check(now=0)
+            pool.block_number += 1
+            daemon.check(now=1)
+            pool.block_number += 1
+            daemon.check(now=2)
+
+        # then
+        assert [tx['nonce'] for tx in sent.sent] == [9, 10]
+        assert daemon.status()['replacements_sent'] == 2